@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('Oi360 Logo_4.png', '.')],
-    hiddenimports=['PyQt5', 'pandas', 'openpyxl', 'xlrd', 'xlsxwriter'],
+    hiddenimports=['PyQt5', 'pandas', 'openpyxl', 'xlrd', 'xlsxwriter', 'python_calamine', 'pyarrow'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,18 +1,50 @@
 import sys
 import os
+import argparse
+import multiprocessing
+import logging
 import warnings
+import numpy as np
 import pandas as pd
 import datetime
 
+# --- Add app folder to Python path so reco_utils imports from any directory ---
+_app_dir = os.path.dirname(os.path.abspath(__file__))
+if _app_dir not in sys.path:
+    sys.path.insert(0, _app_dir)
+from reco_utils.normalize import DEFAULT_KEY_RULES, describe_match, key_columns
+from reco_utils.join import DUPLICATE_POLICIES, DEFAULT_DUPLICATE_POLICY
+from reco_utils.amounts import DEFAULT_AMOUNT_TOLERANCE
+from reco_utils.fuzzy import DEFAULT_FUZZY_MIN_SCORE
+from reco_utils.subset import DEFAULT_MAX_COMBINATION, SubsetMatcher
+from reco_utils.dates import DEFAULT_AGE_BUCKETS, parse_buckets
+from reco_utils.profiling import StageProfiler, profile_path, format_report
+from reco_utils.engine import RecoEngine
+from reco_utils.control import RunControl
+from reco_utils.export import MISMATCH_FORMAT, ResultWriter
+from reco_utils.loader import (
+    INPUT_FILE_FILTER, DEFAULT_CHUNK_ROWS, read_columns, count_rows, iter_chunks
+)
+from reco_utils.cache import FrameCache
+from reco_utils.prefetch import Prefetcher
+from reco_utils.memory import memory_report, format_memory_report
+from reco_utils.runstate import RunStateStore, soa_identity
+from reco_utils.resultsdb import ResultsStore
+from reco_utils.resultfilters import ResultFilters
+from reco_utils.applog import configure_logging, get_logger
+
 # Suppress openpyxl print area warnings
 warnings.filterwarnings('ignore', message='Print area cannot be set', category=UserWarning)
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog,
     QMessageBox, QListWidget, QListWidgetItem, QComboBox, QDialog, QHBoxLayout,
-    QTextEdit, QProgressBar, QGraphicsDropShadowEffect, QScrollArea, QFrame
+    QTextEdit, QProgressBar, QGraphicsDropShadowEffect, QScrollArea, QFrame, QDoubleSpinBox, QCheckBox,
+    QSpinBox, QLineEdit, QDateEdit, QTableView, QHeaderView
 )
 from PyQt5.QtGui import QFont, QPixmap, QColor, QLinearGradient, QPalette
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve
+from PyQt5.QtCore import (
+    Qt, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve, QDate, QAbstractTableModel, QModelIndex
+)
 
 # --- Resource Path Helper for PyInstaller ---
 def resource_path(relative_path):
@@ -26,6 +58,7 @@ def resource_path(relative_path):
 # --- Constants for UI appearance and file paths ---
 LOGO_PATH = "Oi360 Logo_4.png"  # Logo image file for branding
 SEPARATOR_WIDTH = 2             # Separator width for UI layout
+NO_GROUP_COLUMN = "(none)"      # Split/combined group column choice meaning "group by key prefix"
 
 # --- Modern 2026 Theme System ---
 class ThemeManager:
@@ -270,19 +303,24 @@ class ThemeManager:
 # Global theme state
 current_theme = ThemeManager.DARK_THEME
 
-# --- Utility function for logging debug messages to a file ---
-def log_debug(message):
+# --- Utility functions for logging debug messages to a file ---
+def log_debug(message, level=logging.INFO):
     """
-    Appends debug messages with timestamps to a log file.
+    Queues a timestamped message for the debug log; a background thread writes it.
     Used for error tracking and debugging.
     """
-    with open("debug_log.txt", "a") as f:
-        f.write(f"[{datetime.datetime.now()}] {message}\n")
+    get_logger().log(level, message)
+
+def log_detail(message):
+    """
+    Logs engine diagnostics, which only reach the file when the log level is DEBUG.
+    """
+    log_debug(message, logging.DEBUG)
 
 # --- Dialog for selecting columns from a DataFrame ---
 class ColumnSelector(QDialog):
     """
-    UI dialog for users to select the match column and return columns
+    UI dialog for users to select the match column(s) and return columns
     from a loaded Excel file. Used for both SOA and Reference files.
     """
     def __init__(self, headers, confirm_callback, is_soa=False):
@@ -299,6 +337,16 @@ class ColumnSelector(QDialog):
         self.match_dropdown.addItems(headers)
         layout.addWidget(self.match_dropdown)
 
+        # Further columns matched together with the first one, in this order (e.g. invoice + vendor code)
+        self.extra_match_dropdowns = []
+        for position in ("Second", "Third"):
+            layout.addWidget(QLabel(f"{position} Match Column (optional, for a combined key):"))
+            dropdown = QComboBox()
+            dropdown.addItem("None")
+            dropdown.addItems(headers)
+            layout.addWidget(dropdown)
+            self.extra_match_dropdowns.append(dropdown)
+
         self.is_soa = is_soa
         if is_soa:
             layout.addWidget(QLabel("Select Date Column for Age Bucket:"))
@@ -313,6 +361,14 @@ class ColumnSelector(QDialog):
             self.amount_dropdown.addItems(headers)
             layout.addWidget(self.amount_dropdown)
 
+            layout.addWidget(QLabel("Amount Tolerance (differences up to this are a match):"))
+            self.tolerance_spin = QDoubleSpinBox()
+            self.tolerance_spin.setDecimals(2)
+            self.tolerance_spin.setRange(0.0, 1000000.0)
+            self.tolerance_spin.setSingleStep(0.01)
+            self.tolerance_spin.setValue(DEFAULT_AMOUNT_TOLERANCE)
+            layout.addWidget(self.tolerance_spin)
+
         self.return_label = QLabel("Select Return Columns:")
         layout.addWidget(self.return_label)
 
@@ -324,9 +380,17 @@ class ColumnSelector(QDialog):
         layout.addWidget(self.return_list)
 
         if is_soa:
-            # For SOA, only match column, date column, and amount column are needed
-            self.return_label.hide()
-            self.return_list.hide()
+            # For SOA, the list picks which columns are loaded and kept in the output (all by default)
+            self.return_label.setText("Select SOA Columns to Keep in Output:")
+            self.return_list.selectAll()
+        else:
+            # How repeated invoice numbers in this reference are collapsed before matching
+            layout.addWidget(QLabel("If a Match Value Repeats:"))
+            self.policy_dropdown = QComboBox()
+            for policy, label in DUPLICATE_POLICIES.items():
+                self.policy_dropdown.addItem(label, policy)
+            self.policy_dropdown.setCurrentIndex(list(DUPLICATE_POLICIES).index(DEFAULT_DUPLICATE_POLICY))
+            layout.addWidget(self.policy_dropdown)
 
         confirm_btn = QPushButton("Confirm")
         confirm_btn.clicked.connect(self.on_confirm)
@@ -339,252 +403,265 @@ class ColumnSelector(QDialog):
         """
         Handles confirmation and passes selected columns to callback.
         """
-        match = self.match_dropdown.currentText()
+        match = [self.match_dropdown.currentText()]
+        for dropdown in self.extra_match_dropdowns:
+            if dropdown.currentIndex() > 0 and dropdown.currentText() not in match:
+                match.append(dropdown.currentText())
+        match = match[0] if len(match) == 1 else match  # A plain column name unless the key is combined
         selected_returns = [i.text() for i in self.return_list.selectedItems()]
         if self.is_soa:
             # Get amount column, None if "None - No Amount Comparison" selected
             amount_col = self.amount_dropdown.currentText()
             if amount_col == "None - No Amount Comparison":
                 amount_col = None
-            self.confirm_callback(match, self.date_dropdown.currentText(), amount_col)
+            self.confirm_callback(match, self.date_dropdown.currentText(), amount_col, self.tolerance_spin.value(),
+                                  selected_returns)
         else:
-            self.confirm_callback(match, selected_returns)
+            self.confirm_callback(match, selected_returns, self.policy_dropdown.currentData())
         self.accept()  # Close the dialog
 
 
+# --- Result grid: a table model over the result frame and the window showing it ---
+class ResultTableModel(QAbstractTableModel):
+    """
+    Read-only model over the result frame. Qt only asks for the cells on screen,
+    and a filter just swaps the array of frame row positions being shown, so
+    neither the frame nor its rows are ever copied into widgets.
+    """
+    MISMATCH_COLOR = QColor(MISMATCH_FORMAT['bg_color'])
+
+    def __init__(self, df, mismatch=None, parent=None):
+        super().__init__(parent)
+        self._columns = [str(col) for col in df.columns]
+        self._arrays = [df.iloc[:, i].array for i in range(df.shape[1])]  # Views, not copies
+        self._mismatch = mismatch
+        self._amount_cols = {i for i, col in enumerate(self._columns) if col == "Amount Difference"}
+        self._rows = np.arange(len(df))
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            value = self._arrays[index.column()][row]
+            return "" if value is None or value is pd.NA or (isinstance(value, float) and value != value) else str(value)
+        if role == Qt.BackgroundRole and self._mismatch is not None and index.column() in self._amount_cols:
+            return self.MISMATCH_COLOR if self._mismatch[row] else None
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section]
+        return str(self._rows[section] + 1)  # Row number in the exported file
+
+
+class ResultView(QDialog):
+    """
+    Window with the last run's result rows and its one-click filters
+    (row kind and age bucket, combined).
+    """
+    def __init__(self, filters, title, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(1100, 650)
+        self.filters = filters
+        counts = filters.counts()
+        layout = QVBoxLayout(self)
+        filter_row = QHBoxLayout()
+        self.kind_dropdown = QComboBox()
+        for label, _ in filters.kinds:
+            self.kind_dropdown.addItem(f"{label} ({counts[label]:,})", label)
+        self.bucket_dropdown = QComboBox()
+        for label, _ in filters.buckets:
+            self.bucket_dropdown.addItem(f"{label} ({counts[label]:,})", label)
+        self.count_label = QLabel()
+        filter_row.addWidget(QLabel("Show:"))
+        filter_row.addWidget(self.kind_dropdown)
+        filter_row.addWidget(QLabel("Age:"))
+        filter_row.addWidget(self.bucket_dropdown)
+        filter_row.addStretch()
+        filter_row.addWidget(self.count_label)
+        layout.addLayout(filter_row)
+
+        self.model = ResultTableModel(filters.df, filters.mismatch, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setWordWrap(False)
+        self.table.setAlternatingRowColors(True)
+        # Fixed row heights: Qt never measures rows it is not drawing
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.table.fontMetrics().height() + 8)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setDefaultSectionSize(140)
+        layout.addWidget(self.table)
+        self.kind_dropdown.currentIndexChanged.connect(self.apply_filter)
+        self.bucket_dropdown.currentIndexChanged.connect(self.apply_filter)
+        self.apply_filter()
+
+    def apply_filter(self):
+        rows = self.filters.rows(self.kind_dropdown.currentData(), self.bucket_dropdown.currentData())
+        self.model.set_rows(rows)
+        self.count_label.setText(f"Showing {len(rows):,} of {len(self.filters.df):,} rows")
+
+
 # --- Background worker thread for reconciliation ---
 class RecoWorker(QThread):
     """
     Background thread to perform reconciliation between SOA and Reference files.
     Emits signals to update UI status and progress.
+    cancel()/pause()/resume() take effect at the engine's next checkpoint;
+    a cancelled run still writes the rows it had finished.
     """
     update_status = pyqtSignal(str)
     update_progress = pyqtSignal(int)
-    reco_complete = pyqtSignal(pd.DataFrame)
+    reco_complete = pyqtSignal(pd.DataFrame, str, bool)  # result frame, saved path ("" if not saved), cancelled
+    profile_ready = pyqtSignal(dict)  # per-stage wall time and peak memory of the run
+    results_ready = pyqtSignal(object)  # ResultFilters over the result rows, for the result view
 
-    def __init__(self, soa_df, soa_match, soa_date_col, soa_amount_col, ref_configs):
+    def __init__(self, soa_df, soa_match, soa_date_col, soa_amount_col, ref_configs, key_rules=None,
+                 amount_tolerance=DEFAULT_AMOUNT_TOLERANCE, output_path=None, soa_path=None, soa_columns=None,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, fuzzy_min_score=None, subset_matcher=None, age_buckets=None,
+                 as_of_date=None, load_timings=None, run_state=None, results_store=None):
         super().__init__()
         self.soa_df = soa_df
         self.soa_match = soa_match
         self.ref_configs = ref_configs
         self.soa_date_col = soa_date_col
         self.soa_amount_col = soa_amount_col  # User-selected amount column for comparison
+        self.key_rules = key_rules if key_rules is not None else DEFAULT_KEY_RULES  # Match key normalization rules
+        self.amount_tolerance = amount_tolerance  # Largest amount difference still treated as a match
+        self.output_path = output_path  # Workbook chosen by the user before the run; None skips the export
+        # Streaming mode: soa_df is None and the SOA is read from soa_path in chunk_rows blocks
+        self.soa_path = soa_path
+        self.soa_columns = soa_columns
+        self.chunk_rows = chunk_rows
+        self.fuzzy_min_score = fuzzy_min_score  # None keeps matching exact-only
+        self.subset_matcher = subset_matcher  # None skips split/combined payment matching
+        self.age_buckets = age_buckets  # Upper bounds in days; None uses the default buckets
+        self.as_of_date = as_of_date  # Date ages are counted to; None means today
+        self.load_timings = load_timings or []  # (seconds, peak bytes) of files loaded before the run
+        self.run_state = run_state  # RunStateStore for incremental re-runs; None always runs in full
+        self.results_store = results_store  # ResultsStore the rows are recorded in; None skips it
+        self.control = RunControl()
 
-    def run(self):
-        df_result = self.soa_df.copy()
-        
-        # Store original date column values before conversion for age calculation
-        original_date_col_values = None
-        if self.soa_date_col and self.soa_date_col in df_result.columns:
-            original_date_col_values = df_result[self.soa_date_col].copy()
-            try:
-                today = pd.to_datetime(datetime.datetime.today())
-                # Convert to datetime for age calculation
-                temp_dates = pd.to_datetime(
-                    df_result[self.soa_date_col], errors='coerce', format='mixed', dayfirst=True
-                )
-                df_result['Age (Days)'] = (today - temp_dates).dt.days
-
-                def bucket(days):
-                    if pd.isna(days): return "Unknown"
-                    elif days <= 15: return "0-15"
-                    elif days <= 30: return "16-30"
-                    elif days <= 60: return "31-60"
-                    elif days <= 90: return "61-90"
-                    elif days <= 120: return "91-120"
-                    else: return "121+"
-
-                df_result['Age Bucket'] = df_result['Age (Days)'].apply(bucket)
-                df_result.insert(0, 'Age Bucket', df_result.pop('Age Bucket'))
-                # Restore original date format to preserve user's date formatting
-                df_result[self.soa_date_col] = original_date_col_values
-            except Exception as e:
-                self.update_status.emit(f"[WARNING] Age Bucket Error: {str(e)}")
-                log_debug(f"Age Bucket Error: {str(e)}")
-                # Restore original date values if error occurred
-                if original_date_col_values is not None:
-                    df_result[self.soa_date_col] = original_date_col_values
-                return  # Stop here if error occurred
-
-        # Helper function to clean invoice/match values for proper matching
-        def clean_match_value(val):
-            s = str(val).strip()
-            # Remove leading apostrophe (Excel text marker) if present
-            if s.startswith("'"):
-                s = s[1:]
-            # Strip leading zeros from numeric strings to normalize matching
-            # e.g., '0308607218' should match '308607218'
-            if s.isdigit() or (s and s.lstrip('0').isdigit()):
-                s = s.lstrip('0') or '0'  # Keep at least '0' if all zeros
-            return s
-        
-        # Create match dictionary with cleaned values
-        match_sources_dict = {clean_match_value(val): [] for val in df_result[self.soa_match].astype(str).values}
-        self.update_status.emit("Starting reconciliation...")
+    def cancel(self):
+        self.control.cancel()
 
-        total_steps = len(self.ref_configs) * df_result.shape[0] if df_result.shape[0] > 0 else 1
-        current_step = 0
+    def pause(self):
+        self.control.pause()
 
-        for idx, config in enumerate(self.ref_configs):
-            if config is None:
-                continue
-            ref_df, match_col, return_cols, _ = config
-            try:
-                self.update_status.emit(f"Matching Ref{idx+1} | Match = {match_col} | Returns = {', '.join(return_cols)}")
-                soa_col = self.soa_match
-                
-                # Clean match column values: strip apostrophes and whitespace
-                ref_df[match_col] = ref_df[match_col].astype(str).apply(clean_match_value)
-                df_result[soa_col] = df_result[soa_col].astype(str).apply(clean_match_value)
-                
-                ref_extract = ref_df[[match_col] + return_cols].copy()
-                ref_extract.columns = [match_col] + [f"Ref{idx+1}_{col}" for col in return_cols]
-                
-                df_result = pd.merge(df_result, ref_extract, left_on=soa_col, right_on=match_col, how='left')
-                match_mask = df_result[f"Ref{idx+1}_{return_cols[0]}"].notna()
-                for i, matched in enumerate(match_mask):
-                    if matched:
-                        key = clean_match_value(df_result.iloc[i][soa_col])
-                        if key in match_sources_dict:
-                            match_sources_dict[key].append(f"Ref{idx+1}")
-                    current_step += 1
-                    percent = int((current_step / total_steps) * 100)
-                    self.update_progress.emit(percent)
-                if idx > 0:
-                    df_result.insert(df_result.shape[1], f"Separator{idx+1}", "")
-            except Exception as e:
-                log_debug(f"Match Error Ref{idx+1}: {str(e)}")
-                self.update_status.emit(f"Error matching Ref{idx+1}: {str(e)}")
-        df_result["Match Source"] = [
-            ", ".join(match_sources_dict.get(clean_match_value(val), [])) if match_sources_dict.get(clean_match_value(val), []) else ""
-            for val in df_result[self.soa_match].astype(str).values
-        ]
-        self.update_status.emit("Reconciliation Complete")
-        self.update_progress.emit(100)
-        if "Separator1" in df_result.columns:
-            df_result = df_result.drop(columns=["Separator1"])
-        
-        # Clean up date columns - remove time portion (00:00:00) from date strings
-        date_keywords = ['date', 'dt', 'dated']
-        for col in df_result.columns:
-            if any(kw in col.lower() for kw in date_keywords):
+    def resume(self):
+        self.control.resume()
+
+    def run(self):
+        profiler = StageProfiler()
+        for seconds, peak_bytes in self.load_timings:
+            profiler.add("load", seconds, peak_bytes)
+        engine = RecoEngine(
+            self.soa_match, self.soa_date_col, self.soa_amount_col, self.ref_configs,
+            key_rules=self.key_rules, amount_tolerance=self.amount_tolerance,
+            status=self.update_status.emit, progress=self.update_progress.emit, debug=log_detail,
+            fuzzy_min_score=self.fuzzy_min_score, subset_matcher=self.subset_matcher,
+            age_buckets=self.age_buckets, as_of_date=self.as_of_date, profiler=profiler,
+            control=self.control
+        )
+        # Streaming runs read the SOA file in fixed-size chunks instead of holding it in memory
+        streaming = self.soa_df is None
+        if streaming:
+            soa_chunks = iter_chunks(self.soa_path, self.soa_columns, self.chunk_rows)
+            total_rows = count_rows(self.soa_path)
+            self.update_status.emit(f"Streaming SOA in chunks of {self.chunk_rows} rows")
+        elif self.subset_matcher is not None:
+            soa_chunks = [self.soa_df]  # Split/combined payments can span any rows of the statement
+            total_rows = len(self.soa_df)
+        else:
+            # Matched in chunk_rows slices so a cancel keeps every finished slice
+            total_rows = len(self.soa_df)
+            soa_chunks = (self.soa_df.iloc[start:start + self.chunk_rows]
+                          for start in range(0, total_rows, self.chunk_rows))
+
+        df_result = pd.DataFrame()
+        saved_path = ""
+        writer = None
+        recorder = None
+        try:
+            if self.output_path:
+                # Result rows are written to the chosen file as each chunk finishes (single write)
+                writer = ResultWriter(self.output_path, self.soa_amount_col, self.amount_tolerance)
+            if self.results_store is not None:
                 try:
-                    # Remove time portion like " 00:00:00" from date strings
-                    df_result[col] = df_result[col].astype(str).str.replace(r'\s+00:00:00$', '', regex=True)
-                    df_result[col] = df_result[col].replace('nan', '')
-                    df_result[col] = df_result[col].replace('NaT', '')
+                    recorder = self.results_store.start_run(self.soa_path, self.soa_match, self.output_path,
+                                                            engine.as_of_date.date(), engine.key_rules)
                 except Exception as e:
-                    log_debug(f"Date cleanup error for column {col}: {str(e)}")
-        
-        filename = f"soa_reco_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        try:
-            # Save result to Excel with formatted header
-            with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
-                df_result.to_excel(writer, index=False, sheet_name='Sheet1')
-                workbook  = writer.book
-                worksheet = writer.sheets['Sheet1']
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#404040',
-                    'font_color': '#FFFFFF',
-                    'border': 1
-                })
-                for col_num, value in enumerate(df_result.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                
-                # --- Amount Mismatch Highlighting ---
-                # Use user-selected amount column instead of keyword detection
-                all_cols = list(df_result.columns)
-                
-                soa_amt_col = self.soa_amount_col  # User-selected SOA amount column
-                
-                # Find Ref amount columns (columns starting with Ref and containing amount keywords)
-                amount_keywords = ['amount', 'amt', 'value', 'total', 'sum', 'price', 'cost']
-                ref_amount_cols = [c for c in all_cols 
-                                   if any(kw in c.lower() for kw in amount_keywords) 
-                                   and c.startswith('Ref')]
-                
-                if soa_amt_col and soa_amt_col in all_cols and ref_amount_cols:
-                    mismatch_format = workbook.add_format({
-                        'bg_color': '#FFC7CE',  # Light red
-                        'font_color': '#9C0006'  # Dark red text
-                    })
-                    
-                    soa_col_idx = all_cols.index(soa_amt_col)
-                    log_debug(f"Amount Highlighting: SOA column = {soa_amt_col}, Ref columns = {ref_amount_cols}")
-                    mismatch_count = 0
-                    
-                    # Build Amount Difference column data
-                    amount_diff_data = []
-                    
-                    for row_idx in range(len(df_result)):
-                        try:
-                            soa_val = df_result.iloc[row_idx][soa_amt_col]
-                            # Convert to float for comparison, handle various formats
-                            if pd.notna(soa_val):
-                                try:
-                                    soa_num = float(str(soa_val).replace(',', '').replace('$', '').strip())
-                                except (ValueError, TypeError):
-                                    soa_num = None
-                            else:
-                                soa_num = None
-                            
-                            row_diffs = []
-                            for ref_col in ref_amount_cols:
-                                ref_val = df_result.iloc[row_idx][ref_col]
-                                if pd.notna(ref_val) and soa_num is not None:
-                                    try:
-                                        ref_num = float(str(ref_val).replace(',', '').replace('$', '').strip())
-                                        diff = soa_num - ref_num
-                                        # Extract ref number from column name (e.g., "Ref1_AMOUNT" -> "Ref1")
-                                        ref_name = ref_col.split('_')[0]
-                                        
-                                        # Format difference with sign
-                                        if abs(diff) > 0.01:
-                                            if diff > 0:
-                                                row_diffs.append(f"{ref_name}: +{diff:.2f}")
-                                            else:
-                                                row_diffs.append(f"{ref_name}: {diff:.2f}")
-                                            
-                                            ref_col_idx = all_cols.index(ref_col)
-                                            # Highlight SOA amount cell
-                                            worksheet.write(row_idx + 1, soa_col_idx, soa_val, mismatch_format)
-                                            # Highlight Ref amount cell
-                                            worksheet.write(row_idx + 1, ref_col_idx, ref_val, mismatch_format)
-                                            mismatch_count += 1
-                                        else:
-                                            row_diffs.append(f"{ref_name}: 0.00")
-                                    except (ValueError, TypeError):
-                                        pass  # Skip if value can't be converted to number
-                        except Exception as e:
-                            log_debug(f"Amount highlighting error at row {row_idx}: {str(e)}")
-                            row_diffs = []
-                        
-                        amount_diff_data.append(", ".join(row_diffs) if row_diffs else "")
-                    
-                    # Add Amount Difference column to dataframe
-                    df_result['Amount Difference'] = amount_diff_data
-                    
-                    # Write Amount Difference column to Excel
-                    diff_col_idx = len(all_cols)  # New column at the end
-                    worksheet.write(0, diff_col_idx, 'Amount Difference', header_format)
-                    for row_idx, diff_val in enumerate(amount_diff_data):
-                        worksheet.write(row_idx + 1, diff_col_idx, diff_val)
-                    
-                    self.update_status.emit(f"Amount comparison: {len(ref_amount_cols)} ref column(s) checked, {mismatch_count} mismatches highlighted")
-                elif soa_amt_col:
-                    log_debug(f"Amount Highlighting: No matching Ref amount columns found. SOA col = {soa_amt_col}")
-                    self.update_status.emit(f"Amount comparison: No Ref amount columns detected for comparison with '{soa_amt_col}'")
+                    log_debug(f"Results database error: {str(e)}")
+                    self.update_status.emit(f"[WARNING] Results are not recorded: {str(e)}")
+            if self.run_state is not None and not streaming and self.soa_path:
+                # Re-runs of the same statement only reconcile what changed since the last run
+                identity = soa_identity(self.soa_path, self.soa_match)
+                result, _ = engine.run_incremental(self.soa_df, self.run_state, identity, writer, recorder,
+                                                   self.chunk_rows)
+            else:
+                result = engine.run(soa_chunks, writer, total_rows, keep_result=not streaming, recorder=recorder)
+            if recorder is not None:
+                with profiler.stage("results db"):
+                    recorder.close("cancelled" if engine.cancelled else "complete")
+                self.update_status.emit(f"Recorded {recorder.rows} row(s) as run {recorder.run_id} in the results database")
+                recorder = None
+            if result is not None:
+                df_result = result
+            if writer is not None:
+                if engine.cancelled and writer.columns is None:
+                    # Stopped before any row was finished: leave the chosen file as it was
+                    writer.discard()
                 else:
-                    log_debug(f"Amount Highlighting SKIPPED: No SOA amount column selected")
-                    self.update_status.emit(f"Amount comparison: No amount column selected for comparison")
+                    with profiler.stage("export"):
+                        writer.close()
+                    saved_path = self.output_path
+                writer = None
         except Exception as e:
-            log_debug(f"Excel Write Error: {str(e)}")
-            self.update_status.emit(f"Error saving Excel: {str(e)}")
-            
-        self.reco_complete.emit(df_result)
+            log_debug(f"Reconciliation/Write Error: {str(e)}")
+            self.update_status.emit(f"Error during reconciliation or saving: {str(e)}")
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception as e:
+                    log_debug(f"Writer close error: {str(e)}")
+            if recorder is not None:
+                try:
+                    recorder.close("failed")
+                except Exception as e:
+                    log_debug(f"Results database close error: {str(e)}")
+
+        if len(df_result):
+            try:
+                with profiler.stage("result view"):
+                    filters = ResultFilters(df_result, engine.soa_amount_col, engine.amount_tolerance)
+                self.results_ready.emit(filters)
+            except Exception as e:
+                log_debug(f"Result view error: {str(e)}")
+
+        report = profiler.report()
+        if saved_path:
+            try:
+                report = profiler.save(profile_path(saved_path))
+            except Exception as e:
+                log_debug(f"Profile save error: {str(e)}")
+        self.profile_ready.emit(report)
+        self.reco_complete.emit(df_result, saved_path, engine.cancelled)
 
 # --- Main application window and logic ---
 class Oi360App(QWidget):
@@ -592,6 +669,9 @@ class Oi360App(QWidget):
     Main PyQt5 application window for the Oi360 SOA Reconciliation Tool.
     Handles UI setup, file selection, status updates, and triggers reconciliation.
     """
+    header_ready = pyqtSignal(object)  # PrefetchJob whose header has been read
+    frame_ready = pyqtSignal(object)  # PrefetchJob whose selected columns have been loaded
+
     def __init__(self):
         super().__init__()
         global current_theme
@@ -661,8 +741,8 @@ class Oi360App(QWidget):
         # --- Instructions card (no emoji) ---
         self.instructions = QLabel("""STEP-BY-STEP GUIDE:
         [1]  Select SOA file
-        [2]  Select Reference files one by one (only once per session)
-        [3]  Click 'Run Reconciliation'""")
+        [2]  Select Reference files one by one (Add Another Reference for more than four)
+        [3]  Click 'Run Reconciliation' and choose where to save the result""")
         self.instructions.setFont(QFont("Segoe UI", 11))
         self.layout.addWidget(self.instructions)
 
@@ -681,6 +761,78 @@ class Oi360App(QWidget):
         self.status_box.setPlaceholderText("Status messages will appear here...")
         self.layout.addWidget(self.status_box)
         
+        # --- Streaming mode for SOA files too large to hold in memory ---
+        self.streaming_check = QCheckBox("Streaming mode (process large CSV/Parquet SOA files in chunks)")
+        self.streaming_check.setFont(QFont("Segoe UI", 11))
+        self.layout.addWidget(self.streaming_check)
+
+        # --- Incremental re-runs: reuse the stored result of this statement's last run ---
+        self.incremental_check = QCheckBox("Incremental re-run (only reconcile rows and references changed since the last run)")
+        self.incremental_check.setFont(QFont("Segoe UI", 11))
+        self.incremental_check.setChecked(True)
+        self.layout.addWidget(self.incremental_check)
+
+        # --- Results database: every run's rows kept for lookups across runs ---
+        self.record_check = QCheckBox("Record results for lookups across runs (python -m reco_utils.resultsdb)")
+        self.record_check.setFont(QFont("Segoe UI", 11))
+        self.record_check.setChecked(True)
+        self.layout.addWidget(self.record_check)
+
+        # --- Optional fuzzy pass for keys with no exact match (typos, OCR errors, extra prefixes) ---
+        fuzzy_row = QHBoxLayout()
+        self.fuzzy_check = QCheckBox("Fuzzy match keys with no exact match - minimum score:")
+        self.fuzzy_check.setFont(QFont("Segoe UI", 11))
+        self.fuzzy_score_spin = QSpinBox()
+        self.fuzzy_score_spin.setRange(50, 99)
+        self.fuzzy_score_spin.setValue(DEFAULT_FUZZY_MIN_SCORE)
+        fuzzy_row.addWidget(self.fuzzy_check)
+        fuzzy_row.addWidget(self.fuzzy_score_spin)
+        fuzzy_row.addStretch()
+        self.layout.addLayout(fuzzy_row)
+
+        # --- Optional split/combined payment matching by amount (needs an SOA amount column) ---
+        subset_row = QHBoxLayout()
+        self.subset_check = QCheckBox("Match split/combined payments by amount - up to")
+        self.subset_check.setFont(QFont("Segoe UI", 11))
+        self.subset_size_spin = QSpinBox()
+        self.subset_size_spin.setRange(2, 6)
+        self.subset_size_spin.setValue(DEFAULT_MAX_COMBINATION)
+        self.subset_prefix_spin = QSpinBox()
+        self.subset_prefix_spin.setRange(0, 20)
+        self.subset_prefix_spin.setSpecialValueText("whole file")
+        subset_row.addWidget(self.subset_check)
+        subset_row.addWidget(self.subset_size_spin)
+        subset_row.addWidget(QLabel("rows, grouped by key prefix length:"))
+        subset_row.addWidget(self.subset_prefix_spin)
+        # Grouping by a customer column keeps each search small; it overrides the key prefix
+        self.subset_soa_group_combo = QComboBox()
+        self.subset_ref_group_combo = QComboBox()
+        for combo, tip in ((self.subset_soa_group_combo, "SOA column to group by (one of the kept SOA columns)"),
+                           (self.subset_ref_group_combo, "Reference column to group by (one of the return columns)")):
+            combo.addItem(NO_GROUP_COLUMN)
+            combo.setToolTip(tip)
+            combo.setMinimumWidth(140)
+        subset_row.addWidget(QLabel("or by column - SOA:"))
+        subset_row.addWidget(self.subset_soa_group_combo)
+        subset_row.addWidget(QLabel("Ref:"))
+        subset_row.addWidget(self.subset_ref_group_combo)
+        subset_row.addStretch()
+        self.layout.addLayout(subset_row)
+
+        # --- Age buckets (upper bounds in days) and the date ages are counted to ---
+        age_row = QHBoxLayout()
+        age_label = QLabel("Age buckets (days):")
+        age_label.setFont(QFont("Segoe UI", 11))
+        self.buckets_edit = QLineEdit(", ".join(str(b) for b in DEFAULT_AGE_BUCKETS))
+        self.as_of_edit = QDateEdit(QDate.currentDate())
+        self.as_of_edit.setCalendarPopup(True)
+        self.as_of_edit.setDisplayFormat("dd/MM/yyyy")
+        age_row.addWidget(age_label)
+        age_row.addWidget(self.buckets_edit)
+        age_row.addWidget(QLabel("as of"))
+        age_row.addWidget(self.as_of_edit)
+        self.layout.addLayout(age_row)
+
         # --- SOA file selection button (no emoji) ---
         self.soa_button = QPushButton("[+] Select SOA File")
         self.soa_button.setMinimumHeight(46)
@@ -690,15 +842,18 @@ class Oi360App(QWidget):
         self.layout.addWidget(self.soa_button)
 
         # --- Reference file selection buttons (no emoji) ---
+        # Four slots to start with; "Add Another Reference" appends as many more as needed
         self.ref_buttons = []
-        for i in range(4):
-            btn = QPushButton(f"[+] Select Ref{i+1} File")
-            btn.setMinimumHeight(46)
-            btn.setFont(QFont("Segoe UI", 12))
-            btn.setCursor(Qt.PointingHandCursor)
-            btn.clicked.connect(lambda _, x=i: self.load_ref(x))
-            self.layout.addWidget(btn)
-            self.ref_buttons.append(btn)
+        self.refs = []
+        self.ref_selected = []
+        self.add_ref_button = QPushButton("[+] Add Another Reference")
+        self.add_ref_button.setMinimumHeight(40)
+        self.add_ref_button.setFont(QFont("Segoe UI", 11))
+        self.add_ref_button.setCursor(Qt.PointingHandCursor)
+        self.add_ref_button.clicked.connect(self.add_ref_slot)
+        self.layout.addWidget(self.add_ref_button)
+        for _ in range(4):
+            self.add_ref_slot()
 
         # --- Run reconciliation button (no emoji) ---
         self.run_btn = QPushButton(">>> RUN RECONCILIATION <<<")
@@ -707,6 +862,29 @@ class Oi360App(QWidget):
         self.run_btn.setCursor(Qt.PointingHandCursor)
         self.run_btn.clicked.connect(self.run_reco)
         self.layout.addWidget(self.run_btn)
+
+        # --- Pause/cancel the running reconciliation ---
+        control_row = QHBoxLayout()
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setMinimumHeight(40)
+        self.pause_btn.setFont(QFont("Segoe UI", 11))
+        self.pause_btn.setCursor(Qt.PointingHandCursor)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn = QPushButton("Cancel Run")
+        self.cancel_btn.setMinimumHeight(40)
+        self.cancel_btn.setFont(QFont("Segoe UI", 11))
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.clicked.connect(self.cancel_reco)
+        self.view_btn = QPushButton("View Results")
+        self.view_btn.setMinimumHeight(40)
+        self.view_btn.setFont(QFont("Segoe UI", 11))
+        self.view_btn.setCursor(Qt.PointingHandCursor)
+        self.view_btn.clicked.connect(self.show_results)
+        self.view_btn.setEnabled(False)
+        control_row.addWidget(self.pause_btn)
+        control_row.addWidget(self.cancel_btn)
+        control_row.addWidget(self.view_btn)
+        self.layout.addLayout(control_row)
         
         # Add stretch at end for better spacing
         self.layout.addStretch()
@@ -720,14 +898,45 @@ class Oi360App(QWidget):
         self.soa_match = None
         self.soa_date_col = None
         self.soa_amount_col = None  # User-selected amount column for comparison
-        self.refs = [None] * 4
+        self.amount_tolerance = DEFAULT_AMOUNT_TOLERANCE
+        self.soa_keep_cols = []  # SOA columns loaded and kept in the output
+        self.soa_path = None
+        self.soa_columns = []
+        self.frame_cache = FrameCache()  # Parsed workbooks reused across runs
+        self.prefetcher = Prefetcher()  # Reads headers and loads the selected columns in the background
+        self.pending_loads = {}  # "SOA" / "Ref1".. -> PrefetchJob not applied yet
+        self.header_queue = []  # Jobs waiting for their column dialog
+        self.column_dialog_open = False
+        self.header_ready.connect(self.on_header_ready)
+        self.frame_ready.connect(self.on_frame_ready)
+        self.run_state = RunStateStore()  # Results of earlier runs, for incremental re-runs
+        self.results_store = ResultsStore()  # Result rows of every run, for lookups across runs
+        self.load_timings = {}  # "SOA" / "Ref1".. -> (seconds, peak bytes) of the last load
         self.soa_selected = False
-        self.ref_selected = [False] * 4
+        self.worker = None
+        self.stopping_workers = []  # Cancelled runs still winding down (kept alive until finished)
+        self.result_filters = None  # ResultFilters of the last run's rows
+        self.result_view = None
+        self.set_run_controls(False)
 
         # Apply initial theme
         self.apply_theme()
         self.init_logo()
     
+    def add_ref_slot(self):
+        """Adds one more "Select RefN File" button above the Add Another Reference button."""
+        i = len(self.ref_buttons)
+        btn = QPushButton(f"[+] Select Ref{i+1} File")
+        btn.setMinimumHeight(46)
+        btn.setFont(QFont("Segoe UI", 12))
+        btn.setCursor(Qt.PointingHandCursor)
+        btn.clicked.connect(lambda _, x=i: self.load_ref(x))
+        btn.setStyleSheet(ThemeManager.get_button_style(self.current_theme))
+        self.layout.insertWidget(self.layout.indexOf(self.add_ref_button), btn)
+        self.ref_buttons.append(btn)
+        self.refs.append(None)
+        self.ref_selected.append(False)
+
     def toggle_theme(self):
         """Toggles between dark and light themes."""
         global current_theme
@@ -833,6 +1042,10 @@ class Oi360App(QWidget):
                 btn.setStyleSheet(selected_style)
             else:
                 btn.setStyleSheet(button_style)
+        self.add_ref_button.setStyleSheet(button_style)
+        self.pause_btn.setStyleSheet(button_style)
+        self.cancel_btn.setStyleSheet(button_style)
+        self.view_btn.setStyleSheet(button_style)
         
         # Run button with special style
         self.run_btn.setStyleSheet(ThemeManager.get_run_button_style(theme))
@@ -851,58 +1064,228 @@ class Oi360App(QWidget):
 
     def load_soa(self):
         """
-        Loads the SOA Excel file and prompts user to select the match column.
+        Starts reading the chosen SOA file in the background; the column dialog opens once its header is read.
+        """
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select SOA File", "", INPUT_FILE_FILTER)
+        if file_path:
+            # Streamed statements are read during the run, so only the header is needed now
+            self.start_load("SOA", file_path, parse=not self.streaming_check.isChecked())
+
+    def start_load(self, slot, file_path, parse=True):
+        """
+        Hands file_path to the prefetch pools for slot ("SOA", "Ref1", ...), replacing
+        a load of the same slot that has not finished yet.
+        """
+        previous = self.pending_loads.pop(slot, None)
+        if previous is not None:
+            previous.cancel()
+        # The file is hashed for the cache meanwhile, so the cache check after the dialog is instant
+        job = self.prefetcher.submit(slot, file_path, parse, self.frame_cache.content_hash)
+        self.pending_loads[slot] = job
+        self.log_status(f"[LOAD] {slot}: reading the columns of {os.path.basename(file_path)} in the background")
+        # Done callbacks run on pool threads; the signals hand the job back to the GUI thread
+        job.header.add_done_callback(lambda _: self.header_ready.emit(job))
+
+    def on_header_ready(self, job):
+        """
+        Queues the column dialog of a file whose header has been read.
+        """
+        if self.pending_loads.get(job.slot) is job and job not in self.header_queue:
+            self.header_queue.append(job)
+        if self.column_dialog_open:
+            return  # Shown when the open dialog closes
+        self.column_dialog_open = True
+        try:
+            while self.header_queue:
+                job = self.header_queue.pop(0)
+                if self.pending_loads.get(job.slot) is job:
+                    self.select_columns(job)
+        finally:
+            self.column_dialog_open = False
+
+    def select_columns(self, job):
+        """
+        Asks for the columns of a file; only the selected ones are then loaded (or taken from
+        the cache) in the background.
         """
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select SOA File", "", "Excel Files (*.xlsx)")
-        if not file_path:
+        try:
+            headers = job.header.result()
+        except Exception as e:
+            self.pending_loads.pop(job.slot, None)
+            job.cancel()
+            log_debug(str(e))
+            QMessageBox.critical(self, "Error", str(e))
             return
+        selection = []
+        if job.slot == "SOA":
+            selector = ColumnSelector(headers, lambda *args: selection.append(args), is_soa=True)
+        else:
+            selector = ColumnSelector(headers, lambda m, r, p: selection.append((m, r, p)))
+        selector.exec_()
+        if self.pending_loads.get(job.slot) is not job:
+            return  # Another file was chosen for this slot meanwhile
+        if not selection:
+            # Dialog closed without confirming
+            self.pending_loads.pop(job.slot, None)
+            job.cancel()
+            self.log_status(f"[LOAD] {job.slot}: no columns selected, {os.path.basename(job.file_path)} dropped")
+            return
+        job.selection = selection[0]
+        columns = self.selected_columns(job)
+        if not job.parse:
+            self.finish_load(job)
+            return
+        self.prefetcher.load(job, columns, self.frame_cache)
+        job.frame.add_done_callback(lambda _: self.frame_ready.emit(job))
+        self.log_status(f"[LOAD] {job.slot}: loading {len(columns)} column(s) of {os.path.basename(job.file_path)} in the background")
+
+    def on_frame_ready(self, job):
+        """
+        Reports the selected columns of a file loaded in the background and applies the selection.
+        """
+        if self.pending_loads.get(job.slot) is not job or job.frame.cancelled():
+            return
+        name = os.path.basename(job.file_path)
+        error = job.frame.exception()
+        if error is None:
+            df, seconds, _, cached = job.frame.result()
+            if cached:
+                self.log_status(f"[CACHE] Reused parsed copy of {name}")
+            else:
+                self.log_status(f"[LOAD] {job.slot}: {name} loaded in {seconds:.1f} s ({len(df)} rows)")
+        else:
+            log_debug(f"Background load error: {str(error)}")
+            self.log_status(f"[LOAD] {job.slot}: background load of {name} failed, it is read again now")
+        self.finish_load(job)
+
+    def selected_columns(self, job):
+        """Returns the columns of job.file_path its selection needs, in selection order."""
+        if job.slot == "SOA":
+            match, date_col, amount_col, _, keep_cols = job.selection
+            return list(dict.fromkeys(c for c in key_columns(match) + [date_col, amount_col] + keep_cols if c))
+        match, returns, _ = job.selection
+        return list(dict.fromkeys(key_columns(match) + returns))
+
+    def finish_load(self, job):
+        """
+        Applies a confirmed column selection, taking the columns from the background load.
+        """
+        self.pending_loads.pop(job.slot, None)
         try:
-            df = pd.read_excel(file_path, dtype=str)
-            self.soa_df = df
-            selector = ColumnSelector(df.columns.tolist(), self.save_soa_config, is_soa=True)
-            selector.exec_()
-            self.log_status(f"[OK] Loaded SOA file: {os.path.basename(file_path)} with {df.shape[0]} rows")
-            self.log_status(f"[->] Selected Match: {self.soa_match}")
-            # Mark as selected and apply theme-aware styling
-            self.soa_selected = True
-            self.soa_button.setStyleSheet(ThemeManager.get_selected_button_style(self.current_theme))
+            if job.slot == "SOA":
+                self.apply_soa(job)
+            else:
+                self.apply_ref(int(job.slot[3:]) - 1, job)
         except Exception as e:
             log_debug(str(e))
             QMessageBox.critical(self, "Error", str(e))
 
-    def save_soa_config(self, match_col, date_col, amount_col):
+    def apply_soa(self, job):
+        """
+        Saves the SOA selection and keeps its columns (or only their names for a streamed statement).
+        """
+        file_path = job.file_path
+        match, date_col, amount_col, tolerance, keep_cols = job.selection
+        columns = self.selected_columns(job)
+        if not job.parse:
+            self.soa_df = None
+            self.load_timings.pop("SOA", None)
+        else:
+            self.soa_df = self.load_columns(file_path, columns, "SOA", job.frame)
+        self.save_soa_config(match, date_col, amount_col, tolerance, keep_cols)
+        self.soa_path = file_path
+        self.soa_columns = columns
+        if self.soa_df is None:
+            # Rows are read chunk by chunk during the run; nothing is held in memory now
+            self.log_status(f"[OK] SOA file will be streamed: {os.path.basename(file_path)} ({len(columns)} columns)")
+        else:
+            df = self.soa_df
+            self.log_status(f"[OK] Loaded SOA file: {os.path.basename(file_path)} with {df.shape[0]} rows, {df.shape[1]} columns")
+        self.log_status(f"[->] Selected Match: {describe_match(self.soa_match)}")
+        self.refresh_group_columns()
+        # Mark as selected and apply theme-aware styling
+        self.soa_selected = True
+        self.soa_button.setStyleSheet(ThemeManager.get_selected_button_style(self.current_theme))
+
+    def load_columns(self, file_path, columns, slot, prefetched=None):
+        """
+        Takes the selected columns loaded in the background (prefetched, a load_file future,
+        which reuses the parsed-frame cache when the file is unchanged), reading them here only
+        when that load failed. The load time is kept under slot for the run profile.
+        """
+        profiler = StageProfiler()
+        with profiler.stage("load"):
+            df, timing = self._load_columns(file_path, columns, prefetched)
+        if timing is None:
+            load = profiler.report()["stages"][0]
+            timing = (load["seconds"], load["peak_mb"] * 1024 ** 2)
+        self.load_timings[slot] = timing
+        self.log_status(format_memory_report(os.path.basename(file_path), memory_report(df)))
+        return df
+
+    def _load_columns(self, file_path, columns, prefetched=None):
+        """
+        Returns (frame, (seconds, peak bytes) of a background parse or None). Cache reads and
+        writes stay on the loader thread; a failed background load is read again without caching.
+        """
+        if prefetched is not None:
+            try:
+                df, seconds, peak_bytes, _ = prefetched.result()
+                return df, (seconds, peak_bytes)
+            except Exception as e:
+                log_debug(f"Background load error: {str(e)}")
+        return read_columns(file_path, columns), None
+
+    def save_soa_config(self, match_col, date_col, amount_col, amount_tolerance=DEFAULT_AMOUNT_TOLERANCE, keep_cols=None):
         """
-        Saves the selected match column and amount column for SOA file.
+        Saves the selected match column, amount column, amount tolerance and kept columns for SOA file.
         """
         self.soa_match = match_col
         self.soa_date_col = date_col
         self.soa_amount_col = amount_col
+        self.amount_tolerance = amount_tolerance
+        self.soa_keep_cols = keep_cols or []
 
     def load_ref(self, idx):
         """
-        Loads a reference Excel file and prompts user to select match and return columns.
+        Starts reading the chosen reference file in the background; the column dialog opens once its header is read.
         """
-        file_path, _ = QFileDialog.getOpenFileName(self, f"Select Ref{idx+1} File", "", "Excel Files (*.xlsx)")
-        if not file_path:
-            return
-        try:
-            df = pd.read_excel(file_path, dtype=str)
-            selector = ColumnSelector(df.columns.tolist(), lambda m, r: self.save_ref_config(idx, df, m, r))
-            selector.exec_()
-            # Mark as selected and apply theme-aware styling
-            self.ref_selected[idx] = True
-            self.ref_buttons[idx].setStyleSheet(ThemeManager.get_selected_button_style(self.current_theme))
-            self.log_status(f"[OK] Loaded Ref{idx+1}: {os.path.basename(file_path)} with {df.shape[0]} rows")
-            self.log_status(f"[->] Selected Match: {self.refs[idx][1]} | Return: {', '.join(self.refs[idx][2])}")
-        except Exception as e:
-            log_debug(str(e))
-            QMessageBox.critical(self, "Error", str(e))
+        file_path, _ = QFileDialog.getOpenFileName(self, f"Select Ref{idx+1} File", "", INPUT_FILE_FILTER)
+        if file_path:
+            self.start_load(f"Ref{idx+1}", file_path)
+
+    def apply_ref(self, idx, job):
+        """
+        Saves a reference selection with its match and return columns.
+        """
+        match, returns, policy = job.selection
+        df = self.load_columns(job.file_path, self.selected_columns(job), f"Ref{idx+1}", job.frame)
+        self.save_ref_config(idx, df, match, returns, policy)
+        # Mark as selected and apply theme-aware styling
+        self.ref_selected[idx] = True
+        self.ref_buttons[idx].setStyleSheet(ThemeManager.get_selected_button_style(self.current_theme))
+        self.log_status(f"[OK] Loaded Ref{idx+1}: {os.path.basename(job.file_path)} with {df.shape[0]} rows")
+        self.log_status(f"[->] Selected Match: {describe_match(self.refs[idx][1])} | Return: {', '.join(self.refs[idx][2])} | Repeats: {self.refs[idx][4]}")
+        self.refresh_group_columns()
 
-    def save_ref_config(self, idx, df, match, returns):
+    def refresh_group_columns(self):
         """
-        Saves the selected match and return columns for a reference file.
+        Offers the loaded SOA columns and the columns of every loaded reference as split/combined
+        group columns, keeping the current choices while they are still there.
         """
-        self.refs[idx] = (df, match, returns, os.path.basename("Ref File"))
+        ref_columns = [col for ref in self.refs if ref is not None for col in ref[0].columns]
+        for combo, columns in ((self.subset_soa_group_combo, self.soa_columns or []),
+                               (self.subset_ref_group_combo, ref_columns)):
+            current = combo.currentText()
+            combo.clear()
+            combo.addItems([NO_GROUP_COLUMN] + list(dict.fromkeys(str(col) for col in columns)))
+            combo.setCurrentIndex(max(combo.findText(current), 0))
+
+    def save_ref_config(self, idx, df, match, returns, policy=DEFAULT_DUPLICATE_POLICY):
+        """
+        Saves the selected match and return columns and duplicate key policy for a reference file.
+        """
+        self.refs[idx] = (df, match, returns, os.path.basename("Ref File"), policy)
 
     def log_status(self, message):
         """
@@ -915,9 +1298,56 @@ class Oi360App(QWidget):
         """
         Starts the reconciliation process in a background thread.
         """
-        if self.soa_df is None or self.soa_match is None:
+        if self.pending_loads:
+            QMessageBox.warning(self, "Still Loading", f"Wait for {', '.join(sorted(self.pending_loads))} to finish loading.")
+            return
+        if (self.soa_df is None and self.soa_path is None) or self.soa_match is None:
             QMessageBox.warning(self, "Missing Info", "Load SOA file and select match column first.")
             return
+        mismatched = [f"Ref{idx+1}" for idx, ref in enumerate(self.refs)
+                      if ref is not None and len(key_columns(ref[1])) != len(key_columns(self.soa_match))]
+        if mismatched:
+            QMessageBox.warning(self, "Match Columns",
+                                f"{', '.join(mismatched)} must match on as many columns as the SOA "
+                                f"({describe_match(self.soa_match)}).")
+            return
+
+        try:
+            age_buckets = parse_buckets(self.buckets_edit.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Age Buckets", str(e))
+            return
+
+        # Split/combined payments are grouped by a column pair, or by key prefix when none is picked
+        soa_group = self.subset_soa_group_combo.currentText()
+        ref_group = self.subset_ref_group_combo.currentText()
+        group_columns = (soa_group, ref_group) if NO_GROUP_COLUMN not in (soa_group, ref_group) else None
+        if self.subset_check.isChecked() and group_columns is None and soa_group != ref_group:
+            QMessageBox.warning(self, "Split/Combined Payments",
+                                "Pick the group column for both the SOA and the references, or for neither.")
+            return
+
+        output_path = self.choose_output_path()
+        if not output_path:
+            self.log_status("Run cancelled: no output file chosen.")
+            return
+
+        subset_matcher = None
+        if self.subset_check.isChecked():
+            if self.soa_amount_col:
+                subset_matcher = SubsetMatcher(self.subset_size_spin.value(), self.subset_prefix_spin.value(),
+                                               group_columns)
+            else:
+                self.log_status("[WARNING] Split/combined payment matching needs an SOA amount column - skipped")
+
+        if self.worker is not None and self.worker.isRunning():
+            self.stop_worker("[CANCELLED] Previous run stopped; starting the new run")
+        # The previous result is let go before the new run holds its own
+        if self.result_view is not None:
+            self.result_view.close()
+            self.result_view = None
+        self.result_filters = None
+        self.view_btn.setEnabled(False)
 
         self.progress.setValue(0)
         ref_configs = []
@@ -925,40 +1355,155 @@ class Oi360App(QWidget):
             if ref is None:
                 ref_configs.append(None)
             else:
-                df, match, ret, lbl = ref
-                df[match] = df[match].astype(str)
-                ref_configs.append((df, match, ret, lbl))
-        self.worker = RecoWorker(self.soa_df, self.soa_match, self.soa_date_col, self.soa_amount_col, ref_configs)
+                ref_configs.append(ref)
+        self.worker = RecoWorker(self.soa_df, self.soa_match, self.soa_date_col, self.soa_amount_col, ref_configs,
+                                 amount_tolerance=self.amount_tolerance, output_path=output_path,
+                                 soa_path=self.soa_path, soa_columns=self.soa_columns,
+                                 fuzzy_min_score=self.fuzzy_score_spin.value() if self.fuzzy_check.isChecked() else None,
+                                 subset_matcher=subset_matcher, age_buckets=age_buckets,
+                                 as_of_date=self.as_of_edit.date().toPyDate(),
+                                 load_timings=list(self.load_timings.values()),
+                                 run_state=self.run_state if self.incremental_check.isChecked() else None,
+                                 results_store=self.results_store if self.record_check.isChecked() else None)
         self.worker.update_status.connect(self.log_status)
         self.worker.update_progress.connect(self.progress.setValue)
+        self.worker.profile_ready.connect(self.show_profile)
+        self.worker.results_ready.connect(self.set_results)
         self.worker.reco_complete.connect(self.save_output)
+        self.worker.finished.connect(self.worker_finished)
+        self.set_run_controls(True)
         self.worker.start()
-        self.worker.start()
 
-    def save_output(self, df):
+    def set_run_controls(self, running):
+        """
+        Enables Pause/Cancel only while a run is going.
+        """
+        self.pause_btn.setText("Pause")
+        self.pause_btn.setEnabled(running)
+        self.cancel_btn.setEnabled(running)
+
+    def toggle_pause(self):
+        """
+        Pauses the run at its next checkpoint, or lets a paused run carry on.
+        """
+        if self.worker is None or not self.worker.isRunning():
+            return
+        if self.worker.control.paused:
+            self.worker.resume()
+            self.pause_btn.setText("Pause")
+            self.log_status("Run resumed.")
+        else:
+            self.worker.pause()
+            self.pause_btn.setText("Resume")
+            self.log_status("Pausing at the next checkpoint...")
+
+    def cancel_reco(self):
+        """
+        Stops the run at its next checkpoint; rows already finished are still saved.
+        """
+        if self.worker is None or not self.worker.isRunning():
+            return
+        self.worker.cancel()
+        self.set_run_controls(False)
+        self.log_status("Cancelling at the next checkpoint...")
+
+    def stop_worker(self, message):
+        """
+        Cancels the running worker and detaches it from the UI, so a new run can
+        start straight away. It is kept referenced until its thread has finished.
+        """
+        worker = self.worker
+        for signal in (worker.update_status, worker.update_progress, worker.profile_ready,
+                       worker.results_ready, worker.reco_complete, worker.finished):
+            signal.disconnect()
+        worker.cancel()
+        self.stopping_workers.append(worker)
+        worker.finished.connect(lambda: self.stopping_workers.remove(worker))
+        self.worker = None
+        self.log_status(message)
+
+    def worker_finished(self):
+        """
+        Disables Pause/Cancel once the current run's thread has ended.
+        """
+        self.set_run_controls(False)
+
+    def closeEvent(self, event):
+        """
+        Stops background file loads when the window closes.
+        """
+        self.prefetcher.shutdown()
+        super().closeEvent(event)
+
+    def choose_output_path(self):
         """
-        Prompts user to save the reconciled DataFrame to an Excel file.
+        Asks where the reconciled Excel file should be saved, before the run starts.
+        Returns the chosen path, or "" if the user cancelled.
         """
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
-        save_path, _ = QFileDialog.getSaveFileName(
+        save_path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save Reconciled File",
             f"soa_reco_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            "Excel Files (*.xlsx)",
+            "Excel Files (*.xlsx);;CSV Files (*.csv);;Parquet Files (*.parquet)",
             options=options
         )
-        if save_path:
-            df.to_excel(save_path, index=False)
-            self.log_status(f"Saved result to {save_path}")
-            QMessageBox.information(self, "Done", f"Reconciliation saved as:\n{save_path}")
+        if save_path and os.path.splitext(save_path)[1].lower() not in (".xlsx", ".csv", ".parquet"):
+            # Use the extension of the chosen file type (Excel limit is about 1M rows)
+            save_path += "." + selected_filter.split("*.")[-1].rstrip(")")
+        return save_path
+
+    def set_results(self, filters):
+        """
+        Keeps the last run's rows and their precomputed filters for View Results.
+        """
+        self.result_filters = filters
+        self.view_btn.setEnabled(True)
+
+    def show_results(self):
+        """
+        Opens the result grid of the last run.
+        """
+        if self.result_filters is None:
+            return
+        if self.result_view is not None:
+            self.result_view.close()
+        title = f"Results - {os.path.basename(self.soa_path)}" if self.soa_path else "Results"
+        self.result_view = ResultView(self.result_filters, title, self)
+        self.result_view.show()
+
+    def show_profile(self, report):
+        """
+        Shows how long each stage of the run took and its peak memory.
+        """
+        for line in format_report(report):
+            self.log_status(line)
+
+    def save_output(self, df, saved_path, cancelled=False):
+        """
+        Reports where the worker saved the reconciled file.
+        """
+        if cancelled:
+            where = f"Finished rows saved to {saved_path}" if saved_path else "Nothing was saved."
+            self.log_status(f"Run cancelled. {where}")
+        elif saved_path:
+            self.log_status(f"Saved result to {saved_path}")
+            QMessageBox.information(self, "Done", f"Reconciliation saved as:\n{saved_path}")
         else:
-            self.log_status("Save cancelled.")
-            QMessageBox.information(self, "Cancelled", "Save operation was cancelled.")
+            self.log_status("Result was not saved.")
+            QMessageBox.warning(self, "Not Saved", "The reconciled file could not be saved. See the status box for details.")
 
 # --- Entry point for launching the application ---
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    multiprocessing.freeze_support()  # Background file parsing runs in worker processes
+    # Log location/level: --log-file / --log-level, else OI360_LOG_FILE / OI360_LOG_LEVEL
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--log-file")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper)
+    args, qt_args = parser.parse_known_args()
+    configure_logging(args.log_file, args.log_level)
+    app = QApplication([sys.argv[0]] + qt_args)
     window = Oi360App()
     window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,75 @@
+# File: reco_utils/amounts.py
+"""
+Amount comparison for Oi360 SOA RECO.
+Parses SOA and reference amount columns to numbers once and compares them
+with array operations.
+"""
+import numpy as np
+import pandas as pd
+
+# Differences at or below this value count as a match
+DEFAULT_AMOUNT_TOLERANCE = 0.01
+
+# Reference return columns with one of these words are compared against the SOA amount
+AMOUNT_KEYWORDS = ['amount', 'amt', 'value', 'total', 'sum', 'price', 'cost']
+
+
+def parse_amounts(values):
+    """
+    Parses '1,234.50' / '$99' style text to a float array (NaN when not a number).
+    Several amounts joined into one cell ('1,000 | 7') are not a number.
+    """
+    # Statements repeat the same amounts a lot, so each distinct text is parsed once
+    codes, uniques = pd.factorize(pd.Series(values))
+    uniques = pd.Series(uniques, dtype=object)
+    numbers = pd.to_numeric(uniques, errors="coerce")
+    retry = numbers.isna() & uniques.notna()
+    if retry.any():
+        cleaned = uniques[retry].astype(str).str.replace(r"[,$\s]", "", regex=True)
+        numbers[retry] = pd.to_numeric(cleaned, errors="coerce")
+    numbers = np.append(numbers.to_numpy(dtype=float, na_value=np.nan), np.nan)
+    return numbers[codes]  # code -1 (missing cell) picks the trailing NaN
+
+
+def _format_diffs(prefix, diffs):
+    """Formats differences as '<prefix>: +1.00', once per distinct rounded value."""
+    uniques, inverse = np.unique(np.round(diffs, 2), return_inverse=True)
+    return np.char.mod(f"{prefix}: %+.2f", uniques).astype(object)[inverse.reshape(-1)]
+
+
+def find_ref_amount_columns(columns):
+    """Returns reference (RefN_*) columns whose name looks like an amount."""
+    return [c for c in columns
+            if c.startswith('Ref') and any(kw in c.lower() for kw in AMOUNT_KEYWORDS)]
+
+
+def amount_differences(df, soa_amount_col, ref_amount_cols):
+    """Returns (SOA amounts, {ref column: SOA minus ref amount}) as float arrays (NaN when not a number)."""
+    soa_num = parse_amounts(df[soa_amount_col])
+    return soa_num, {ref_col: soa_num - parse_amounts(df[ref_col]) for ref_col in ref_amount_cols}
+
+
+def compare_amounts(df, soa_amount_col, ref_amount_cols, tolerance=DEFAULT_AMOUNT_TOLERANCE, differences=None):
+    """
+    Compares the SOA amount with every reference amount column.
+    differences (from amount_differences) saves parsing the amounts again.
+    Returns (mismatch masks by ref column, 'Amount Difference' text array).
+    """
+    if differences is None:
+        differences = amount_differences(df, soa_amount_col, ref_amount_cols)
+    masks = {}
+    diff_text = np.full(len(df), "", dtype=object)
+    for ref_col in ref_amount_cols:
+        diff = differences[1][ref_col]
+        comparable = ~np.isnan(diff)
+        mismatch = comparable & (np.abs(diff) > tolerance)
+        masks[ref_col] = mismatch
+
+        # e.g. "Ref1: +12.50", "Ref1: -3.00", or "Ref1: 0.00" inside the tolerance
+        ref_name = ref_col.split('_')[0]
+        part = np.full(len(df), "", dtype=object)
+        part[comparable] = f"{ref_name}: 0.00"
+        part[mismatch] = _format_diffs(ref_name, diff[mismatch])
+        diff_text = np.where(diff_text == "", part,
+                             np.where(part == "", diff_text, diff_text + ", " + part))
+    return masks, diff_text
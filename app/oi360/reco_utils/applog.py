@@ -0,0 +1,132 @@
+# File: reco_utils/applog.py
+"""
+Background file logging for Oi360 SOA RECO.
+Log calls only put the record on a queue; one writer thread keeps the log
+file open, writes whatever has queued up in a single batch and rotates the
+file by size. Location and level come from configure_logging() or the
+OI360_LOG_FILE / OI360_LOG_LEVEL environment variables.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+
+LOGGER_NAME = "oi360"
+DEFAULT_LOG_FILE = "debug_log.txt"  # In the working folder, as before
+DEFAULT_LOG_LEVEL = "INFO"  # DEBUG also writes per-row / per-stage diagnostics
+MAX_LOG_BYTES = 5 * 1024 ** 2
+LOG_BACKUPS = 3  # debug_log.txt.1 .. .3
+MAX_BATCH = 1000  # Records written per file write at most
+
+_handler = None
+
+
+class BatchedFileHandler(logging.Handler):
+    """
+    Queue-backed handler: emit() never touches the disk. A daemon thread drains
+    the queue, writes each batch with one write + flush, and rolls the file
+    over to path.1, path.2, ... once it would grow past max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue()
+        self._stream = None
+        self._thread = threading.Thread(target=self._write_loop, name="oi360-log", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        # Formatting happens on the writer thread too; only the message is resolved now
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        self._queue.put_nowait(record)
+
+    def _open(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._stream = open(self.path, "a", encoding="utf-8")
+
+    def _rotate(self):
+        self._stream.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write_loop(self):
+        while True:
+            lines = [self._queue.get()]
+            # Take everything else already waiting, so bursts cost one write
+            while len(lines) < MAX_BATCH:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in lines
+            text = "".join(f"{self.format(record)}\n" for record in lines if record is not None)
+            if text:
+                try:
+                    if self._stream is None:
+                        self._open()
+                    if self._stream.tell() and self._stream.tell() + len(text) > self.max_bytes:
+                        self._rotate()
+                    self._stream.write(text)
+                    self._stream.flush()
+                except OSError:
+                    pass  # Logging must never stop a reconciliation
+            if stop:
+                return
+
+    def close(self):
+        """Writes out everything still queued, then closes the file."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        super().close()
+
+
+def configure_logging(path=None, level=None, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+    """
+    Sends the 'oi360' logger to a BatchedFileHandler (replacing an earlier one).
+    Returns the logger.
+    """
+    global _handler
+    path = path or os.environ.get("OI360_LOG_FILE") or DEFAULT_LOG_FILE
+    level = (level or os.environ.get("OI360_LOG_LEVEL") or DEFAULT_LOG_LEVEL).upper()
+    logger = logging.getLogger(LOGGER_NAME)
+    if _handler is not None:
+        logger.removeHandler(_handler)
+        _handler.close()
+    _handler = BatchedFileHandler(path, max_bytes, backups)
+    # Same line layout as the old debug_log.txt
+    _handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    logger.propagate = False
+    return logger
+
+
+def get_logger():
+    """Returns the 'oi360' logger, configuring it with the defaults on first use."""
+    if _handler is None:
+        configure_logging()
+    return logging.getLogger(LOGGER_NAME)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _handler is not None:
+        _handler.close()
@@ -0,0 +1,306 @@
+# File: reco_utils/batch.py
+"""
+Headless batch reconciliation for Oi360 SOA RECO (no PyQt needed).
+
+Usage (from the oi360 folder):
+    python -m reco_utils.batch job.json
+    python -m reco_utils.batch jobs/ --workers 8
+
+A job spec is a JSON or YAML file (YAML needs PyYAML). Paths are relative to
+the job file:
+    {
+      "soa": {"path": "soa.xlsx", "match": "Invoice No", "date": "Doc Date",
+              "amount": "Amount", "keep": ["Invoice No", "Customer"]},
+      "references": [
+        {"path": "ledger.xlsx", "match": "Invoice", "returns": ["Amount", "Status"],
+         "duplicates": "first"}
+      ],
+      "output": "out/customer_x.xlsx",
+      "amount_tolerance": 0.01,
+      "key_rules": [["whitespace"], ["apostrophe"], ["leading_zeros"]],
+      "fuzzy_min_score": 85,
+      "age_buckets": [15, 30, 60, 90, 120],
+      "as_of": "2026-09-30",
+      "subset": {"max_rows": 3, "key_prefix": 0, "soa_group": "Customer",
+                 "ref_group": "Customer", "seconds_per_search": 0.05},
+      "streaming": false,
+      "chunk_rows": 100000,
+      "incremental": false,
+      "results_db": false
+    }
+Only soa.path, soa.match and references[].path/match/returns are required.
+A "match" may also be a list of columns matched together as one key, e.g.
+["Invoice No", "Vendor"]; the SOA and every reference list the same number.
+"subset" turns on split/combined payment matching; its fields are optional and
+soa_group/ref_group (e.g. a customer column) take precedence over key_prefix.
+"incremental" reuses the stored result of the job's last run: only changed SOA
+rows and references are reconciled, and a "What Changed" sheet (or
+<output>_what_changed file) lists the differences. Not for streaming jobs.
+"results_db" records the result rows for lookups across runs (see
+reco_utils.resultsdb): true uses the default database, a path picks another.
+A directory argument runs every *.json / *.yaml / *.yml job in it across a
+process pool sized to the machine.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from reco_utils.amounts import DEFAULT_AMOUNT_TOLERANCE
+from reco_utils.applog import configure_logging
+from reco_utils.cache import FrameCache
+from reco_utils.dates import parse_buckets
+from reco_utils.engine import RecoEngine
+from reco_utils.export import ResultWriter
+from reco_utils.profiling import StageProfiler, profile_path, format_report
+from reco_utils.runstate import RunStateStore, soa_identity
+from reco_utils.resultsdb import DEFAULT_DB_PATH, ResultsStore
+from reco_utils.join import DEFAULT_DUPLICATE_POLICY
+from reco_utils.memory import compact_frame, memory_report, format_memory_report
+from reco_utils.normalize import key_columns
+from reco_utils.subset import DEFAULT_MAX_COMBINATION, DEFAULT_SEARCH_SECONDS, SubsetMatcher
+from reco_utils.loader import DEFAULT_CHUNK_ROWS, read_headers, read_columns, count_rows, iter_chunks
+
+JOB_EXTENSIONS = (".json", ".yaml", ".yml")
+
+
+def load_job(job_path):
+    """Reads a JSON/YAML job spec and resolves its paths against the job file's folder."""
+    with open(job_path, encoding="utf-8") as f:
+        if job_path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is required for YAML job files. Please install: pip install pyyaml")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(job_path))
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    soa = spec.get("soa") or {}
+    for field in ("path", "match"):
+        if not soa.get(field):
+            raise ValueError(f"{job_path}: soa.{field} is required")
+    soa["path"] = resolve(soa["path"])
+    for i, ref in enumerate(spec.get("references") or []):
+        for field in ("path", "match", "returns"):
+            if not ref.get(field):
+                raise ValueError(f"{job_path}: references[{i}].{field} is required")
+        ref["path"] = resolve(ref["path"])
+    if isinstance(spec.get("results_db"), str):
+        spec["results_db"] = resolve(spec["results_db"])
+
+    job_name = os.path.splitext(os.path.basename(job_path))[0]
+    if spec.get("output"):
+        spec["output"] = resolve(spec["output"])
+    else:
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        spec["output"] = os.path.join(base_dir, f"{job_name}_soa_reco_{stamp}.xlsx")
+    spec["name"] = job_name
+    return spec
+
+
+def _load(cache, file_path, columns):
+    df = cache.get(file_path, columns) if cache else None
+    if df is not None:
+        df = compact_frame(df)  # Entries cached before frames were compacted
+    else:
+        df = read_columns(file_path, columns)
+        if cache:
+            cache.put(file_path, columns, df)
+    return df
+
+
+def run_job(job_path, use_cache=True, verbose=False, log_dir=None, log_level=None):
+    """
+    Runs one job spec end to end. Returns a summary dict (error is None on success).
+    With log_dir, the job's messages are also logged to <log_dir>/<job name>.log.
+    """
+    started = time.time()
+    summary = {"job": job_path, "output": None, "rows": 0, "seconds": 0.0, "error": None, "profile": None}
+    logger = None
+    try:
+        spec = load_job(job_path)
+        name = spec["name"]
+        if log_dir:
+            logger = configure_logging(os.path.join(log_dir, f"{name}.log"), log_level)
+
+        def status(message):
+            print(f"[{name}] {message}", flush=True)
+            if logger:
+                logger.info(message)
+
+        def debug(message):
+            if verbose:
+                print(f"[{name}] {message}", flush=True)
+            if logger:
+                logger.debug(message)
+
+        cache = FrameCache() if use_cache else None
+        profiler = StageProfiler()
+
+        def deferred_load(path, columns):
+            # Runs on the engine's reference pool, so all references load concurrently
+            def load():
+                ref_df = _load(cache, path, columns)
+                status(f"Loaded {os.path.basename(path)} with {len(ref_df)} rows")
+                debug(format_memory_report(os.path.basename(path), memory_report(ref_df)))
+                return ref_df
+            return load
+
+        subset = spec.get("subset")
+        subset_matcher = None
+        if subset is not None:
+            group_columns = (subset["soa_group"], subset["ref_group"]) if subset.get("soa_group") else None
+            subset_matcher = SubsetMatcher(
+                int(subset.get("max_rows", DEFAULT_MAX_COMBINATION)), int(subset.get("key_prefix", 0)),
+                group_columns, float(subset.get("seconds_per_search", DEFAULT_SEARCH_SECONDS))
+            )
+        ref_group = [subset_matcher.group_columns[1]] if subset_matcher and subset_matcher.group_columns else []
+        soa_group = [subset_matcher.group_columns[0]] if subset_matcher and subset_matcher.group_columns else []
+
+        ref_configs = []
+        for ref in spec.get("references") or []:
+            columns = list(dict.fromkeys(key_columns(ref["match"]) + list(ref["returns"]) + ref_group))
+            ref_configs.append((deferred_load(ref["path"], columns), ref["match"], list(ref["returns"]),
+                                os.path.basename(ref["path"]), ref.get("duplicates", DEFAULT_DUPLICATE_POLICY)))
+
+        soa = spec["soa"]
+        keep = soa.get("keep") or read_headers(soa["path"])
+        soa_columns = list(dict.fromkeys(c for c in key_columns(soa["match"]) + [soa.get("date"), soa.get("amount")]
+                                         + list(keep) + soa_group if c))
+        streaming = bool(spec.get("streaming"))
+        if streaming:
+            soa_chunks = iter_chunks(soa["path"], soa_columns, int(spec.get("chunk_rows", DEFAULT_CHUNK_ROWS)))
+            total_rows = count_rows(soa["path"])
+        else:
+            with profiler.stage("load"):
+                soa_df = _load(cache, soa["path"], soa_columns)
+            debug(format_memory_report(os.path.basename(soa["path"]), memory_report(soa_df)))
+            soa_chunks = [soa_df]
+            total_rows = len(soa_df)
+
+        key_rules = spec.get("key_rules")
+        if key_rules is not None:
+            key_rules = [tuple(rule) + (None,) * (2 - len(rule)) for rule in key_rules]
+        tolerance = float(spec.get("amount_tolerance", DEFAULT_AMOUNT_TOLERANCE))
+        age_buckets = spec.get("age_buckets")
+        if age_buckets is not None:
+            age_buckets = parse_buckets(",".join(str(b) for b in age_buckets))
+        engine = RecoEngine(
+            soa["match"], soa.get("date"), soa.get("amount"), ref_configs,
+            key_rules=key_rules, amount_tolerance=tolerance, status=status, debug=debug,
+            fuzzy_min_score=spec.get("fuzzy_min_score"), subset_matcher=subset_matcher,
+            age_buckets=age_buckets, as_of_date=spec.get("as_of"), profiler=profiler
+        )
+
+        os.makedirs(os.path.dirname(spec["output"]) or ".", exist_ok=True)
+        writer = ResultWriter(spec["output"], soa.get("amount"), tolerance)
+        recorder = None
+        if spec.get("results_db"):
+            db_path = spec["results_db"] if isinstance(spec["results_db"], str) else DEFAULT_DB_PATH
+            try:
+                recorder = ResultsStore(db_path).start_run(soa["path"], soa["match"], spec["output"],
+                                                           engine.as_of_date.date(), engine.key_rules)
+            except Exception as e:
+                # The result file matters more than the lookup copy: reconcile without it
+                status(f"[WARNING] Results are not recorded: {type(e).__name__}: {e}")
+        try:
+            if spec.get("incremental") and not streaming:
+                engine.run_incremental(soa_df, RunStateStore(), soa_identity(soa["path"], soa["match"]),
+                                       writer, recorder)
+            else:
+                if spec.get("incremental"):
+                    status("[WARNING] Incremental runs need the whole SOA in memory - running in full")
+                engine.run(soa_chunks, writer, total_rows, keep_result=False, recorder=recorder)
+            if recorder is not None:
+                try:
+                    with profiler.stage("results db"):
+                        recorder.close()
+                    status(f"Recorded {recorder.rows} row(s) as run {recorder.run_id} in the results database")
+                except Exception as e:
+                    status(f"[WARNING] Results database close error: {type(e).__name__}: {e}")
+                recorder = None
+        finally:
+            with profiler.stage("export"):
+                writer.close()
+            if recorder is not None:
+                try:
+                    recorder.close("failed")
+                except Exception as e:
+                    debug(f"Results database close error: {str(e)}")
+        summary["output"] = spec["output"]
+        summary["rows"] = writer.rows
+        summary["profile"] = profiler.save(profile_path(spec["output"]))
+        if verbose:
+            for line in format_report(summary["profile"]):
+                status(line)
+        status(f"Saved result to {spec['output']}")
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        print(f"[ERROR] {job_path}: {summary['error']}", file=sys.stderr, flush=True)
+        if logger:
+            logger.error(summary["error"])
+    summary["seconds"] = round(time.time() - started, 2)
+    return summary
+
+
+def find_jobs(paths):
+    """Expands job files and job directories into a sorted list of job files."""
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            jobs.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                        if name.lower().endswith(JOB_EXTENSIONS))
+        else:
+            jobs.append(path)
+    return jobs
+
+
+def run_jobs(job_paths, workers=None, use_cache=True, verbose=False, log_dir=None, log_level=None):
+    """Runs jobs across a process pool (one process per CPU by default). Returns the summaries."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(job_paths) == 1:
+        return [run_job(path, use_cache, verbose, log_dir, log_level) for path in job_paths]
+    summaries = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(job_paths))) as pool:
+        futures = [pool.submit(run_job, path, use_cache, verbose, log_dir, log_level) for path in job_paths]
+        for future in as_completed(futures):
+            summaries.append(future.result())
+    return sorted(summaries, key=lambda s: job_paths.index(s["job"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Oi360 SOA RECO - headless batch reconciliation")
+    parser.add_argument("jobs", nargs="+", help="job spec files (.json/.yaml) or folders of them")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the parsed-file cache")
+    parser.add_argument("--summary", help="write the run summary as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="print debug messages too")
+    parser.add_argument("--log-dir", help="also log each job to <log-dir>/<job name>.log")
+    parser.add_argument("--log-level", default="INFO", type=str.upper,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="log file level (default: INFO)")
+    args = parser.parse_args(argv)
+
+    job_paths = find_jobs(args.jobs)
+    if not job_paths:
+        print("No job files found.", file=sys.stderr)
+        return 2
+    summaries = run_jobs(job_paths, args.workers, not args.no_cache, args.verbose, args.log_dir, args.log_level)
+    failed = [s for s in summaries if s["error"]]
+    print(f"Finished {len(summaries)} job(s): {len(summaries) - len(failed)} ok, {len(failed)} failed")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# File: reco_utils/bench.py
+"""
+Reconciliation benchmarks for Oi360 SOA RECO (no PyQt needed).
+
+Usage (from the oi360 folder):
+    python -m reco_utils.bench --rows 10000 100000 1000000 --output bench.json
+    python -m reco_utils.bench --rows 5000000 --format parquet --fuzzy
+    python -m reco_utils.bench --compare before.json after.json
+
+Each case generates a synthetic SOA and reference ledger, writes both files,
+then loads, reconciles and exports them the way RecoWorker does (same engine,
+writer and stage profiler) in a fresh process, so peak memory is per case.
+Results are saved as JSON with the commit they ran on; --compare prints the
+stage timings of two result files side by side.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from reco_utils.engine import RecoEngine
+from reco_utils.export import ResultWriter
+from reco_utils.loader import read_columns
+from reco_utils.profiling import StageProfiler, format_report
+
+DEFAULT_ROWS = [10000, 100000, 1000000]
+DEFAULT_DUPLICATE_RATE = 0.02  # Reference rows repeating an earlier key
+DEFAULT_MATCH_RATE = 0.8  # SOA rows whose key is in the reference
+DEFAULT_AMOUNT_NOISE = 0.05  # Matched SOA rows whose amount differs from the reference
+DEFAULT_DATE_FORMATS = ["%d/%m/%Y"]
+DATE_SPAN_DAYS = 400
+CUSTOMERS = 1000
+
+SOA_COLUMNS = ["Invoice No", "Doc Date", "Amount", "Customer"]
+REF_COLUMNS = ["Invoice", "Amount", "Status", "Customer", "Posting Date"]
+
+
+def _amount_text(cents):
+    """Formats int cents as '1234.50' text, vectorized."""
+    cents = pd.Series(cents)
+    sign = np.where(cents < 0, "-", "")
+    cents = cents.abs()
+    return sign + (cents // 100).astype(str) + "." + (cents % 100).astype(str).str.zfill(2)
+
+
+def _date_text(rng, rows, date_formats, as_of):
+    """Random dates within DATE_SPAN_DAYS before as_of, each row in one of date_formats."""
+    days = pd.date_range(end=as_of, periods=DATE_SPAN_DAYS, freq="D")
+    # Every distinct (date, format) text is built once and then picked by row
+    texts = np.array([[day.strftime(fmt) for fmt in date_formats] for day in days], dtype=object)
+    return texts[rng.integers(0, DATE_SPAN_DAYS, rows), rng.integers(0, len(date_formats), rows)]
+
+
+def generate_ledgers(rows, ref_rows=None, duplicate_rate=DEFAULT_DUPLICATE_RATE, match_rate=DEFAULT_MATCH_RATE,
+                     amount_noise=DEFAULT_AMOUNT_NOISE, date_formats=None, seed=0, as_of=None):
+    """
+    Returns (soa_df, ref_df) text frames.
+    ref_rows defaults to rows. duplicate_rate of the reference rows repeat an
+    earlier key, match_rate of the SOA rows have a key in the reference, and
+    amount_noise of those carry a different amount. Dates use date_formats
+    (strftime patterns, mixed row by row when there are several).
+    """
+    rng = np.random.default_rng(seed)
+    ref_rows = ref_rows or rows
+    date_formats = date_formats or DEFAULT_DATE_FORMATS
+    as_of = pd.Timestamp(as_of or datetime.date.today())
+
+    unique_rows = max(int(round(ref_rows * (1 - duplicate_rate))), 1)
+    ids = rng.permutation(unique_rows * 4)[:unique_rows]  # Sparse ids, so unmatched keys are easy to make
+    repeats = rng.integers(0, unique_rows, ref_rows - unique_rows)
+    ref_ids = np.concatenate([ids, ids[repeats]])
+    rng.shuffle(ref_ids)
+    ref_cents = rng.integers(100, 10_000_000, ref_rows)
+    customers = rng.integers(0, CUSTOMERS, ref_rows)
+    ref_df = pd.DataFrame({
+        "Invoice": "INV" + pd.Series(ref_ids).astype(str).str.zfill(9),
+        "Amount": _amount_text(ref_cents),
+        "Status": np.array(["Open", "Paid", "Disputed", "Credited"], dtype=object)[rng.integers(0, 4, ref_rows)],
+        "Customer": "CUST" + pd.Series(customers).astype(str).str.zfill(4),
+        "Posting Date": _date_text(rng, ref_rows, date_formats, as_of),
+    })
+
+    # Matched SOA rows copy a reference row; the rest get ids the reference never uses
+    matched = rng.random(rows) < match_rate
+    picks = rng.integers(0, ref_rows, rows)
+    soa_ids = np.where(matched, ref_ids[picks], unique_rows * 4 + rng.integers(0, unique_rows * 4, rows))
+    soa_cents = np.where(matched, ref_cents[picks], rng.integers(100, 10_000_000, rows))
+    noisy = matched & (rng.random(rows) < amount_noise)
+    soa_cents[noisy] += rng.integers(-50_000, 50_000, int(noisy.sum())) | 1  # Never exactly zero
+    soa_df = pd.DataFrame({
+        "Invoice No": "INV" + pd.Series(soa_ids).astype(str).str.zfill(9),
+        "Doc Date": _date_text(rng, rows, date_formats, as_of),
+        "Amount": _amount_text(soa_cents),
+        "Customer": "CUST" + pd.Series(np.where(matched, customers[picks], rng.integers(0, CUSTOMERS, rows))).astype(str).str.zfill(4),
+    })
+    return soa_df.astype(object), ref_df.astype(object)
+
+
+def _write(df, path):
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    elif path.endswith(".xlsx"):
+        df.to_excel(path, index=False, engine="xlsxwriter")
+    else:
+        df.to_csv(path, index=False)
+
+
+def run_case(case):
+    """
+    Generates, loads, reconciles and exports one benchmark case (a dict of
+    generate_ledgers arguments plus format/output_format/fuzzy/policy).
+    Returns the case with its profile and result counts.
+    """
+    work_dir = tempfile.mkdtemp(prefix="oi360_bench_")
+    try:
+        started = time.perf_counter()
+        soa_df, ref_df = generate_ledgers(
+            case["rows"], case.get("ref_rows"), case["duplicate_rate"], case["match_rate"],
+            case["amount_noise"], case["date_formats"], case.get("seed", 0), case.get("as_of")
+        )
+        soa_path = os.path.join(work_dir, f"soa.{case['format']}")
+        ref_path = os.path.join(work_dir, f"ref.{case['format']}")
+        _write(soa_df, soa_path)
+        _write(ref_df, ref_path)
+        del soa_df, ref_df
+        generate_seconds = time.perf_counter() - started
+
+        # Same steps as RecoWorker.run: files loaded up front, then engine.run into a ResultWriter
+        profiler = StageProfiler()
+        with profiler.stage("load"):
+            soa = read_columns(soa_path, SOA_COLUMNS)
+            ref = read_columns(ref_path, REF_COLUMNS)
+        engine = RecoEngine(
+            "Invoice No", "Doc Date", "Amount",
+            [(ref, "Invoice", ["Amount", "Status", "Posting Date"], "ref", case["policy"])],
+            fuzzy_min_score=case["fuzzy_min_score"], as_of_date=case.get("as_of"), profiler=profiler
+        )
+        writer = ResultWriter(os.path.join(work_dir, f"result.{case['output_format']}"), "Amount")
+        try:
+            engine.run([soa], writer, len(soa), keep_result=False)
+        finally:
+            with profiler.stage("export"):
+                writer.close()
+        report = profiler.report()
+        return {
+            **case,
+            "generate_seconds": round(generate_seconds, 3),
+            "rows_per_second": round(report["rows"] / report["total_seconds"]) if report["total_seconds"] else None,
+            "matched_rows": engine.matched_rows,
+            "mismatches": engine.mismatch_count,
+            "fuzzy_matches": engine.fuzzy_count,
+            "profile": report,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _commit():
+    """Returns the git commit the code runs from ('' outside a checkout)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run_suite(cases, output_path=None, verbose=False):
+    """Runs every case in its own process and returns (and optionally saves) the results dict."""
+    results = {
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "cases": [],
+    }
+    for case in cases:
+        print(f"[BENCH] {case['name']} ...", flush=True)
+        # A fresh process per case keeps one case's memory out of the next one's peak
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_case, case).result()
+        results["cases"].append(result)
+        profile = result["profile"]
+        print(f"[BENCH] {case['name']}: {profile['total_seconds']:.2f} s, {result['rows_per_second']} rows/s, "
+              f"peak {profile['peak_mb']:.0f} MB", flush=True)
+        if verbose:
+            for line in format_report(profile):
+                print(line, flush=True)
+        if output_path:
+            # Saved after every case, so a crash at 5M rows keeps the smaller runs
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    return results
+
+
+def compare_results(before, after):
+    """Returns text lines comparing the stage times of cases present in both result dicts."""
+    lines = [f"Comparing {before.get('commit') or '?'} -> {after.get('commit') or '?'}"]
+    earlier = {case["name"]: case for case in before["cases"]}
+    for case in after["cases"]:
+        old = earlier.get(case["name"])
+        if old is None:
+            continue
+        old_stages = {s["stage"]: s for s in old["profile"]["stages"]}
+        lines.append(f"{case['name']}: {old['profile']['total_seconds']:.2f} s -> {case['profile']['total_seconds']:.2f} s, "
+                     f"peak {old['profile']['peak_mb']:.0f} -> {case['profile']['peak_mb']:.0f} MB")
+        for stage in case["profile"]["stages"]:
+            previous = old_stages.get(stage["stage"])
+            was = f"{previous['seconds']:8.2f}" if previous else "       -"
+            lines.append(f"  {stage['stage']:<15} {was} s -> {stage['seconds']:8.2f} s")
+    return lines
+
+
+def build_cases(args):
+    """One case per requested row count, sharing the other settings."""
+    date_formats = [fmt.strip() for fmt in args.date_formats.split(",") if fmt.strip()]
+    cases = []
+    for rows in args.rows:
+        output_format = args.output_format
+        if output_format == "xlsx" and rows > 1000000:
+            output_format = "csv"  # Excel sheets stop at about one million rows
+        cases.append({
+            "name": f"{rows}_rows" + ("_fuzzy" if args.fuzzy else ""),
+            "rows": rows,
+            "ref_rows": args.ref_rows,
+            "duplicate_rate": args.duplicate_rate,
+            "match_rate": args.match_rate,
+            "amount_noise": args.amount_noise,
+            "date_formats": date_formats,
+            "format": args.format,
+            "output_format": output_format,
+            "fuzzy_min_score": args.fuzzy_min_score if args.fuzzy else None,
+            "policy": args.duplicates,
+            "seed": args.seed,
+            "as_of": args.as_of,
+        })
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Oi360 SOA RECO - reconciliation benchmarks")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="SOA rows per case (10k .. 5M)")
+    parser.add_argument("--ref-rows", type=int, default=None, help="reference rows (default: same as --rows)")
+    parser.add_argument("--duplicate-rate", type=float, default=DEFAULT_DUPLICATE_RATE, help="share of repeated reference keys")
+    parser.add_argument("--match-rate", type=float, default=DEFAULT_MATCH_RATE, help="share of SOA rows found in the reference")
+    parser.add_argument("--amount-noise", type=float, default=DEFAULT_AMOUNT_NOISE, help="share of matched rows with a different amount")
+    parser.add_argument("--date-formats", default=",".join(DEFAULT_DATE_FORMATS),
+                        help="comma-separated strftime formats, mixed row by row (default: %%d/%%m/%%Y)")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet", "xlsx"], help="input file type")
+    parser.add_argument("--output-format", default="csv", choices=["csv", "parquet", "xlsx"], help="result file type")
+    parser.add_argument("--fuzzy", action="store_true", help="turn on the fuzzy pass")
+    parser.add_argument("--fuzzy-min-score", type=int, default=85)
+    parser.add_argument("--duplicates", default="first", help="duplicate key policy of the reference")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--as-of", default=None, help="age date (default: today)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="print every stage of every case")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            after = json.load(f)
+        print("\n".join(compare_results(before, after)))
+        return 0
+    run_suite(build_cases(args), args.output, args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# File: reco_utils/cache.py
+"""
+On-disk cache of parsed workbooks for Oi360 SOA RECO.
+Parsed frames are stored as Arrow IPC (Feather) files keyed by the source
+file's content hash and the selected columns, with LRU eviction by total size.
+Needs pyarrow; without it the cache is simply disabled.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".oi360_cache")
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3  # 2 GB
+MANIFEST_NAME = "manifest.json"
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Returns a hex digest of the file contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_key(file_path):
+    """Returns the path|size|mtime key a file's content hash is remembered under."""
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _stat_key_current(stat_key):
+    """True while the file a stat key was taken from is still there and unchanged."""
+    file_path = stat_key.rsplit("|", 2)[0]
+    try:
+        return _stat_key(file_path) == stat_key
+    except OSError:
+        return False
+
+
+class FrameCache:
+    """
+    Columnar cache of parsed frames.
+    The manifest remembers path/size/mtime -> content hash, so an unchanged
+    file is recognised without re-reading it; a changed or copied file is
+    hashed once and matched by content.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = _has_pyarrow()
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self._removed = set()  # entry keys evicted (or found unreadable) by this process
+        self._manifest = {"files": {}, "entries": {}}
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"files": {}, "entries": {}}
+
+    def _save_manifest(self):
+        # Several batch processes may share the cache: merge with what is on disk first
+        on_disk = self._read_manifest()
+        for section in ("files", "entries"):
+            merged = on_disk.get(section, {})
+            merged.update(self._manifest[section])
+            self._manifest[section] = merged
+        for key in self._removed:
+            self._manifest["entries"].pop(key, None)
+        # Forget hashes of files deleted or changed since (after the merge, which brings old ones back);
+        # a hash with no cached frame yet stays, it may have been worked out ahead of a put()
+        self._manifest["files"] = {k: v for k, v in self._manifest["files"].items() if _stat_key_current(k)}
+        tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def content_hash(self, file_path):
+        """
+        Returns the content hash of file_path, hashing it only when it changed.
+        Thread-safe and the file is read outside the lock, so it can run in the
+        background while the user picks columns; later cache calls reuse it.
+        """
+        if not self.enabled:
+            return None
+        stat_key = _stat_key(file_path)
+        with self._lock:
+            content_hash = self._manifest["files"].get(stat_key)
+        if content_hash is None:
+            content_hash = file_content_hash(file_path)
+            with self._lock:
+                self._manifest["files"][stat_key] = content_hash
+        return content_hash
+
+    def _entry_key(self, file_path, columns):
+        stat_key = _stat_key(file_path)
+        content_hash = self._manifest["files"].get(stat_key)
+        if content_hash is None:
+            content_hash = file_content_hash(file_path)
+            self._manifest["files"][stat_key] = content_hash
+        column_key = hashlib.blake2b("\x1f".join(sorted(columns)).encode("utf-8"), digest_size=8).hexdigest()
+        return f"{content_hash}_{column_key}"
+
+    def has(self, file_path, columns):
+        """Returns True when get() would find a frame for file_path/columns, without reading it."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            key = self._entry_key(file_path, columns)
+            if key in self._manifest["entries"]:
+                return True
+            return key in self._read_manifest().get("entries", {})
+
+    def get(self, file_path, columns):
+        """Returns the cached frame for file_path/columns, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            key = self._entry_key(file_path, columns)
+            entry = self._manifest["entries"].get(key)
+            if entry is None:
+                # Another process may have cached it since this one started
+                entry = self._read_manifest().get("entries", {}).get(key)
+                if entry is None:
+                    return None
+                self._manifest["entries"][key] = entry
+            data_path = os.path.join(self.cache_dir, entry["file"])
+            try:
+                df = pd.read_feather(data_path)
+            except Exception:
+                self._manifest["entries"].pop(key, None)
+                self._removed.add(key)  # Or the next merge with the manifest on disk brings it back
+                self._save_manifest()
+                return None
+            entry["last_used"] = time.time()
+            self._save_manifest()
+        return df
+
+    def put(self, file_path, columns, df):
+        """Stores a parsed frame and evicts least recently used entries over the size limit."""
+        if not self.enabled:
+            return
+        with self._lock:
+            key = self._entry_key(file_path, columns)
+            data_name = f"{key}.arrow"
+            data_path = os.path.join(self.cache_dir, data_name)
+            tmp_path = f"{data_path}.{os.getpid()}.tmp"
+            df.reset_index(drop=True).to_feather(tmp_path)
+            os.replace(tmp_path, data_path)
+            self._removed.discard(key)
+            self._manifest["entries"][key] = {
+                "file": data_name,
+                "bytes": os.path.getsize(data_path),
+                "last_used": time.time(),
+            }
+            self._evict()
+            self._save_manifest()
+
+    def _evict(self):
+        entries = self._manifest["entries"]
+        total = sum(e["bytes"] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            entry = entries.pop(key)
+            self._removed.add(key)
+            total -= entry["bytes"]
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except OSError:
+                pass
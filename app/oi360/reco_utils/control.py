@@ -0,0 +1,46 @@
+# File: reco_utils/control.py
+"""
+Cooperative cancel and pause for Oi360 SOA RECO runs.
+The engine calls checkpoint() between stages and between chunks of rows, so
+a paused run waits there and a cancelled run stops there, keeping the rows
+it had already finished.
+"""
+import threading
+
+
+class RunCancelled(Exception):
+    """Raised at the next checkpoint once a run has been cancelled."""
+
+
+class RunControl:
+    """Thread-safe cancel/pause flags shared by the UI thread and the run."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # A paused run has to wake up to stop
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def checkpoint(self):
+        """Waits while paused; raises RunCancelled once cancelled."""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise RunCancelled()
@@ -0,0 +1,133 @@
+# File: reco_utils/dates.py
+"""
+Date parsing and age buckets for Oi360 SOA RECO.
+Each distinct date text is parsed once and cached, with the column's format
+inferred from a sample instead of guessing row by row, and ages are bucketed
+with one vectorized cut.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Upper bounds (days) of the age buckets: 0-15, 16-30, 31-60, 61-90, 91-120, 121+
+DEFAULT_AGE_BUCKETS = [15, 30, 60, 90, 120]
+UNKNOWN_BUCKET = "Unknown"
+
+# Tried in order when inferring a column's format; day-first before month-first
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",  # Excel date cells read as text
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%d-%b-%Y",
+    "%d %b %Y",
+    "%d-%b-%y",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+]
+SAMPLE_SIZE = 500
+
+
+def parse_buckets(text):
+    """Parses '15, 30, 60' into increasing bucket bounds; raises ValueError on bad input."""
+    try:
+        bounds = [int(part) for part in str(text).replace(";", ",").split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"Age buckets must be whole numbers of days, e.g. 15, 30, 60 (got '{text}')")
+    if not bounds or any(b <= 0 for b in bounds) or bounds != sorted(set(bounds)):
+        raise ValueError(f"Age buckets must be increasing positive numbers of days (got '{text}')")
+    return bounds
+
+
+def bucket_labels(bounds):
+    """Returns the label of every bucket, e.g. ['0-15', '16-30', '31+'] for [15, 30]."""
+    labels = [f"0-{bounds[0]}"]
+    labels += [f"{low + 1}-{high}" for low, high in zip(bounds, bounds[1:])]
+    labels.append(f"{bounds[-1] + 1}+")
+    return labels
+
+
+def bucket_order(label):
+    """Sort key for bucket labels: '0-15', '16-30', '121+' by their first day, then Unknown and others."""
+    match = re.match(r"(\d+)", str(label))
+    return (0, int(match.group(1))) if match else (1, str(label))
+
+
+def age_buckets(days, bounds=None):
+    """Assigns every age in days to its bucket label (Unknown when missing)."""
+    bounds = bounds or DEFAULT_AGE_BUCKETS
+    labels = bucket_labels(bounds)
+    days = pd.Series(days, dtype=float)
+    # Future dates (negative ages) fall in the first bucket, like the day-0 rows
+    codes = np.searchsorted(np.asarray(bounds, dtype=float), days.to_numpy(), side="left")
+    result = np.asarray(labels + [UNKNOWN_BUCKET], dtype=object)[np.where(days.isna(), len(labels), codes)]
+    return pd.Series(result, index=days.index)
+
+
+def infer_date_format(texts):
+    """Returns the DATE_FORMATS entry that parses most of the sample, or None when none fits most of it."""
+    sample = pd.Series(texts, dtype=object).dropna().astype(str).str.strip()
+    sample = sample[sample != ""]
+    if sample.empty:
+        return None
+    sample = sample.iloc[:SAMPLE_SIZE]
+    best, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if count > best_count:
+            best, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best if best_count * 2 > len(sample) else None
+
+
+class DateParser:
+    """
+    Parses one date column. The format is inferred from the first values seen
+    and every distinct text is parsed once, so later chunks reuse the cache.
+    Texts the format does not fit fall back to ISO, then a day-first guess.
+    """
+
+    def __init__(self):
+        self.format = None
+        self._format_inferred = False
+        self._cache = {}  # text -> Timestamp (NaT when not a date)
+
+    def _parse_new(self, texts):
+        texts = pd.Series(texts, dtype=object)
+        stripped = texts.astype(str).str.strip()
+        if self.format:
+            parsed = pd.to_datetime(stripped, format=self.format, errors="coerce")
+        else:
+            parsed = pd.Series(pd.NaT, index=texts.index, dtype="datetime64[ns]")
+        missing = parsed.isna() & (stripped != "")
+        if missing.any():
+            # ISO dates must not go through the day-first guess ('2026-09-01' is 1 September)
+            iso = missing & stripped.str.match(r"^\d{4}-\d{1,2}-\d{1,2}")
+            if iso.any():
+                parsed[iso] = pd.to_datetime(stripped[iso].str[:10], format="%Y-%m-%d", errors="coerce")
+            rest = missing & ~iso
+            if rest.any():
+                parsed[rest] = pd.to_datetime(stripped[rest], errors="coerce", format="mixed", dayfirst=True)
+        self._cache.update(zip(texts.tolist(), parsed.tolist()))
+
+    def parse(self, values):
+        """Returns a datetime Series (NaT where a cell is blank or not a date)."""
+        values = pd.Series(values)
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Series(uniques, dtype=object)
+        if not self._format_inferred and len(uniques):
+            self.format = infer_date_format(uniques)
+            self._format_inferred = True
+        new = [text for text in uniques.tolist() if text not in self._cache]
+        if new:
+            self._parse_new(new)
+        parsed = pd.to_datetime(pd.Series([self._cache[text] for text in uniques.tolist()] + [pd.NaT], dtype=object))
+        result = parsed.take(codes).reset_index(drop=True)
+        result.index = values.index
+        return result
@@ -0,0 +1,754 @@
+# File: reco_utils/engine.py
+"""
+Reconciliation engine for Oi360 SOA RECO (no GUI dependencies).
+References are indexed once, then the SOA is matched one chunk at a time,
+so in-memory runs (a single chunk) and streaming runs share the same code.
+"""
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from reco_utils.normalize import KEY_COLUMN, DEFAULT_KEY_RULES, describe_match, is_composite, key_columns, match_keys
+from reco_utils.join import DEFAULT_DUPLICATE_POLICY, ReferenceIndex
+from reco_utils.amounts import (
+    DEFAULT_AMOUNT_TOLERANCE, parse_amounts, find_ref_amount_columns, amount_differences, compare_amounts,
+)
+from reco_utils.subset import WHOLE_FILE_GROUP, to_cents
+from reco_utils.dates import DEFAULT_AGE_BUCKETS, DateParser, age_buckets
+from reco_utils.profiling import StageProfiler
+from reco_utils.control import RunCancelled, RunControl
+from reco_utils.summary import RunSummary
+from reco_utils.runstate import (
+    ROW_ID_COLUMN, ROW_HASH_COLUMN, MATCH_PREFIX, MISMATCH_COLUMN, CHANGES_SHEET,
+    settings_fingerprint, frame_fingerprint, row_ids, row_hashes, state_columns, describe_changes,
+)
+
+# Columns whose name contains one of these words get the " 00:00:00" cleanup
+DATE_KEYWORDS = ['date', 'dt', 'dated']
+
+# How a row matched one reference; codes from MATCH_SUBSET up are split/combined labels
+MATCH_NONE, MATCH_EXACT, MATCH_FUZZY, MATCH_SUBSET = 0, 1, 2, 3
+
+
+def _ignore(*args):
+    pass
+
+
+def _match_labels(number):
+    """Match Source text of the fixed match codes of reference number."""
+    return ["", f"Ref{number}", f"Ref{number} (fuzzy)"]
+
+
+def _match_sources(codes, tables, length):
+    """
+    Builds Match Source from per-reference match codes (tables[i][code] is the
+    label). The codes of a row are packed into one integer, every distinct
+    combination is labelled once and the labels are taken by row.
+    Returns (labels, combinations as a code matrix, rows per combination).
+    """
+    if not codes:
+        return np.full(length, "", dtype=object), np.zeros((1, 0), dtype=np.int64), np.array([length])
+    radix = np.array([len(table) for table in tables], dtype=np.int64)
+    if np.prod(radix.astype(float)) < 2 ** 62:
+        weights = np.concatenate([[1], np.cumprod(radix[:-1])]).astype(np.int64)
+        packed = np.zeros(length, dtype=np.int64)
+        for code, weight in zip(codes, weights):
+            packed += code.astype(np.int64) * weight
+        row_combos, packed_combos = pd.factorize(packed)
+        combos = (np.asarray(packed_combos)[:, None] // weights) % radix
+    else:
+        combos, row_combos = np.unique(np.column_stack(codes), axis=0, return_inverse=True)
+        row_combos = row_combos.reshape(-1)
+    text = np.array([", ".join(table[c] for table, c in zip(tables, combo) if c) for combo in combos] + [""],
+                    dtype=object)
+    counts = np.bincount(row_combos, minlength=len(combos)) if len(combos) else np.zeros(0, dtype=np.int64)
+    return text[row_combos], combos, counts
+
+
+class RecoEngine:
+    """
+    Matches SOA rows against reference files.
+    ref_configs holds any number of (ref_df, match_col, return_cols, label[, duplicate_policy])
+    tuples, or None for an unused reference slot. ref_df may also be a zero-argument
+    callable that loads the frame, so file reads run on the reference pool too.
+    soa_match and every match_col are a column name, or a list of names matched
+    together as one composite key (the same number of columns everywhere).
+    status/progress/debug are callbacks for UI text, percent done and the debug log.
+    fuzzy_min_score turns on a fuzzy pass for keys with no exact match (None keeps it off).
+    subset_matcher (a SubsetMatcher) turns on split/combined payment matching by amount.
+    Composite keys are hashed, so they get no fuzzy pass or key-prefix grouping.
+    Ages are counted up to as_of_date (default today) and bucketed by the age_buckets day bounds.
+    Every stage is timed on profiler (a StageProfiler; a new one when not given).
+    control (a RunControl) pauses or cancels the run between stages and chunks;
+    a cancelled run() returns the chunks finished so far.
+    """
+
+    def __init__(self, soa_match, soa_date_col, soa_amount_col, ref_configs, key_rules=None,
+                 amount_tolerance=DEFAULT_AMOUNT_TOLERANCE, status=None, progress=None, debug=None,
+                 max_workers=None, fuzzy_min_score=None, subset_matcher=None, age_buckets=None,
+                 as_of_date=None, profiler=None, control=None):
+        self.soa_match = soa_match
+        self.soa_date_col = soa_date_col
+        self.soa_amount_col = soa_amount_col
+        self.ref_configs = ref_configs
+        self.key_rules = key_rules if key_rules is not None else DEFAULT_KEY_RULES
+        self.amount_tolerance = amount_tolerance
+        self.status = status or _ignore
+        self.progress = progress or _ignore
+        self.debug = debug or _ignore
+        self.max_workers = max_workers or os.cpu_count() or 1  # Threads for loading/indexing references
+        self.fuzzy_min_score = fuzzy_min_score  # Lowest fuzzy score (0-100) accepted as a match
+        self.subset_matcher = subset_matcher
+        self.composite = is_composite(soa_match)
+        if self.composite and fuzzy_min_score is not None:
+            self.status("[WARNING] Fuzzy matching needs a single match column - skipped for the composite key")
+            self.fuzzy_min_score = None
+        if self.composite and subset_matcher is not None and not subset_matcher.group_columns \
+                and subset_matcher.key_prefix:
+            self.status("[WARNING] Split/combined matching cannot group by key prefix on a composite key - skipped")
+            self.subset_matcher = None
+        self._subset_pools = {}  # ref number -> reference rows available to split/combined matching
+        self.as_of_date = pd.Timestamp(as_of_date if as_of_date is not None else datetime.date.today()).normalize()
+        self.age_buckets = age_buckets or DEFAULT_AGE_BUCKETS
+        self.date_parser = DateParser()  # Keeps its format and parsed dates across chunks
+        self.profiler = profiler or StageProfiler()
+        self.control = control or RunControl()
+        self.cancelled = False  # Set when the last run stopped at a cancel checkpoint
+        self.references = []  # (ref number, ReferenceIndex)
+        self.ref_fingerprints = None  # ref number -> content fingerprint, collected when a dict
+        self._skip_fingerprints = {}  # ref number -> fingerprint of a reference that need not be indexed
+        self.ref_amount_cols = []
+        self.mismatch_count = 0
+        self.fuzzy_count = 0
+        self.subset_count = 0
+        self.subset_timeouts = {}  # ref number -> {group: split/combined searches that ran out of time}
+        self.match_counts = {}  # ref number -> {"exact": rows, "fuzzy": rows, "subset": rows}
+        self.matched_rows = 0  # SOA rows matched in at least one reference
+        self.counted_rows = 0
+        self.summary = RunSummary(soa_amount_col, amount_tolerance)  # Aging / mismatch sheets of the last run
+        self._age_failed = False
+        self._step = 0
+        self._total_steps = 1
+        self._last_percent = -1
+
+    # --- Stage 1: load and index every reference once, concurrently ---
+    def _prepare_reference(self, idx, config):
+        ref_df, match_col, return_cols = config[:3]
+        policy = config[4] if len(config) > 4 else DEFAULT_DUPLICATE_POLICY
+        self.control.checkpoint()
+        try:
+            if callable(ref_df):
+                with self.profiler.stage("load"):
+                    ref_df = ref_df()  # Deferred load, so reading the file also runs on the pool
+            if len(key_columns(match_col)) != len(key_columns(self.soa_match)):
+                raise ValueError(f"matches on {len(key_columns(match_col))} column(s) but the SOA "
+                                 f"matches on {len(key_columns(self.soa_match))}")
+            if self.ref_fingerprints is not None:
+                with self.profiler.stage("run state"):
+                    columns = list(dict.fromkeys(key_columns(match_col) + list(return_cols)))
+                    fingerprint = frame_fingerprint(ref_df[columns])
+                self.ref_fingerprints[idx + 1] = fingerprint
+                if self._skip_fingerprints.get(idx + 1) == fingerprint:
+                    return None  # Unchanged and no row needs it this run
+            self.status(f"Matching Ref{idx+1} | Match = {describe_match(match_col)} | Returns = {', '.join(return_cols)}")
+            # Normalize the reference key once per input (ref_df itself is left untouched)
+            with self.profiler.stage("normalize"):
+                ref_keys = match_keys(ref_df, match_col, self.key_rules)
+            with self.profiler.stage("index"):
+                ref_extract = ref_df[return_cols].copy()
+                ref_extract.columns = [f"Ref{idx+1}_{col}" for col in return_cols]
+                ref_index = ReferenceIndex(ref_keys, ref_extract, policy)
+                if self.fuzzy_min_score is not None:
+                    ref_index.build_fuzzy_index()
+                if self.subset_matcher is not None:
+                    self._subset_pools[idx + 1] = self._subset_pool(idx + 1, ref_df, ref_keys, return_cols)
+            warning = ref_index.describe_duplicates(f"Ref{idx+1}")
+            if warning:
+                self.debug(warning)
+                self.status(warning)
+            return (idx + 1, ref_index)
+        except Exception as e:
+            self.debug(f"Match Error Ref{idx+1}: {str(e)}")
+            self.status(f"Error matching Ref{idx+1}: {str(e)}")
+            if self.ref_fingerprints is not None:
+                self.ref_fingerprints.pop(idx + 1, None)  # Counts as not loaded
+            return None
+
+    def prepare_references(self):
+        configs = [(idx, config) for idx, config in enumerate(self.ref_configs) if config is not None]
+        workers = min(len(configs), self.max_workers)
+        if workers <= 1:
+            prepared = [self._prepare_reference(idx, config) for idx, config in configs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                prepared = list(pool.map(lambda item: self._prepare_reference(*item), configs))
+        self.references = [ref for ref in prepared if ref is not None]
+
+    # --- Stage 2: match one block of SOA rows ---
+    def _add_age_columns(self, df_result):
+        if not self.soa_date_col or self.soa_date_col not in df_result.columns or self._age_failed:
+            return df_result
+        try:
+            # Convert to datetime for age calculation; the date column itself keeps the user's format
+            temp_dates = self.date_parser.parse(df_result[self.soa_date_col])
+            df_result['Age (Days)'] = (self.as_of_date - temp_dates).dt.days
+            df_result.insert(0, 'Age Bucket', age_buckets(df_result['Age (Days)'], self.age_buckets))
+        except Exception as e:
+            # Carry on without age columns rather than abandoning the whole run
+            self._age_failed = True
+            self.status(f"[WARNING] Age Bucket Error: {str(e)}")
+            self.debug(f"Age Bucket Error: {str(e)}")
+            df_result = df_result.drop(columns=['Age (Days)', 'Age Bucket'], errors='ignore')
+        return df_result
+
+    def _subset_pool(self, number, ref_df, ref_keys, return_cols):
+        """Collects the reference rows (not collapsed by key) that split/combined matching may use."""
+        amount_cols = [col for col in return_cols if find_ref_amount_columns([f"Ref{number}_{col}"])]
+        group_columns = self.subset_matcher.group_columns
+        if not amount_cols:
+            self.status(f"[WARNING] Ref{number}: no amount column returned - split/combined matching skipped")
+            return None
+        if group_columns and group_columns[1] not in ref_df.columns:
+            self.status(f"[WARNING] Ref{number}: group column '{group_columns[1]}' not found - split/combined matching skipped")
+            return None
+        group_values = ref_df[group_columns[1]] if group_columns else None
+        cents, usable = to_cents(parse_amounts(ref_df[amount_cols[0]]))
+        keys = ref_keys.to_numpy(dtype=object, na_value=None)
+        return {
+            # Rows without a key (or with a hashed composite one) are shown by their sheet row number (header is row 1)
+            "labels": [key if key is not None and not self.composite else f"row {i + 2}"
+                       for i, key in enumerate(keys)],
+            "keys": keys,
+            "groups": self.subset_matcher.group_labels(ref_keys, group_values),
+            "cents": cents,
+            "usable": usable,  # Cleared once a row is used, so no row is paid twice across chunks
+        }
+
+    def _subset_pass(self, number, ref_index, df_result, positions):
+        """
+        Matches SOA rows without a key match in this reference by amount:
+        one SOA line against several reference rows ("sum of"), or several SOA
+        lines against one reference row ("combined").
+        Returns the Ref{n}_Combination column and a Match Source label per row (or None).
+        """
+        pool = self._subset_pools[number]
+        combination = np.full(len(df_result), None, dtype=object)
+        labels = np.full(len(df_result), None, dtype=object)
+        matcher = self.subset_matcher
+        soa_keys = df_result[KEY_COLUMN]
+        group_columns = matcher.group_columns
+        if group_columns and group_columns[0] not in df_result.columns:
+            return combination, labels
+        soa_groups = matcher.group_labels(soa_keys, df_result[group_columns[0]] if group_columns else None)
+        soa_cents, soa_usable = to_cents(parse_amounts(df_result[self.soa_amount_col]))
+        soa_usable &= positions < 0
+        # Reference rows whose key matched an SOA line outright are already accounted for
+        matched_keys = ref_index.index.take(positions[positions >= 0])
+        ref_usable = pool["usable"] & ~pd.Series(pool["keys"]).isin(matched_keys).to_numpy()
+        tolerance = int(round(self.amount_tolerance * 100))
+
+        split, split_timed_out = matcher.match(soa_groups, (soa_cents, soa_usable), pool["groups"],
+                                               (pool["cents"], ref_usable), tolerance)
+        for row, ref_rows in split.items():
+            soa_usable[row] = False
+            ref_usable[ref_rows] = False
+            combination[row] = " + ".join(pool["labels"][r] for r in ref_rows)
+            labels[row] = f"Ref{number} (sum of {len(ref_rows)} rows)"
+        combined, combined_timed_out = matcher.match(pool["groups"], (pool["cents"], ref_usable), soa_groups,
+                                                     (soa_cents, soa_usable), tolerance)
+        for ref_row, rows in combined.items():
+            ref_usable[ref_row] = False
+            combination[rows] = pool["labels"][ref_row]
+            labels[rows] = f"Ref{number} (combined {len(rows)} lines)"
+
+        used = [r for ref_rows in split.values() for r in ref_rows] + list(combined)
+        pool["usable"][used] = False
+        self.subset_count += len(split) + sum(len(rows) for rows in combined.values())
+        timed_out = self.subset_timeouts.setdefault(number, {})
+        for group, searches in list(split_timed_out.items()) + list(combined_timed_out.items()):
+            timed_out[group] = timed_out.get(group, 0) + searches
+        return combination, labels
+
+    def _fuzzy_pass(self, number, ref_index, keys, positions):
+        """
+        Looks up keys left unmatched by the exact join in the fuzzy index.
+        Returns the updated positions, a mask of fuzzy matches and the
+        Ref{n}_Fuzzy Key / Ref{n}_Fuzzy Score columns (blank unless fuzzy matched).
+        """
+        unmatched = (positions < 0) & keys.notna().to_numpy()
+        scores = np.full(len(positions), np.nan)
+        if unmatched.any():
+            fuzzy_positions, fuzzy_scores = ref_index.fuzzy_lookup(keys[unmatched], self.fuzzy_min_score)
+            positions = positions.copy()
+            positions[unmatched] = fuzzy_positions
+            scores[unmatched] = fuzzy_scores
+        fuzzy_mask = ~np.isnan(scores)
+        matched_keys = np.full(len(positions), None, dtype=object)
+        matched_keys[fuzzy_mask] = ref_index.index.take(positions[fuzzy_mask])
+        fuzzy_columns = pd.DataFrame({
+            f"Ref{number}_Fuzzy Key": matched_keys,
+            f"Ref{number}_Fuzzy Score": scores,
+        })
+        self.fuzzy_count += int(fuzzy_mask.sum())
+        return positions, fuzzy_mask, fuzzy_columns
+
+    def _advance(self, rows):
+        """Moves progress on by rows; emits only when the whole percent changes."""
+        self._step += rows
+        percent = min(int((self._step / self._total_steps) * 100), 100)
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self.progress(percent)
+
+    def _match_reference(self, number, ref_index, df_result, subset_enabled):
+        """
+        Looks up one reference for every row of df_result (which carries the key column).
+        Returns the reference's result columns, its match code per row (MATCH_NONE ...)
+        and the Match Source label of every code.
+        """
+        stage = self.profiler.stage
+        # One lookup per SOA row keeps the row count unchanged
+        with stage("join"):
+            positions = ref_index.lookup(df_result[KEY_COLUMN])
+        fuzzy_mask = np.zeros(len(positions), dtype=bool)
+        if self.fuzzy_min_score is not None:
+            with stage("fuzzy"):
+                positions, fuzzy_mask, fuzzy_columns = self._fuzzy_pass(
+                    number, ref_index, df_result[KEY_COLUMN], positions
+                )
+        codes = np.full(len(positions), MATCH_NONE, dtype=np.int16)
+        table = _match_labels(number)
+        with stage("join"):
+            joined = ref_index.take(positions)
+            if self.fuzzy_min_score is not None:
+                joined = pd.concat([joined, fuzzy_columns], axis=1)
+        if subset_enabled and self._subset_pools.get(number) is not None:
+            with stage("subset"):
+                combination, subset_labels = self._subset_pass(number, ref_index, df_result, positions)
+                joined[f"Ref{number}_Combination"] = combination
+                found = pd.notna(subset_labels)
+                if found.any():
+                    subset_table, subset_codes = np.unique(subset_labels[found].astype(str), return_inverse=True)
+                    codes[found] = MATCH_SUBSET + subset_codes.reshape(-1)
+                    table = table + subset_table.tolist()
+        with stage("join"):
+            joined.index = df_result.index
+            codes[positions >= 0] = MATCH_EXACT
+            codes[fuzzy_mask] = MATCH_FUZZY
+            if number > 1:
+                joined[f"Separator{number}"] = ""
+        return joined, codes, table
+
+    def _clean_dates(self, df_result, columns=None):
+        """Removes the time portion (00:00:00) from date strings, in place."""
+        for col in df_result.columns if columns is None else columns:
+            if any(kw in col.lower() for kw in DATE_KEYWORDS):
+                try:
+                    values = df_result[col]
+                    cleaned = values.astype(str).str.replace(r'\s+00:00:00$', '', regex=True)
+                    # Missing cells become blanks whatever the column type shows them as (nan, <NA>, NaT)
+                    df_result[col] = cleaned.where(values.notna(), '').replace(['nan', 'NaT'], '')
+                except Exception as e:
+                    self.debug(f"Date cleanup error for column {col}: {str(e)}")
+
+    def _compare_amounts(self, df_result, keep_state=False, summary=None):
+        """
+        Adds Amount Difference (and the per-row mismatch count with keep_state); returns the mismatches.
+        The rows are also added to summary, if given, reusing the parsed amounts.
+        """
+        soa_amt_col = self.soa_amount_col
+        self.ref_amount_cols = find_ref_amount_columns(df_result.columns)
+        if not (soa_amt_col and soa_amt_col in df_result.columns and self.ref_amount_cols):
+            if summary is not None:
+                with self.profiler.stage("summary"):
+                    summary.add(df_result)
+            return 0
+        with self.profiler.stage("amount compare"):
+            differences = amount_differences(df_result, soa_amt_col, self.ref_amount_cols)
+            mismatch_masks, amount_diff_data = compare_amounts(
+                df_result, soa_amt_col, self.ref_amount_cols, self.amount_tolerance, differences
+            )
+            df_result['Amount Difference'] = amount_diff_data
+            mismatches = np.zeros(len(df_result), dtype=np.int64)
+            for mask in mismatch_masks.values():
+                mismatches += mask
+            if keep_state:
+                df_result[MISMATCH_COLUMN] = mismatches
+        if summary is not None:
+            with self.profiler.stage("summary"):
+                summary.add(df_result, differences)
+        return int(mismatches.sum())
+
+    def reconcile_chunk(self, soa_chunk, keep_state=False, keep_key=False):
+        """
+        Returns the result rows for one block of SOA rows (same row count and order).
+        keep_state also keeps the key, per-reference match codes and mismatch counts
+        in hidden columns for the run-state store; keep_key keeps just the key.
+        Without keep_state the rows are added to self.summary.
+        """
+        stage = self.profiler.stage
+        with stage("dates"):
+            df_result = self._add_age_columns(soa_chunk.copy())
+        self.control.checkpoint()
+
+        # Normalize the SOA match key once; every later stage reuses this column
+        with stage("normalize"):
+            df_result[KEY_COLUMN] = match_keys(df_result, self.soa_match, self.key_rules)
+        subset_enabled = self.subset_matcher is not None and self.soa_amount_col in df_result.columns
+
+        # Look up every reference first, then attach all returned columns in one combined join
+        parts = [df_result]
+        codes, tables = {}, {}
+        for number, ref_index in self.references:
+            self.control.checkpoint()
+            try:
+                joined, codes[number], tables[number] = self._match_reference(
+                    number, ref_index, df_result, subset_enabled
+                )
+                parts.append(joined)
+                self._advance(len(df_result))
+            except Exception as e:
+                self.debug(f"Match Error Ref{number}: {str(e)}")
+                self.status(f"Error matching Ref{number}: {str(e)}")
+        self.control.checkpoint()
+        with stage("join"):
+            df_result = pd.concat(parts, axis=1)
+            df_result["Match Source"] = self._count_matches(codes, tables, len(df_result))
+            if keep_state:
+                for number, ref_codes in codes.items():
+                    df_result[f"{MATCH_PREFIX}{number}"] = ref_codes
+            elif not keep_key:
+                df_result = df_result.drop(columns=[KEY_COLUMN])
+
+        # Clean up date columns - remove time portion (00:00:00) from date strings
+        with stage("date cleanup"):
+            self._clean_dates(df_result)
+
+        # Amount comparison against every returned reference amount column
+        self.mismatch_count += self._compare_amounts(df_result, keep_state, None if keep_state else self.summary)
+        return df_result
+
+    # --- Full run ---
+    def _begin(self, total_steps):
+        if self.soa_date_col:
+            self.status(f"Ageing as of {self.as_of_date:%d/%m/%Y}")
+        self.status("Starting reconciliation...")
+        self._step = 0
+        self._last_percent = -1
+        self._total_steps = max(total_steps, 1)
+        self.mismatch_count = 0
+        self.fuzzy_count = 0
+        self.subset_count = 0
+        self.subset_timeouts = {}  # ref number -> {group: split/combined searches that ran out of time}
+        self.match_counts = {}
+        self.matched_rows = 0
+        self.counted_rows = 0
+        self.summary = RunSummary(self.soa_amount_col, self.amount_tolerance)
+
+    def _write_summary(self, writer):
+        """Adds the aging and mismatch summary sheets of the run to writer."""
+        with self.profiler.stage("export"):
+            for sheet_name, table in self.summary.sheets():
+                writer.add_sheet(sheet_name, table)
+
+    def _finish(self):
+        if self.soa_date_col and not self._age_failed:
+            self.debug(f"Age: date format for '{self.soa_date_col}' = {self.date_parser.format or 'mixed'}, as of {self.as_of_date:%Y-%m-%d}")
+        self.status("Reconciliation Complete")
+        self.progress(100)
+        if self.fuzzy_min_score is not None:
+            self.status(f"Fuzzy matching: {self.fuzzy_count} row match(es) with score >= {self.fuzzy_min_score}")
+        if self.subset_matcher is not None:
+            self.status(f"Split/combined payments: {self.subset_count} SOA line(s) matched by amount")
+            self._report_subset_timeouts()
+        self._report_matches()
+        self._report_amounts()
+
+    def _stopped(self, rows):
+        self.cancelled = True
+        self.status(f"[CANCELLED] Run stopped after {rows} finished row(s)")
+        self._report_matches()
+        if self.subset_matcher is not None:
+            self._report_subset_timeouts()
+
+    def _report_subset_timeouts(self):
+        """Names the groups where split/combined searches ran out of time (their rows may still have a match)."""
+        for number, groups in sorted(self.subset_timeouts.items()):
+            if not groups:
+                continue
+            names = sorted("whole file" if group == WHOLE_FILE_GROUP else str(group) for group in groups)
+            shown = ", ".join(names[:5]) + (f" and {len(names) - 5} more" if len(names) > 5 else "")
+            self.status(f"[WARNING] Ref{number}: split/combined search ran out of time for "
+                        f"{sum(groups.values())} row(s) in {len(groups)} group(s): {shown}")
+            self.debug(f"Ref{number} split/combined timeouts by group: "
+                       + ", ".join(f"{group}={groups[group]}" for group in sorted(groups, key=str)))
+
+    def run(self, soa_chunks, writer=None, total_rows=None, keep_result=True, recorder=None):
+        """
+        Matches every SOA chunk and hands each finished chunk to writer and to
+        recorder (a resultsdb.RunRecorder), if given; writer also gets the summary
+        sheets once the chunks are done.
+        Returns the combined result frame, or None when keep_result is False.
+        When cancelled, stops at the next checkpoint and returns (and has written)
+        only the chunks finished so far; self.cancelled tells the two apart.
+        """
+        self.cancelled = False
+        results = []
+        try:
+            self.prepare_references()
+            self._begin(len(self.references) * (total_rows or 0))
+            chunks = iter(soa_chunks)
+            while True:
+                self.control.checkpoint()
+                with self.profiler.stage("load"):
+                    soa_chunk = next(chunks, None)  # Streaming runs read the file here
+                if soa_chunk is None:
+                    break
+                df_chunk = self.reconcile_chunk(soa_chunk, keep_key=recorder is not None)
+                self.profiler.rows += len(df_chunk)
+                if recorder is not None:
+                    keys = df_chunk.pop(KEY_COLUMN)
+                    with self.profiler.stage("results db"):
+                        recorder.write(df_chunk, keys)
+                if writer is not None:
+                    with self.profiler.stage("export"):
+                        writer.write(df_chunk)
+                if keep_result:
+                    results.append(df_chunk)
+        except RunCancelled:
+            self._stopped(self.profiler.rows)
+        else:
+            self._finish()
+        if writer is not None and (self.summary.rows or not self.cancelled):
+            self._write_summary(writer)  # Of the finished rows when cancelled (none when nothing finished)
+        if not keep_result:
+            return None
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+    # --- Incremental re-run of a statement that was reconciled before ---
+    def _settings(self, soa_columns):
+        """Everything besides the data that shapes the result; a change forces a full run."""
+        references = []
+        for config in self.ref_configs:
+            if config is None:
+                references.append(None)
+            else:
+                policy = config[4] if len(config) > 4 else DEFAULT_DUPLICATE_POLICY
+                references.append([config[1], list(config[2]), policy])
+        matcher = self.subset_matcher
+        subset = None if matcher is None else [matcher.max_size, matcher.key_prefix, matcher.group_columns,
+                                               matcher.search_seconds]
+        return settings_fingerprint({
+            "soa": [self.soa_match, self.soa_date_col, self.soa_amount_col, list(soa_columns)],
+            "references": references,
+            "key_rules": [list(rule) for rule in self.key_rules],
+            "amount_tolerance": self.amount_tolerance,
+            "fuzzy_min_score": self.fuzzy_min_score,
+            "subset": subset,
+            "age_buckets": list(self.age_buckets),
+            "as_of": self.as_of_date.isoformat(),
+        })
+
+    def run_incremental(self, soa_df, store, identity, writer=None, recorder=None, chunk_rows=None):
+        """
+        Reconciles a whole in-memory SOA, reusing the stored result of the last
+        run of the same statement (identity, see runstate.soa_identity): only added
+        or changed rows are matched (chunk_rows at a time, all at once when None),
+        and unchanged rows only against references whose content changed. Saves
+        this run for next time. The result also goes to writer and recorder
+        (a resultsdb.RunRecorder) when given.
+        Returns (result, changes); changes is None when there was no previous run.
+        A cancelled run keeps the stored state as it was and returns (and has
+        written) only the rows finished so far, in statement order; nothing at all
+        when it stopped before the first chunk was finished.
+        """
+        try:
+            return self._run_incremental(soa_df, store, identity, writer, recorder, chunk_rows)
+        except RunCancelled:
+            self._stopped(0)
+            return pd.DataFrame(), None
+
+    def _run_incremental(self, soa_df, store, identity, writer, recorder, chunk_rows=None):
+        self.cancelled = False
+        stage = self.profiler.stage
+        soa_df = soa_df.reset_index(drop=True)
+        with stage("run state"):
+            settings = self._settings(soa_df.columns)
+            previous = store.load(identity)
+            ids = row_ids(match_keys(soa_df, self.soa_match, self.key_rules))
+            hashes = row_hashes(soa_df)
+        reused = np.zeros(len(soa_df), dtype=bool)
+        positions = np.full(len(soa_df), -1, dtype=np.int64)
+        reason = "first run of this statement"
+        if previous is not None:
+            meta, prev_frame = previous
+            with stage("run state"):
+                # Plain object ids: positional lookups on them are far faster than on Arrow strings
+                positions = pd.Index(prev_frame[ROW_ID_COLUMN].to_numpy(dtype=object)).get_indexer(ids.to_numpy())
+            if meta["settings"] != settings:
+                reason = "settings changed since the last run"
+            elif self.subset_matcher is not None:
+                reason = "split/combined payment matching spans rows"
+            elif any((prev_frame[col].to_numpy() >= MATCH_SUBSET).any()
+                     for col in prev_frame.columns if str(col).startswith(MATCH_PREFIX)):
+                # Their labels were only known to that run, so stored split/combined codes cannot be reused
+                reason = "the last run matched split/combined payments"
+            else:
+                found = positions >= 0
+                reused[found] = prev_frame[ROW_HASH_COLUMN].to_numpy()[positions[found]] == hashes[found]
+        recompute = np.flatnonzero(~reused)
+        kept_rows = np.flatnonzero(reused)
+
+        # References are fingerprinted while they load; with no rows to recompute,
+        # unchanged references are not indexed at all
+        self.ref_fingerprints = {}
+        if reused.any() and not len(recompute):
+            self._skip_fingerprints = {int(n): fp for n, fp in previous[0]["references"].items()}
+        self.prepare_references()
+        self._skip_fingerprints = {}
+        configured = sum(config is not None for config in self.ref_configs)
+        if reused.any() and len(self.ref_fingerprints) < configured:
+            # A reference failed: its old columns cannot be trusted, so start over
+            reason = "a reference could not be loaded"
+            reused[:] = False
+            recompute, kept_rows = np.arange(len(soa_df)), kept_rows[:0]
+            if len(self.references) < len(self.ref_fingerprints):
+                self.prepare_references()
+        old_fingerprints = previous[0]["references"] if reused.any() else {}
+        changed_refs = [(number, ref_index) for number, ref_index in self.references
+                        if old_fingerprints.get(str(number)) != self.ref_fingerprints.get(number)]
+
+        if reused.any():
+            self.status(f"Incremental run: {len(kept_rows)} unchanged row(s) reused, {len(recompute)} to reconcile, "
+                        f"{len(changed_refs)} reference(s) changed")
+        else:
+            self.status(f"Full run: {reason}")
+        self._begin(len(recompute) * len(self.references) + len(kept_rows) * len(changed_refs))
+
+        # Rows are matched in slices so a cancel can stop between them and keep the finished ones
+        # (split/combined payments can span any rows, so they are matched in one go)
+        step = len(recompute) if chunk_rows is None or self.subset_matcher is not None else chunk_rows
+        parts, order = [], []
+        cancelled = False
+        try:
+            for start in range(0, len(recompute), max(step, 1)):
+                rows = recompute[start:start + step]
+                parts.append(self.reconcile_chunk(soa_df.iloc[rows], keep_state=True))
+                order.append(rows)
+            if len(kept_rows):
+                kept = prev_frame.iloc[positions[kept_rows]].reset_index(drop=True)
+                self.mismatch_count += self._refresh_references(kept, changed_refs)
+                parts.append(kept)
+                order.append(kept_rows)
+            self.control.checkpoint()  # Last chance to stop before the state is replaced
+        except RunCancelled:
+            if not parts:
+                raise
+            cancelled = True
+        with stage("join"):
+            result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=soa_df.columns)
+            if len(parts) > 1:
+                result = result[parts[0].columns]
+            if order:
+                result = result.iloc[np.argsort(np.concatenate(order), kind="stable")].reset_index(drop=True)
+            if not cancelled:
+                result[ROW_ID_COLUMN] = ids.to_numpy()
+                result[ROW_HASH_COLUMN] = hashes
+        self.profiler.rows += len(result)
+
+        changes = None
+        if cancelled:
+            self._stopped(len(result))
+        else:
+            self._finish()
+            with stage("run state"):
+                if previous is not None:
+                    changes = describe_changes(previous[1], result, soa_df.columns, positions)
+                    self.status(f"What changed since the last run: {len(changes)} row(s)")
+                try:
+                    store.save(identity, settings, self.ref_fingerprints, result)
+                except Exception as e:
+                    self.debug(f"Run state save error: {str(e)}")
+        keys = result[KEY_COLUMN]
+        result = result.drop(columns=state_columns(result.columns))
+        with stage("summary"):
+            self.summary.add(result)
+        if recorder is not None:
+            with stage("results db"):
+                recorder.write(result, keys)
+        if writer is not None:
+            with stage("export"):
+                writer.write(result)
+                if changes is not None:
+                    writer.add_sheet(CHANGES_SHEET, changes)
+            self._write_summary(writer)
+        return result, changes
+
+    def _refresh_references(self, kept, changed_refs):
+        """
+        Re-matches reused rows (with their hidden state columns) against the
+        references that changed, in place. Returns the rows' amount mismatches.
+        """
+        for number, ref_index in changed_refs:
+            self.control.checkpoint()
+            try:
+                joined, codes, _ = self._match_reference(number, ref_index, kept, False)
+                for col in joined.columns:
+                    kept[col] = joined[col].to_numpy()
+                kept[f"{MATCH_PREFIX}{number}"] = codes
+                with self.profiler.stage("date cleanup"):
+                    self._clean_dates(kept, joined.columns)
+                self._advance(len(kept))
+            except Exception as e:
+                self.debug(f"Match Error Ref{number}: {str(e)}")
+                self.status(f"Error matching Ref{number}: {str(e)}")
+        with self.profiler.stage("join"):
+            # Stored codes of every reference, skipped ones included (states with split/combined codes are not reused)
+            numbers = sorted(int(col[len(MATCH_PREFIX):]) for col in kept.columns if col.startswith(MATCH_PREFIX))
+            codes = {number: kept[f"{MATCH_PREFIX}{number}"].to_numpy(dtype=np.int16) for number in numbers}
+            sources = self._count_matches(codes, {number: _match_labels(number) for number in numbers}, len(kept))
+            if changed_refs:
+                kept["Match Source"] = sources
+        if not changed_refs:
+            self.ref_amount_cols = find_ref_amount_columns(kept.columns)
+            return int(kept[MISMATCH_COLUMN].sum()) if MISMATCH_COLUMN in kept.columns else 0
+        return self._compare_amounts(kept, keep_state=True)
+
+    def _count_matches(self, codes, tables, length):
+        """Returns Match Source for per-reference codes and adds the rows to the match counts."""
+        numbers = list(codes)
+        sources, combos, rows = _match_sources([codes[n] for n in numbers], [tables[n] for n in numbers], length)
+        # Counted per distinct combination, not per row
+        for column, number in enumerate(numbers):
+            counts = self.match_counts.setdefault(number, {"exact": 0, "fuzzy": 0, "subset": 0})
+            kinds = combos[:, column]
+            counts["exact"] += int(rows[kinds == MATCH_EXACT].sum())
+            counts["fuzzy"] += int(rows[kinds == MATCH_FUZZY].sum())
+            counts["subset"] += int(rows[kinds >= MATCH_SUBSET].sum())
+        self.matched_rows += int(rows[(combos != MATCH_NONE).any(axis=1)].sum()) if numbers else 0
+        self.counted_rows += length
+        return sources
+
+    def _report_matches(self):
+        for number, counts in sorted(self.match_counts.items()):
+            extra = [f"{counts[kind]} {name}" for kind, name in (("fuzzy", "fuzzy"), ("subset", "split/combined"))
+                     if counts[kind]]
+            total = counts["exact"] + counts["fuzzy"] + counts["subset"]
+            self.status(f"Ref{number}: {total} row(s) matched" + (f" ({', '.join(extra)})" if extra else ""))
+        if self.match_counts:
+            self.status(f"Matched in at least one reference: {self.matched_rows} of {self.counted_rows} row(s)")
+
+    def _report_amounts(self):
+        soa_amt_col = self.soa_amount_col
+        if soa_amt_col and self.ref_amount_cols:
+            self.debug(f"Amount Highlighting: SOA column = {soa_amt_col}, Ref columns = {self.ref_amount_cols}, tolerance = {self.amount_tolerance}")
+            self.status(f"Amount comparison: {len(self.ref_amount_cols)} ref column(s) checked, {self.mismatch_count} mismatches highlighted")
+        elif soa_amt_col:
+            self.debug(f"Amount Highlighting: No matching Ref amount columns found. SOA col = {soa_amt_col}")
+            self.status(f"Amount comparison: No Ref amount columns detected for comparison with '{soa_amt_col}'")
+        else:
+            self.debug(f"Amount Highlighting SKIPPED: No SOA amount column selected")
+            self.status(f"Amount comparison: No amount column selected for comparison")
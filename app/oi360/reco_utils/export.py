@@ -0,0 +1,200 @@
+# File: reco_utils/export.py
+"""
+Result export for Oi360 SOA RECO.
+Streams result rows through xlsxwriter in constant_memory mode (or to CSV /
+Parquet) and highlights amount mismatches with one conditional-format rule
+per column.
+"""
+import os
+
+import pandas as pd
+import xlsxwriter
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from xlsxwriter.utility import xl_rowcol_to_cell
+
+from reco_utils.amounts import DEFAULT_AMOUNT_TOLERANCE, find_ref_amount_columns
+
+# Excel worksheets hold 1,048,576 rows including the header
+MAX_EXCEL_ROWS = 1048575
+
+HEADER_FORMAT = {
+    'bold': True,
+    'text_wrap': True,
+    'valign': 'top',
+    'fg_color': '#404040',
+    'font_color': '#FFFFFF',
+    'border': 1
+}
+MISMATCH_FORMAT = {
+    'bg_color': '#FFC7CE',  # Light red
+    'font_color': '#9C0006'  # Dark red text
+}
+
+
+def _column_cells(worksheet, series):
+    """
+    Converts one column to plain Python values in bulk and picks the typed
+    xlsxwriter method for it (blank cells become None and are skipped).
+    """
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        values = series.astype(float).tolist()
+        return [None if v != v else v for v in values], worksheet.write_number
+    values = series.astype(object).where(series.notna(), None).tolist()
+    return [v if v is None or isinstance(v, str) else str(v) for v in values], worksheet.write_string
+
+
+def _amount_formula(cell):
+    # Same cleanup as parse_amounts: drop thousands separators and currency signs
+    return f'VALUE(SUBSTITUTE(SUBSTITUTE({cell},",",""),"$",""))'
+
+
+def _add_mismatch_formats(workbook, worksheet, columns, last_row, soa_amount_col, ref_amount_cols, tolerance):
+    """Adds one conditional format rule per amount column over rows 1..last_row."""
+    if not (soa_amount_col and ref_amount_cols and last_row):
+        return
+    mismatch_format = workbook.add_format(MISMATCH_FORMAT)
+    soa_idx = columns.index(soa_amount_col)
+    soa_cell = xl_rowcol_to_cell(1, soa_idx, col_abs=True)
+    checks = []
+    for ref_col in ref_amount_cols:
+        ref_idx = columns.index(ref_col)
+        ref_cell = xl_rowcol_to_cell(1, ref_idx, col_abs=True)
+        check = f'IFERROR(ABS({_amount_formula(soa_cell)}-{_amount_formula(ref_cell)})>{tolerance},FALSE)'
+        checks.append(check)
+        worksheet.conditional_format(1, ref_idx, last_row, ref_idx, {
+            'type': 'formula', 'criteria': f'={check}', 'format': mismatch_format
+        })
+    worksheet.conditional_format(1, soa_idx, last_row, soa_idx, {
+        'type': 'formula', 'criteria': f'=OR({",".join(checks)})', 'format': mismatch_format
+    })
+
+
+def _write_rows(worksheet, df, first_row):
+    """Writes df below the header starting at first_row (constant_memory needs row-major order)."""
+    cells = [_column_cells(worksheet, df.iloc[:, i]) for i in range(df.shape[1])]
+    values = [column for column, _ in cells]
+    writers = list(enumerate(writer for _, writer in cells))
+    for row_idx, row in enumerate(zip(*values), start=first_row):
+        for col_idx, write in writers:
+            value = row[col_idx]
+            if value is not None:
+                write(row_idx, col_idx, value)
+
+
+def write_sheet(workbook, sheet_name, df, soa_amount_col=None, ref_amount_cols=(), tolerance=DEFAULT_AMOUNT_TOLERANCE):
+    """
+    Writes df to a new worksheet row by row from bulk-converted columns.
+    When an SOA amount column is given, each amount column gets one conditional
+    format rule that flags differences above the tolerance.
+    """
+    if len(df) > MAX_EXCEL_ROWS:
+        raise ValueError(f"{len(df)} rows do not fit in one Excel sheet (max {MAX_EXCEL_ROWS})")
+    worksheet = workbook.add_worksheet(sheet_name)
+    columns = [str(col) for col in df.columns]
+    worksheet.write_row(0, 0, columns, workbook.add_format(HEADER_FORMAT))
+    _write_rows(worksheet, df, 1)
+    # Conditional formats are written out at close, so they can follow the rows
+    _add_mismatch_formats(workbook, worksheet, columns, len(df), soa_amount_col, ref_amount_cols, tolerance)
+    return worksheet
+
+
+class ResultWriter:
+    """
+    Writes result chunks to .xlsx, .csv or .parquet as soon as each one is finished.
+    Amount mismatch highlighting (xlsx only) covers every written row at close().
+    """
+
+    def __init__(self, path, soa_amount_col=None, tolerance=DEFAULT_AMOUNT_TOLERANCE):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower().lstrip(".") or "xlsx"
+        if self.format not in ("xlsx", "csv", "parquet"):
+            raise ValueError(f"Unsupported output type: .{self.format}")
+        self.soa_amount_col = soa_amount_col
+        self.tolerance = tolerance
+        self.rows = 0
+        self.columns = None
+        self._workbook = None
+        self._worksheet = None
+        self._parquet = None
+        self._schema = None
+        if self.format == "xlsx":
+            self._workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+
+    def write(self, df):
+        if self.columns is None:
+            self._start([str(col) for col in df.columns])
+        if self.format == "xlsx":
+            if self.rows + len(df) > MAX_EXCEL_ROWS:
+                raise ValueError(f"More than {MAX_EXCEL_ROWS} rows do not fit in one Excel sheet - save as .csv or .parquet")
+            _write_rows(self._worksheet, df, self.rows + 1)
+        elif self.format == "csv":
+            df.to_csv(self.path, mode="a", header=False, index=False)
+        else:
+            self._write_parquet(df)
+        self.rows += len(df)
+
+    def _start(self, columns):
+        self.columns = columns
+        if self.format == "xlsx":
+            self._worksheet = self._workbook.add_worksheet('Sheet1')
+            self._worksheet.write_row(0, 0, columns, self._workbook.add_format(HEADER_FORMAT))
+        elif self.format == "csv":
+            pd.DataFrame(columns=columns).to_csv(self.path, index=False)
+
+    def _write_parquet(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Text columns are stored as strings so every chunk has the same schema
+        df = df.copy()
+        for col in df.columns:
+            if not is_numeric_dtype(df[col]) or is_bool_dtype(df[col]):
+                df[col] = df[col].astype("string")
+            else:
+                df[col] = df[col].astype(float)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._parquet is None:
+            self._schema = table.schema
+            self._parquet = pq.ParquetWriter(self.path, self._schema)
+        self._parquet.write_table(table)
+
+    def add_sheet(self, name, df):
+        """
+        Adds a secondary table after the result rows: another worksheet in xlsx,
+        a sibling <output>_<name>.csv/.parquet file otherwise. Returns where it went.
+        """
+        if self.format == "xlsx":
+            write_sheet(self._workbook, name, df)
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        path = f"{base}_{name.lower().replace(' ', '_')}{ext}"
+        write_result_workbook(path, df)
+        return path
+
+    def discard(self):
+        """Drops an output nothing was written to instead of close(), leaving any file at path as it was."""
+        if self.columns is not None:
+            raise ValueError("Rows were already written - close() the output instead")
+        self._workbook = None  # Never closed, so the workbook file is not created
+
+    def close(self):
+        if self.format == "xlsx":
+            if self._worksheet is None:
+                self._workbook.add_worksheet('Sheet1')
+            elif self.soa_amount_col in self.columns:
+                ref_amount_cols = find_ref_amount_columns(self.columns)
+                _add_mismatch_formats(self._workbook, self._worksheet, self.columns, self.rows,
+                                      self.soa_amount_col, ref_amount_cols, self.tolerance)
+            self._workbook.close()
+        elif self._parquet is not None:
+            self._parquet.close()
+        elif self.columns is None and self.format == "csv":
+            open(self.path, "w").close()
+
+
+def write_result_workbook(path, df, soa_amount_col=None, tolerance=DEFAULT_AMOUNT_TOLERANCE):
+    """Writes the whole reconciliation result to path in one go."""
+    writer = ResultWriter(path, soa_amount_col, tolerance)
+    try:
+        writer.write(df)
+    finally:
+        writer.close()
@@ -0,0 +1,185 @@
+# File: reco_utils/fuzzy.py
+"""
+Fuzzy match key lookup for Oi360 SOA RECO.
+Finds reference keys that are one typo away from an unmatched SOA key (a
+wrong character, a missing or extra character, two swapped neighbours) or
+that differ only by a short extra prefix such as "INV".
+Candidates come from a hashed deletion-neighbourhood index built with numpy,
+so a lookup never compares a key against every reference key.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_FUZZY_MIN_SCORE = 80
+MIN_FUZZY_KEY_LENGTH = 4  # Shorter keys are too ambiguous to match loosely
+MAX_EXTRA_PREFIX = 4  # Longest extra prefix accepted ("INV-" and similar)
+QUERY_BATCH = 20000  # SOA keys looked up per pass, to bound memory
+
+# Polynomial hash over character codes, wrapping at 2**64
+_MOD = 2 ** 64
+_BASE = 0x100000001B3
+_BASE_INV = pow(_BASE, -1, _MOD)
+_LENGTH_SALT = np.uint64(0x9E3779B97F4A7C15)
+_POSITION_SALT = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+def _powers(length):
+    # Weight of character j in a key of this length is BASE**(length-1-j), so every
+    # suffix of a key hashes like a key on its own
+    return np.array([pow(_BASE, length - 1 - j, _MOD) for j in range(length)], dtype=np.uint64)
+
+
+def _finish(hashes, length):
+    with np.errstate(over="ignore"):
+        return hashes + np.uint64(length) * _LENGTH_SALT
+
+
+def _group_by_length(keys):
+    """Yields (length, row numbers, character codes, per-character terms, running totals) per key length."""
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=len(keys))
+    keys = np.asarray(keys, dtype=object)
+    for length in np.unique(lengths):
+        length = int(length)
+        if length < MIN_FUZZY_KEY_LENGTH:
+            continue
+        rows = np.flatnonzero(lengths == length)
+        codes = np.asarray(keys[rows].tolist(), dtype=f"<U{length}").view(np.uint32).reshape(-1, length)
+        with np.errstate(over="ignore"):
+            terms = codes.astype(np.uint64) * _powers(length)
+            running = np.cumsum(terms, axis=1)
+        yield length, rows, codes, terms, running
+
+
+def _variants(length, rows, codes, terms, running):
+    """
+    Returns hashed variants of same-length keys as (kind, hashes, rows, edits) tuples.
+    kind is "full", "delete" (one character removed), "delete_at" (removed at a known
+    position, for substitutions), "swap" (two neighbours swapped) or "suffix" (prefix cut off).
+    """
+    count = len(rows)
+    total = running[:, -1]
+    out = [("full", _finish(total, length), rows, np.zeros(count, dtype=np.uint8))]
+    with np.errstate(over="ignore"):
+        before = np.hstack([np.zeros((count, 1), dtype=np.uint64), running[:, :-1]])
+        deleted = _finish(before * np.uint64(_BASE_INV) + (total[:, None] - running), length - 1)
+        positions = np.arange(length, dtype=np.uint64) * _POSITION_SALT
+        flat_rows = np.repeat(rows, length)
+        ones = np.ones(count * length, dtype=np.uint8)
+        out.append(("delete", deleted.ravel(), flat_rows, ones))
+        out.append(("delete_at", (deleted + positions).ravel(), flat_rows, ones))
+
+        weights = _powers(length)
+        left, right = codes[:, :-1].astype(np.uint64), codes[:, 1:].astype(np.uint64)
+        swapped = (total[:, None] - terms[:, :-1] - terms[:, 1:]
+                   + right * weights[:-1] + left * weights[1:])
+        changed = (left != right).ravel()  # Swapping equal characters changes nothing
+        out.append(("swap", _finish(swapped, length).ravel()[changed],
+                    np.repeat(rows, length - 1)[changed], ones[:changed.sum()]))
+
+        for cut in range(2, min(MAX_EXTRA_PREFIX, length - MIN_FUZZY_KEY_LENGTH) + 1):
+            out.append(("suffix", _finish(total - running[:, cut - 1], length - cut), rows,
+                        np.full(count, cut, dtype=np.uint8)))
+    return out
+
+
+class _HashTable:
+    """Sorted (hash, row, edits) arrays probed with searchsorted."""
+
+    def __init__(self, parts):
+        hashes = np.concatenate([p[0] for p in parts]) if parts else np.empty(0, dtype=np.uint64)
+        rows = np.concatenate([p[1] for p in parts]) if parts else np.empty(0, dtype=np.int64)
+        edits = np.concatenate([p[2] for p in parts]) if parts else np.empty(0, dtype=np.uint8)
+        order = np.argsort(hashes)
+        self.hashes = hashes[order]
+        self.rows = rows[order].astype(np.int32)
+        self.edits = edits[order]
+
+    def probe(self, hashes, queries, edits):
+        """Returns (query, reference row, total edits) for every hash hit."""
+        # Sorted needles walk the table in order, which is far kinder to the CPU cache
+        order = np.argsort(hashes)
+        hashes, queries, edits = hashes[order], queries[order], edits[order]
+        start = np.searchsorted(self.hashes, hashes, side="left")
+        stop = np.searchsorted(self.hashes, hashes, side="right")
+        hits = stop - start
+        found = hits > 0
+        start, hits = start[found], hits[found]
+        if not len(hits):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        # Expand each [start, stop) range into one entry per hit
+        offsets = np.arange(hits.sum()) - np.repeat(np.cumsum(hits) - hits, hits)
+        slots = np.repeat(start, hits) + offsets
+        return (np.repeat(queries[found], hits), self.rows[slots].astype(np.int64),
+                np.repeat(edits[found].astype(np.int64), hits) + self.edits[slots])
+
+
+class FuzzyIndex:
+    """
+    Near-miss index over the unique keys of one reference.
+    score = 100 * (1 - edits / longer key length); an extra prefix counts one edit per character.
+    """
+
+    def __init__(self, keys):
+        self.keys = pd.Series(keys).astype(object).tolist()
+        self.lengths = np.fromiter((len(k) for k in self.keys), dtype=np.int64, count=len(self.keys))
+        by_full, by_delete, by_delete_at = [], [], []
+        for group in _group_by_length(self.keys):
+            for kind, hashes, rows, edits in _variants(*group):
+                if kind == "full":
+                    by_full.append((hashes, rows, edits))
+                elif kind in ("delete", "suffix"):
+                    by_delete.append((hashes, rows, edits))
+                elif kind == "delete_at":
+                    # The SOA side already counts the substitution as its one edit
+                    by_delete_at.append((hashes, rows, np.zeros_like(edits)))
+        # SOA typos and SOA prefixes are probed against the plain keys; SOA keys missing a
+        # character or a prefix against the reference's shortened keys; substitutions position by position
+        self._full = _HashTable(by_full)
+        self._shortened = _HashTable(by_delete)
+        self._delete_at = _HashTable(by_delete_at)
+
+    def match(self, keys, min_score=DEFAULT_FUZZY_MIN_SCORE):
+        """
+        Returns (positions, scores) for the given keys: the closest reference key
+        position (-1 when nothing scores at least min_score) and its score (NaN).
+        Ties go to the key that comes first in the reference.
+        """
+        keys = pd.Series(keys).astype(object).tolist()
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        scores = np.full(len(keys), np.nan)
+        for start in range(0, len(keys), QUERY_BATCH):
+            batch = keys[start:start + QUERY_BATCH]
+            found_q, found_r, found_s = self._match_batch(batch, min_score)
+            positions[start + found_q] = found_r
+            scores[start + found_q] = found_s
+        return positions, scores
+
+    def _match_batch(self, keys, min_score):
+        present = [k if isinstance(k, str) else "" for k in keys]
+        lengths = np.fromiter((len(k) for k in present), dtype=np.int64, count=len(present))
+        hits = []
+        for group in _group_by_length(present):
+            for kind, hashes, rows, edits in _variants(*group):
+                if kind == "full":
+                    hits.append(self._shortened.probe(hashes, rows, edits))
+                elif kind in ("delete", "swap", "suffix"):
+                    hits.append(self._full.probe(hashes, rows, edits))
+                else:
+                    hits.append(self._delete_at.probe(hashes, rows, edits))
+        if not hits:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+        queries = np.concatenate([h[0] for h in hits])
+        refs = np.concatenate([h[1] for h in hits])
+        edits = np.concatenate([h[2] for h in hits])
+        longer = np.maximum(lengths[queries], self.lengths[refs])
+        score = np.round(100.0 * (1.0 - edits / longer), 1)
+        keep = score >= min_score
+        queries, refs, score = queries[keep], refs[keep], score[keep]
+        # Best score first, then the earliest reference row; keep one per SOA key
+        order = np.lexsort((refs, -score, queries))
+        queries, refs, score = queries[order], refs[order], score[order]
+        first = np.ones(len(queries), dtype=bool)
+        first[1:] = queries[1:] != queries[:-1]
+        return queries[first], refs[first], score[first]
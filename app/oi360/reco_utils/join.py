@@ -0,0 +1,116 @@
+# File: reco_utils/join.py
+"""
+Hash-index join for Oi360 SOA RECO.
+Each reference is collapsed to one row per normalized key, then looked up by
+position so the result always keeps exactly one row per SOA line.
+"""
+import numpy as np
+import pandas as pd
+
+from reco_utils.amounts import parse_amounts
+from reco_utils.fuzzy import DEFAULT_FUZZY_MIN_SCORE, FuzzyIndex
+
+# How repeated keys inside one reference are collapsed before the join
+DUPLICATE_POLICIES = {
+    "first": "Keep first row",
+    "last": "Keep last row",
+    "sum": "Sum numeric columns",
+    "concat": "Concatenate values",
+}
+DEFAULT_DUPLICATE_POLICY = "first"
+
+# Joins the values of repeated keys under "concat"; unlike ", " the amount parser
+# never reads it as a thousands separator, so joined amounts stay non-comparable
+CONCAT_SEPARATOR = " | "
+
+
+def _concat_unique(values):
+    return CONCAT_SEPARATOR.join(dict.fromkeys(str(v) for v in values.dropna()))
+
+
+class ReferenceIndex:
+    """
+    Key -> row position index over one reference.
+    Duplicate keys are counted up front and collapsed with the chosen policy.
+    """
+
+    def __init__(self, keys, frame, policy=DEFAULT_DUPLICATE_POLICY):
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate key policy: {policy}")
+        self.policy = policy
+
+        keys = pd.Series(keys).reset_index(drop=True)
+        frame = frame.reset_index(drop=True)
+        present = keys.notna().to_numpy()
+        keys = keys[present].reset_index(drop=True)
+        frame = frame[present].reset_index(drop=True)
+
+        repeated = keys.duplicated(keep=False).to_numpy()
+        self.duplicate_keys = int(keys[repeated].nunique())
+        self.duplicate_rows = int(repeated.sum())
+
+        if not self.duplicate_keys or policy in ("first", "last"):
+            keep = ~keys.duplicated(keep="last" if policy == "last" else "first").to_numpy()
+            collapsed = frame[keep]
+            unique_keys = keys[keep]
+        else:
+            # Only keys that actually repeat go through the (slower) groupby
+            single = frame[~repeated]
+            grouped = frame[repeated].groupby(keys[repeated].to_numpy(), sort=False)
+            if policy == "sum":
+                parts = {}
+                for col in frame.columns:
+                    numbers = pd.Series(parse_amounts(frame[col]))
+                    if numbers.notna().sum() == frame[col].notna().sum():
+                        parts[col] = numbers[repeated].groupby(keys[repeated].to_numpy(), sort=False).sum(min_count=1)
+                    else:
+                        parts[col] = grouped[col].first()
+                merged = pd.DataFrame(parts, columns=frame.columns)
+            else:
+                merged = grouped.agg(_concat_unique)
+            collapsed = pd.concat([single, merged.reset_index(drop=True)], ignore_index=True)
+            unique_keys = pd.concat([keys[~repeated], pd.Series(merged.index)], ignore_index=True)
+
+        self.frame = collapsed.reset_index(drop=True)
+        self.index = pd.Index(unique_keys.to_numpy())
+        self.fuzzy = None  # FuzzyIndex, built on request by build_fuzzy_index()
+
+    def describe_duplicates(self, label):
+        """Returns a warning line about repeated keys, or None when keys are unique."""
+        if not self.duplicate_keys:
+            return None
+        return (f"[WARNING] {label}: {self.duplicate_keys} key(s) repeat across {self.duplicate_rows} rows "
+                f"- using policy '{self.policy}' ({DUPLICATE_POLICIES[self.policy]})")
+
+    def lookup(self, keys):
+        """Returns the row position for every key (-1 when the key is not in this reference)."""
+        keys = pd.Series(keys)
+        if isinstance(keys.dtype, pd.UInt64Dtype):
+            # Composite keys: look up the plain uint64 values, then drop the blank ones
+            positions = self.index.get_indexer(keys.to_numpy(dtype=np.uint64, na_value=0))
+            positions[keys.isna().to_numpy()] = -1
+            return positions
+        return self.index.get_indexer(keys.to_numpy())
+
+    def build_fuzzy_index(self):
+        """Builds the near-miss key index used by fuzzy_lookup (only once)."""
+        if self.fuzzy is None:
+            self.fuzzy = FuzzyIndex(self.index)
+
+    def fuzzy_lookup(self, keys, min_score=DEFAULT_FUZZY_MIN_SCORE):
+        """
+        Returns (positions, scores) of the closest key for keys without an exact match.
+        Each distinct key is looked up once; -1 / NaN where nothing is close enough.
+        """
+        self.build_fuzzy_index()
+        codes, uniques = pd.factorize(pd.Series(keys).to_numpy())
+        positions, scores = self.fuzzy.match(uniques, min_score)
+        # Code -1 marks a missing key; point it at a trailing "no match"
+        positions = np.append(positions, -1)[codes]
+        scores = np.append(scores, np.nan)[codes]
+        return positions, scores
+
+    def take(self, positions):
+        """Returns reference rows aligned to the given positions, all-NaN where position is -1."""
+        # The frame has a 0..n-1 index, so -1 is simply a missing label
+        return self.frame.reindex(np.asarray(positions)).reset_index(drop=True)
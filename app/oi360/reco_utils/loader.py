@@ -0,0 +1,140 @@
+# File: reco_utils/loader.py
+"""
+Input loading for Oi360 SOA RECO (.xlsx, .csv and .parquet).
+Phase 1 reads only the header row so the column dialog can open right away.
+Phase 2 loads just the selected columns, using the Rust-backed calamine
+reader for workbooks when python-calamine is installed and openpyxl otherwise.
+Loaded frames are compacted (Arrow strings, categoricals) by reco_utils.memory.
+For streaming runs, iter_chunks yields the SOA in fixed-size blocks.
+"""
+import os
+
+import pandas as pd
+from pandas.api.types import is_string_dtype
+
+from reco_utils.memory import compact_frame
+
+# File dialog filter for every supported input type
+INPUT_FILE_FILTER = "Data Files (*.xlsx *.csv *.parquet);;Excel Files (*.xlsx);;CSV Files (*.csv);;Parquet Files (*.parquet)"
+DEFAULT_CHUNK_ROWS = 100000
+
+
+def _has_calamine():
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    # pandas gained engine="calamine" in 2.2
+    major, minor = (int(part) for part in pd.__version__.split(".")[:2])
+    return (major, minor) >= (2, 2)
+
+
+EXCEL_ENGINE = "calamine" if _has_calamine() else "openpyxl"
+
+
+def file_kind(file_path):
+    """Returns 'csv', 'parquet' or 'xlsx' from the file extension."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    return "xlsx"
+
+
+def _as_text(df):
+    """Turns typed (CSV/Parquet) columns into text like dtype=str does, keeping blanks missing."""
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if not is_string_dtype(df[col]):
+            df[col] = df[col].astype(str).astype(object).where(df[col].notna(), None)
+    return df
+
+
+def read_headers(file_path):
+    """Returns the column names from the first row of the first sheet (or the file header)."""
+    kind = file_kind(file_path)
+    if kind == "csv":
+        return [str(col) for col in pd.read_csv(file_path, nrows=0).columns]
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        return [str(name) for name in pq.ParquetFile(file_path).schema_arrow.names]
+    if EXCEL_ENGINE == "calamine":
+        from python_calamine import CalamineWorkbook
+        sheet = CalamineWorkbook.from_path(file_path).get_sheet_by_index(0)
+        rows = sheet.to_python(nrows=1)
+        header = rows[0] if rows else []
+    else:
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            header = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+    # Same labels pandas gives: trailing blank header cells are dropped, others named "Unnamed: n"
+    header = list(header)
+    while header and header[-1] in (None, ""):
+        header.pop()
+    header = [int(h) if isinstance(h, float) and h.is_integer() else h for h in header]
+    return [str(h) if h not in (None, "") else f"Unnamed: {i}" for i, h in enumerate(header)]
+
+
+def read_columns(file_path, columns, compact=True):
+    """
+    Loads only the given columns as text, keeping their order from the file.
+    With compact, text is held as Arrow strings / categoricals (see reco_utils.memory).
+    """
+    wanted = set(columns)
+    kind = file_kind(file_path)
+    if kind == "csv":
+        df = _as_text(pd.read_csv(file_path, dtype=str, usecols=lambda col: str(col) in wanted))
+    elif kind == "parquet":
+        names = [name for name in read_headers(file_path) if name in wanted]
+        df = _as_text(pd.read_parquet(file_path, columns=names))
+    else:
+        df = pd.read_excel(file_path, dtype=str, usecols=lambda col: str(col) in wanted, engine=EXCEL_ENGINE)
+        df.columns = [str(col) for col in df.columns]
+    return compact_frame(df) if compact else df
+
+
+def count_rows(file_path):
+    """Returns the number of data rows without parsing the cells (used for progress)."""
+    kind = file_kind(file_path)
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).metadata.num_rows
+    if kind == "csv":
+        lines = 0
+        last = b"\n"
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+        if last != b"\n":
+            lines += 1
+        return max(lines - 1, 0)  # minus header (quoted line breaks make this an estimate)
+    return None
+
+
+def iter_chunks(file_path, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields the selected columns in blocks of chunk_rows rows.
+    CSV and Parquet are read incrementally; workbooks are capped at about one
+    million rows by Excel, so they are loaded once and then sliced.
+    """
+    wanted = set(columns)
+    kind = file_kind(file_path)
+    if kind == "csv":
+        reader = pd.read_csv(file_path, dtype=str, usecols=lambda col: str(col) in wanted, chunksize=chunk_rows)
+        for chunk in reader:
+            yield _as_text(chunk.reset_index(drop=True))
+    elif kind == "parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file_path)
+        names = [name for name in parquet_file.schema_arrow.names if name in wanted]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=names):
+            yield _as_text(batch.to_pandas())
+    else:
+        df = read_columns(file_path, columns)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].reset_index(drop=True)
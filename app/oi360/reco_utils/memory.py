@@ -0,0 +1,97 @@
+# File: reco_utils/memory.py
+"""
+Compact in-memory frames for Oi360 SOA RECO.
+Loaded text columns are kept as Arrow-backed strings instead of one Python
+object per cell, and columns with few distinct values as categoricals.
+Amounts and dates stay text in the frame; they are parsed once per distinct
+value when matching, which categoricals make cheaper still.
+Without pyarrow, text columns are only made categorical.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_object_dtype, is_string_dtype
+
+from reco_utils.cache import _has_pyarrow
+
+CATEGORY_MAX_RATIO = 0.5  # Columns with at most this many distinct values per row become categorical
+MIN_CATEGORY_ROWS = 1000  # Below this the saving is not worth a different column type
+OBJECT_OVERHEAD = 49 + 8  # Bytes of one short Python str plus its pointer in an object column
+
+
+def _text_dtype():
+    """Arrow-backed string dtype with NaN for missing cells (the pandas 3 default) where available."""
+    if not _has_pyarrow():
+        return None
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)  # pandas >= 2.3
+    except TypeError:
+        pass
+    try:
+        return pd.api.types.pandas_dtype("string[pyarrow_numpy]")  # pandas 2.1 - 2.2
+    except TypeError:
+        return pd.StringDtype("pyarrow")
+
+
+def compact_frame(df, category_ratio=CATEGORY_MAX_RATIO):
+    """Returns df with object text columns as Arrow strings and low-cardinality ones as categoricals."""
+    text_dtype = _text_dtype()
+    df = df.copy(deep=False)
+    for col in df.columns:
+        values = df[col]
+        if not (is_object_dtype(values) or is_string_dtype(values)):
+            continue
+        if len(values) >= MIN_CATEGORY_ROWS and values.nunique() <= len(values) * category_ratio:
+            if text_dtype is not None and is_object_dtype(values):
+                values = values.astype(text_dtype)
+            df[col] = values.astype("category")
+        elif text_dtype is not None and is_object_dtype(values):
+            df[col] = values.astype(text_dtype)
+    return df
+
+
+def _text_lengths(values):
+    """Character count of every non-missing cell (categoricals counted from their categories)."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        lengths = values.cat.categories.astype(str).str.len().to_numpy(dtype=np.int64)
+        return lengths[codes[codes >= 0]]
+    present = values.dropna()
+    return present.astype(str).str.len().to_numpy(dtype=np.int64)
+
+
+def memory_report(df):
+    """
+    Returns the frame's footprint: its actual bytes, and an estimate of the same
+    cells as plain Python strings (how dtype=str used to hold them).
+    """
+    actual = int(df.memory_usage(deep=True, index=False).sum())
+    as_objects = 0
+    categorical = []
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categorical.append(str(col))
+        if isinstance(values.dtype, pd.CategoricalDtype) or is_object_dtype(values) or is_string_dtype(values):
+            lengths = _text_lengths(values)
+            as_objects += 8 * len(values) + (OBJECT_OVERHEAD - 8) * len(lengths) + int(lengths.sum())
+        else:
+            as_objects += int(values.memory_usage(deep=True, index=False))
+    return {
+        "rows": len(df),
+        "columns": df.shape[1],
+        "bytes": actual,
+        "object_bytes": as_objects,
+        "categorical": categorical,
+    }
+
+
+def format_memory_report(name, report):
+    """Returns the one-line status text for a loaded file."""
+    mb = report["bytes"] / 1024 ** 2
+    object_mb = report["object_bytes"] / 1024 ** 2
+    ratio = report["object_bytes"] / report["bytes"] if report["bytes"] else 1.0
+    line = (f"[MEMORY] {name}: {report['rows']} rows x {report['columns']} columns in {mb:.1f} MB "
+            f"(about {object_mb:.1f} MB as plain text, {ratio:.1f}x smaller)")
+    if report["categorical"]:
+        line += f"; categorical: {', '.join(report['categorical'])}"
+    return line
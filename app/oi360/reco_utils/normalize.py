@@ -0,0 +1,122 @@
+# File: reco_utils/normalize.py
+"""
+Match key normalization for Oi360 SOA RECO.
+Builds the cleaned invoice/match key for a whole column in one vectorized pass,
+or one compact hashed key for a match on several columns (invoice + vendor).
+"""
+import numpy as np
+import pandas as pd
+
+# Name of the helper column that holds the normalized match key
+KEY_COLUMN = "__match_key"
+
+# Mixes the per-column hashes of a composite key in column order (64-bit FNV prime)
+KEY_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+# --- Rule list applied in order ---
+# Each rule is a (name, argument) pair. Supported names:
+#   "whitespace"    - strip leading/trailing whitespace
+#   "apostrophe"    - remove a leading Excel text marker (')
+#   "leading_zeros" - '0308607218' -> '308607218' for all-digit keys ('000' -> '0')
+#   "prefix"        - remove a leading regex match, e.g. ("prefix", r"INV[-/]?")
+#   "suffix"        - remove a trailing regex match, e.g. ("suffix", r"-\d{2}")
+#   "upper"         - upper-case the key
+DEFAULT_KEY_RULES = [
+    ("whitespace", None),
+    ("apostrophe", None),
+    ("leading_zeros", None),
+]
+
+
+def _apply_rule(keys, name, arg):
+    if name == "whitespace":
+        return keys.str.strip()
+    if name == "apostrophe":
+        return keys.str.replace(r"^'", "", regex=True)
+    if name == "leading_zeros":
+        digits = keys.str.isdigit().fillna(False).astype(bool)
+        stripped = keys.str.lstrip("0").replace("", "0")
+        return keys.mask(digits, stripped)
+    if name == "prefix":
+        return keys.str.replace(f"^(?:{arg})", "", regex=True)
+    if name == "suffix":
+        return keys.str.replace(f"(?:{arg})$", "", regex=True)
+    if name == "upper":
+        return keys.str.upper()
+    raise ValueError(f"Unknown match key rule: {name}")
+
+
+def _normalize_uniques(values, rules):
+    """Returns (codes, normalized key of every distinct value) as from pd.factorize."""
+    codes, uniques = pd.factorize(values)
+    keys = pd.Series(uniques, dtype=object).astype("string")
+    for rule in rules:
+        name, arg = rule if isinstance(rule, (tuple, list)) else (rule, None)
+        keys = _apply_rule(keys, name, arg)
+    return codes, keys.replace("", pd.NA)
+
+
+def normalize_keys(values, rules=None):
+    """
+    Returns a string Series of normalized match keys for the given column.
+    Blank and missing cells become <NA> so they never match each other.
+    Each distinct value is cleaned once, then mapped back onto every row.
+    """
+    if rules is None:
+        rules = DEFAULT_KEY_RULES
+    values = pd.Series(values)
+    codes, keys = _normalize_uniques(values, rules)
+    # Code -1 marks a missing cell; point it at a trailing <NA>
+    keys = pd.concat([keys, pd.Series([pd.NA], dtype="string")], ignore_index=True)
+    result = keys.take(codes).reset_index(drop=True)
+    result.index = values.index
+    return result
+
+
+def key_columns(match):
+    """Returns the match column(s) as a list; match is a column name or a list of names."""
+    return list(match) if isinstance(match, (list, tuple)) else [match]
+
+
+def describe_match(match):
+    """Match column(s) as shown to the user, e.g. 'Invoice + Vendor'."""
+    return " + ".join(str(col) for col in key_columns(match))
+
+
+def is_composite(match):
+    """True when match names more than one column."""
+    return len(key_columns(match)) > 1
+
+
+def composite_keys(parts, rules=None):
+    """
+    Returns one compact key per row for several key columns (parts: equal-length
+    Series, in match column order): each column is normalized and hashed once
+    per distinct value, and the hashes are mixed into a single uint64, so no
+    concatenated strings are built. The result is a nullable UInt64 Series,
+    <NA> where any part is blank. Different columns never run together
+    ('1' + '23' and '12' + '3' give different keys).
+    """
+    if rules is None:
+        rules = DEFAULT_KEY_RULES
+    parts = [pd.Series(part) for part in parts]
+    combined = np.zeros(len(parts[0]), dtype=np.uint64)
+    missing = np.zeros(len(parts[0]), dtype=bool)
+    for part in parts:
+        codes, keys = _normalize_uniques(part, rules)
+        hashes = pd.util.hash_array(keys.fillna("").to_numpy(dtype=object), categorize=False)
+        blank = np.append(keys.isna().to_numpy(), True)  # Code -1 (missing cell) takes the trailing entry
+        missing |= blank[codes]
+        combined = (combined * KEY_HASH_MULTIPLIER) ^ np.append(hashes, np.uint64(0))[codes]
+    return pd.Series(pd.arrays.IntegerArray(combined, missing), index=parts[0].index)
+
+
+def match_keys(df, match, rules=None):
+    """
+    Returns the normalized match key of every row of df: string keys
+    (normalize_keys) for one match column, composite_keys for several.
+    """
+    columns = key_columns(match)
+    if len(columns) == 1:
+        return normalize_keys(df[columns[0]], rules)
+    return composite_keys([df[col] for col in columns], rules)
@@ -0,0 +1,139 @@
+# File: reco_utils/prefetch.py
+"""
+Background file loading for Oi360 SOA RECO.
+As soon as a file is chosen its header is read on a small thread pool (so the
+column dialog can open quickly) and the file is hashed for the parsed-frame
+cache, so the cache check after the dialog costs nothing. Once the columns are
+picked, a loader thread takes them from the cache or has only those columns
+loaded in a worker process (column projection as in the direct load), where
+workbooks parse in parallel instead of taking turns on the GIL, and caches the
+result. Without a usable process pool, files are parsed on threads.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from reco_utils.applog import get_logger
+from reco_utils.loader import read_columns, read_headers
+from reco_utils.memory import compact_frame
+from reco_utils.profiling import StageProfiler
+
+HEADER_WORKERS = 2
+
+
+def parse_file(file_path, columns):
+    """
+    Pool task: loads the given columns of file_path (compacted, as read_columns does).
+    Returns (frame, seconds, peak bytes) of the load in the worker.
+    """
+    profiler = StageProfiler()
+    with profiler.stage("load"):
+        df = read_columns(file_path, columns)
+    load = profiler.report()["stages"][0]
+    return df, load["seconds"], load["peak_mb"] * 1024 ** 2
+
+
+def load_file(cache, parse, file_path, columns):
+    """
+    Loader-thread task: returns (frame, seconds, peak bytes, cached) of the given
+    columns of file_path, taken from cache (a FrameCache, or None) when it has
+    them, else parsed by parse (a function returning a parse_file future) and cached.
+    """
+    if cache is not None:
+        profiler = StageProfiler()
+        with profiler.stage("load"):
+            try:
+                df = cache.get(file_path, columns)
+            except Exception as e:
+                get_logger().info(f"Cache read error: {str(e)}")
+                df = None
+            if df is not None:
+                df = compact_frame(df)  # Entries cached before frames were compacted
+        if df is not None:
+            load = profiler.report()["stages"][0]
+            return df, load["seconds"], load["peak_mb"] * 1024 ** 2, True
+    df, seconds, peak_bytes = parse(file_path, columns).result()
+    if cache is not None:
+        try:
+            cache.put(file_path, columns, df)
+        except Exception as e:
+            get_logger().info(f"Cache write error: {str(e)}")
+    return df, seconds, peak_bytes, False
+
+
+class PrefetchJob:
+    """
+    One file being loaded for slot ("SOA", "Ref1", ...).
+    header is a future of read_headers and probe one of the cache hash (None
+    without a probe). parse is False when only the header is wanted (a streamed
+    statement). frame is the load_file future of the selected columns, None
+    until load() starts it. selection is left for the caller to fill in once the
+    user has picked the columns.
+    """
+
+    def __init__(self, slot, file_path, header, probe=None, parse=True):
+        self.slot = slot
+        self.file_path = file_path
+        self.header = header
+        self.parse = parse
+        self.probe = probe
+        self.frame = None
+        self.selection = None
+
+    def cancel(self):
+        """Drops the job; a parse already running finishes in the background and is discarded."""
+        for future in (self.header, self.probe, self.frame):
+            if future is not None:
+                future.cancel()
+
+
+class Prefetcher:
+    """Reads headers and loads selected columns of chosen files; pools are created on first use."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._headers = None
+        self._loaders = None
+        self._parsers = None
+
+    def submit(self, slot, file_path, parse=True, probe=None):
+        """
+        Starts reading the header of file_path and returns its PrefetchJob (parse=False:
+        only the header will be loaded). probe (e.g. FrameCache.content_hash) is also
+        run on file_path in the background when the file is to be parsed.
+        """
+        if self._headers is None:
+            self._headers = ThreadPoolExecutor(max_workers=HEADER_WORKERS)
+        header = self._headers.submit(read_headers, file_path)
+        probe = self._headers.submit(probe, file_path) if probe and parse else None
+        return PrefetchJob(slot, file_path, header, probe, parse)
+
+    def load(self, job, columns, cache=None):
+        """
+        Starts loading columns of job's file, through cache (a FrameCache) when given;
+        returns job.frame, a load_file future.
+        """
+        if self._loaders is None:
+            # Loader threads only wait on the cache and the parse pool, one per parse worker is plenty
+            self._loaders = ThreadPoolExecutor(max_workers=self.max_workers)
+        job.frame = self._loaders.submit(load_file, cache, self._submit_parse, job.file_path, columns)
+        return job.frame
+
+    def _submit_parse(self, file_path, columns):
+        if self._parsers is None:
+            try:
+                self._parsers = ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError, ImportError):
+                self._parsers = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            return self._parsers.submit(parse_file, file_path, columns)
+        except RuntimeError:
+            # A worker process died (BrokenProcessPool) or the pool was shut down: carry on with threads
+            self._parsers = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._parsers.submit(parse_file, file_path, columns)
+
+    def shutdown(self):
+        """Stops the pools without waiting for parses still running."""
+        for pool in (self._headers, self._loaders, self._parsers):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._headers = self._loaders = self._parsers = None
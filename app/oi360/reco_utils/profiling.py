@@ -0,0 +1,163 @@
+# File: reco_utils/profiling.py
+"""
+Per-stage profiling for Oi360 SOA RECO runs.
+Each stage (load, normalize, index, join, amount compare, date cleanup,
+export, ...) records its wall time and the peak process memory seen while it
+ran. The profile is a plain dict so it can be shown in the UI and saved as JSON.
+"""
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+SAMPLE_SECONDS = 0.05  # How often memory is sampled while a stage runs
+
+
+def current_rss():
+    """Returns the resident memory of this process in bytes (None when it cannot be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Lifetime peak rather than current usage, but still an upper bound per stage
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def profile_path(output_path):
+    """Returns where the profile of a run writing output_path is saved."""
+    return os.path.splitext(output_path)[0] + "_profile.json"
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.intervals = []  # (start, end) wall clock intervals
+        self.peak = 0
+        self.active = 0
+
+
+class StageProfiler:
+    """
+    Collects wall time and peak memory per named stage. Thread-safe, so stages
+    running concurrently on the reference pool are counted once in wall time.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._started = time.perf_counter()
+        self._started_at = datetime.datetime.now()
+        self.rows = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the enclosed block as part of the named stage."""
+        rss = current_rss() or 0
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage(name)
+            stage.calls += 1
+            stage.active += 1
+            stage.peak = max(stage.peak, rss)
+            self._start_sampler()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            rss = current_rss() or 0
+            with self._lock:
+                stage.intervals.append((start, end))
+                stage.active -= 1
+                stage.peak = max(stage.peak, rss)
+
+    def add(self, name, seconds, peak_bytes=0):
+        """Records a stage that was measured elsewhere (e.g. a file loaded before the run)."""
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage(name)
+            stage.calls += 1
+            end = time.perf_counter()
+            stage.intervals.append((end - seconds, end))
+            stage.peak = max(stage.peak, peak_bytes or 0)
+
+    def _start_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def _sample(self):
+        # Runs while any stage is open, so short peaks inside a stage are caught too
+        while True:
+            time.sleep(SAMPLE_SECONDS)
+            rss = current_rss()
+            with self._lock:
+                active = [stage for stage in self._stages.values() if stage.active]
+                if not active:
+                    self._sampler = None
+                    return
+                for stage in active:
+                    stage.peak = max(stage.peak, rss or 0)
+
+    def report(self):
+        """Returns the profile as a dict: one entry per stage in first-use order, plus totals."""
+        with self._lock:
+            stages = []
+            for stage in self._stages.values():
+                stages.append({
+                    "stage": stage.name,
+                    "seconds": round(_covered(stage.intervals), 3),
+                    "calls": stage.calls,
+                    "peak_mb": round(stage.peak / 1024 ** 2, 1),
+                })
+        return {
+            "started": self._started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(time.perf_counter() - self._started, 3),
+            "peak_mb": max((s["peak_mb"] for s in stages), default=0.0),
+            "rows": self.rows,
+            "stages": stages,
+        }
+
+    def save(self, path):
+        """Writes the report as JSON and returns it."""
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def _covered(intervals):
+    """Total time covered by possibly overlapping intervals."""
+    total, end = 0.0, None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+
+def format_report(report):
+    """Returns the report as short text lines for the status box."""
+    lines = [f"[PROFILE] {report['rows']} rows in {report['total_seconds']:.2f} s, peak memory {report['peak_mb']:.0f} MB"]
+    for stage in report["stages"]:
+        lines.append(f"[PROFILE]   {stage['stage']:<15} {stage['seconds']:>8.2f} s  peak {stage['peak_mb']:>7.0f} MB  ({stage['calls']} call(s))")
+    return lines
@@ -0,0 +1,72 @@
+# File: reco_utils/resultfilters.py
+"""
+One-click filters for the Oi360 SOA RECO result view.
+Every filter (unmatched, amount mismatch, matched in a given reference, a
+given age bucket) is worked out once per run as a boolean mask over the
+result frame, so switching filters is a mask AND plus flatnonzero and the
+frame itself is never copied.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from reco_utils.amounts import DEFAULT_AMOUNT_TOLERANCE, amount_differences, find_ref_amount_columns
+from reco_utils.dates import bucket_order
+
+ALL_ROWS = "All rows"
+ANY_AGE = "Any age"
+UNMATCHED = "Unmatched"
+AMOUNT_MISMATCH = "Amount mismatch"
+_REF_LABEL = re.compile(r"Ref(\d+)\b")
+
+
+class ResultFilters:
+    """
+    Precomputed filters over one result frame.
+    kinds: [(label, mask)] starting with ALL_ROWS; buckets: [(label, mask)]
+    starting with ANY_AGE. A mask of None means every row.
+    mismatch is the per-row amount mismatch mask, worked out from the parsed
+    amounts as the engine compares them (None without soa_amount_col or any
+    reference amount column).
+    """
+
+    def __init__(self, df, soa_amount_col=None, amount_tolerance=DEFAULT_AMOUNT_TOLERANCE):
+        self.df = df
+        self.kinds = [(ALL_ROWS, None)]
+        self.buckets = [(ANY_AGE, None)]
+        self.mismatch = None
+        if "Match Source" in df.columns:
+            # A handful of distinct Match Source texts: each is parsed once, rows take theirs by code
+            codes, sources = pd.factorize(df["Match Source"].astype(object).fillna(""))
+            sources = [str(source) for source in sources]
+            self.kinds.append((UNMATCHED, np.isin(codes, [i for i, s in enumerate(sources) if s == ""])))
+            refs = {}
+            for i, source in enumerate(sources):
+                for number in {int(n) for n in _REF_LABEL.findall(source)}:
+                    refs.setdefault(number, []).append(i)
+            for number in sorted(refs):
+                self.kinds.append((f"Matched in Ref{number}", np.isin(codes, refs[number])))
+        ref_amount_cols = find_ref_amount_columns(df.columns)
+        if soa_amount_col in df.columns and ref_amount_cols:
+            _, differences = amount_differences(df, soa_amount_col, ref_amount_cols)
+            # NaN (no comparable amount) is never over the tolerance
+            self.mismatch = np.logical_or.reduce([np.abs(diff) > amount_tolerance for diff in differences.values()])
+            self.kinds.insert(2 if len(self.kinds) > 1 else 1, (AMOUNT_MISMATCH, self.mismatch))
+        if "Age Bucket" in df.columns:
+            codes, labels = pd.factorize(df["Age Bucket"].astype(object))
+            for i in sorted(range(len(labels)), key=lambda i: bucket_order(labels[i])):
+                self.buckets.append((str(labels[i]), codes == i))
+
+    def rows(self, kind=ALL_ROWS, bucket=ANY_AGE):
+        """Returns the positions of the rows passing both filters (labels from kinds / buckets)."""
+        masks = [mask for label, mask in self.kinds if label == kind and mask is not None]
+        masks += [mask for label, mask in self.buckets if label == bucket and mask is not None]
+        if not masks:
+            return np.arange(len(self.df))
+        return np.flatnonzero(np.logical_and.reduce(masks) if len(masks) > 1 else masks[0])
+
+    def counts(self):
+        """Returns {label: rows} of every kind and bucket filter on its own."""
+        total = len(self.df)
+        return {label: total if mask is None else int(mask.sum()) for label, mask in self.kinds + self.buckets}
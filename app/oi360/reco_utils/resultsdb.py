@@ -0,0 +1,363 @@
+# File: reco_utils/resultsdb.py
+"""
+Results database for Oi360 SOA RECO.
+Every run's result rows are kept in one local SQLite file in the user's home
+folder (DEFAULT_DB_PATH unless set), so questions across runs ("which invoices were unmatched
+for customer X in the last three months") are one query instead of opening
+dozens of workbooks. The normalized key, Match Source, Age Bucket and run id
+are indexed columns; the rest of each row is stored as JSON. Only the newest
+runs are kept (DEFAULT_MAX_RUNS unless set): older ones are deleted whenever a
+run is recorded, and SQLite reuses their space. Each run commits its rows
+chunk by chunk, so several runs (batch workers, or a new GUI run while a
+cancelled one winds down) can record at the same time. A run whose process
+died while recording is marked 'failed' by the next run that starts, so it is
+pruned like any other: as soon as its process is gone (when it ran on this
+machine), else once it has not written for STALE_RUN_HOURS.
+
+Usage (from the oi360 folder):
+    python -m reco_utils.resultsdb runs
+    python -m reco_utils.resultsdb query --unmatched --where Customer=X --since 2026-07-01
+    python -m reco_utils.resultsdb query --key INV-00123 --output found.xlsx
+    python -m reco_utils.resultsdb query --key INV-00123 V001   (composite key: invoice + vendor)
+"""
+import argparse
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import sys
+from itertools import repeat
+
+import pandas as pd
+
+from reco_utils.normalize import DEFAULT_KEY_RULES, composite_keys, describe_match, normalize_keys
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".oi360_results.db")
+SCHEMA_VERSION = 2
+CACHE_KB = 128 * 1024  # SQLite page cache per connection
+BUSY_SECONDS = 60  # How long a write waits for another run's chunk to commit
+DEFAULT_MAX_RUNS = 100  # Runs kept in the database; None keeps every run
+STALE_RUN_HOURS = 24  # A 'running' run from another machine silent this long has crashed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    finished TEXT,
+    status TEXT NOT NULL,
+    soa_path TEXT,
+    soa_match TEXT,
+    output_path TEXT,
+    as_of TEXT,
+    key_rules TEXT,
+    rows INTEGER NOT NULL DEFAULT 0,
+    host TEXT,
+    pid INTEGER,
+    heartbeat TEXT
+);
+CREATE TABLE IF NOT EXISTS result_rows (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    row_no INTEGER NOT NULL,
+    match_key TEXT,
+    match_source TEXT NOT NULL,
+    age_bucket TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_rows_run ON result_rows(run_id, row_no);
+CREATE INDEX IF NOT EXISTS result_rows_key ON result_rows(match_key);
+CREATE INDEX IF NOT EXISTS result_rows_source ON result_rows(match_source);
+CREATE INDEX IF NOT EXISTS result_rows_bucket ON result_rows(age_bucket);
+"""
+
+
+# Columns added since version 1; databases created before get them on first use
+ADDED_COLUMNS = [("runs", "host", "TEXT"), ("runs", "pid", "INTEGER"), ("runs", "heartbeat", "TEXT")]
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=BUSY_SECONDS)
+    connection.execute("PRAGMA journal_mode=WAL")  # Queries keep working while a run is being recorded
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(f"PRAGMA cache_size=-{CACHE_KB}")  # Index pages of a chunk stay in memory until commit
+    connection.executescript(SCHEMA)
+    if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        for table, column, kind in ADDED_COLUMNS:
+            try:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+            except sqlite3.OperationalError:
+                pass  # Already there (new database, or added by another process meanwhile)
+        connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        connection.commit()
+    return connection
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _pid_alive(pid):
+    """True/False when it can tell whether process pid runs on this machine, else None."""
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if os.name != "posix":
+        return None  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, owned by someone else
+    return True
+
+
+def _fail_crashed_runs(connection):
+    """Marks 'running' runs whose process is gone or that have been silent too long as 'failed'."""
+    host = socket.gethostname()
+    stale = (datetime.datetime.now() - datetime.timedelta(hours=STALE_RUN_HOURS)).isoformat(timespec="seconds")
+    crashed = []
+    for run_id, run_host, pid, heartbeat in connection.execute(
+            "SELECT run_id, host, pid, heartbeat FROM runs WHERE status = 'running'"):
+        alive = _pid_alive(pid) if run_host == host and pid is not None else None
+        # Silent too long also covers a reused pid
+        if alive is False or (heartbeat or "") < stale:
+            crashed.append((run_id,))
+    if crashed:
+        connection.executemany("UPDATE runs SET status = 'failed' WHERE run_id = ? AND status = 'running'", crashed)
+
+
+class RunRecorder:
+    """
+    Records the result rows of one run as they are finished. The run's row is
+    committed straight away as 'running' (with this process and a heartbeat);
+    each write() is one executemany batch in its own transaction, and close()
+    sets the final status and deletes the runs older than the newest max_runs.
+    """
+
+    def __init__(self, path, soa_path=None, soa_match=None, output_path=None, as_of=None, key_rules=None,
+                 max_runs=DEFAULT_MAX_RUNS):
+        self.max_runs = max_runs
+        self._connection = _connect(path)
+        try:
+            _fail_crashed_runs(self._connection)
+            now = _now()
+            cursor = self._connection.execute(
+                "INSERT INTO runs (started, status, soa_path, soa_match, output_path, as_of, key_rules, "
+                "host, pid, heartbeat) VALUES (?, 'running', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, soa_path and os.path.abspath(soa_path), soa_match and describe_match(soa_match), output_path,
+                 str(as_of) if as_of is not None else None,
+                 json.dumps([list(rule) for rule in key_rules]) if key_rules is not None else None,
+                 socket.gethostname(), os.getpid(), now)
+            )
+            self._connection.commit()
+        except Exception:
+            self._connection.close()
+            raise
+        self.run_id = cursor.lastrowid
+        self.rows = 0
+
+    def write(self, df, keys):
+        """Adds result rows df with their normalized match keys (same length and order)."""
+        if not len(df):
+            return
+        # One C-level JSON pass for the whole chunk, then one line per row
+        data = df.to_json(orient="records", lines=True, force_ascii=False, date_format="iso").splitlines()
+        sources = df["Match Source"].astype(object).fillna("").tolist() if "Match Source" in df.columns \
+            else [""] * len(df)
+        buckets = df["Age Bucket"].astype(object).where(df["Age Bucket"].notna(), None).tolist() \
+            if "Age Bucket" in df.columns else [None] * len(df)
+        keys = pd.Series(keys).astype("string")  # Composite (uint64) keys are stored as their decimal text
+        keys = keys.astype(object).where(keys.notna(), None).tolist()
+        self._connection.executemany(
+            "INSERT INTO result_rows (run_id, row_no, match_key, match_source, age_bucket, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            zip(repeat(self.run_id), range(self.rows, self.rows + len(df)), keys, sources, buckets, data)
+        )
+        self._connection.execute("UPDATE runs SET heartbeat = ?, rows = ? WHERE run_id = ?",
+                                 (_now(), self.rows + len(df), self.run_id))
+        self._connection.commit()
+        self.rows += len(df)
+
+    def close(self, status="complete"):
+        """Commits the run with its final status ('complete', 'cancelled' or 'failed')."""
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute("UPDATE runs SET finished = ?, status = ?, rows = ? WHERE run_id = ?",
+                                     (_now(), status, self.rows, self.run_id))
+            self._connection.commit()
+            if self.max_runs:
+                _prune(self._connection, self.max_runs)
+        finally:
+            self._connection.close()
+            self._connection = None
+
+
+def _prune(connection, max_runs):
+    """Deletes every run (and its rows) older than the newest max_runs, leaving runs still being recorded."""
+    cutoff = connection.execute("SELECT run_id FROM runs ORDER BY run_id DESC LIMIT 1 OFFSET ?",
+                                (int(max_runs),)).fetchone()
+    if cutoff is None:
+        return
+    old = "SELECT run_id FROM runs WHERE run_id <= ? AND status != 'running'"
+    connection.execute(f"DELETE FROM result_rows WHERE run_id IN ({old})", cutoff)
+    connection.execute(f"DELETE FROM runs WHERE run_id IN ({old})", cutoff)
+    connection.commit()
+
+
+def _lookup_key(key, key_rules):
+    """Normalizes key (one value, or one per match column) like a run with key_rules did."""
+    parts = [pd.Series([str(value)]) for value in (key if isinstance(key, (list, tuple)) else [key])]
+    keys = normalize_keys(parts[0], key_rules) if len(parts) == 1 else composite_keys(parts, key_rules)
+    return keys.astype("string").iloc[0]
+
+
+class ResultsStore:
+    """The results database at path: start_run() records a run, runs() and query() read them back."""
+
+    def __init__(self, path=DEFAULT_DB_PATH, max_runs=DEFAULT_MAX_RUNS):
+        self.path = path
+        self.max_runs = max_runs
+
+    def start_run(self, soa_path=None, soa_match=None, output_path=None, as_of=None, key_rules=None):
+        """Returns a RunRecorder for a new run."""
+        return RunRecorder(self.path, soa_path, soa_match, output_path, as_of, key_rules, self.max_runs)
+
+    def runs(self, limit=None):
+        """Returns the recorded runs, newest first."""
+        connection = _connect(self.path)
+        try:
+            sql = "SELECT * FROM runs ORDER BY run_id DESC" + (" LIMIT ?" if limit else "")
+            return pd.read_sql_query(sql, connection, params=(int(limit),) if limit else ())
+        finally:
+            connection.close()
+
+    def _stored_key_rules(self):
+        """The distinct key_rules texts of the recorded runs (None for runs without)."""
+        connection = _connect(self.path)
+        try:
+            return [stored for (stored,) in connection.execute("SELECT DISTINCT key_rules FROM runs")]
+        finally:
+            connection.close()
+
+    def query(self, key=None, match_source=None, unmatched=False, age_bucket=None, run_id=None,
+              since=None, until=None, where=None, limit=None, key_rules=None):
+        """
+        Returns result rows across runs as a frame: the run's id, start time and SOA
+        file, then the row's own result columns. Filters are combined with AND:
+        key is normalized with the key rules each run used (key_rules instead, when
+        given), or is a list of values, one per match column, for runs on a composite
+        key; match_source is an exact Match Source text and unmatched keeps rows with
+        none; since/until bound the run start (dates or ISO text); where maps result
+        column -> value.
+        Only complete and cancelled runs are searched.
+        """
+        clauses = ["r.status IN ('complete', 'cancelled')"]
+        params = []
+        if key is not None and key_rules is not None:
+            clauses.append("x.match_key = ?")
+            params.append(_lookup_key(key, key_rules))
+        elif key is not None:
+            # One normalized key per set of rules the runs used, each tried against its own runs
+            by_rules = []
+            for stored in self._stored_key_rules():
+                rules = [tuple(rule) for rule in json.loads(stored)] if stored else DEFAULT_KEY_RULES
+                by_rules.append("(r.key_rules IS ? AND x.match_key = ?)")
+                params.extend([stored, _lookup_key(key, rules)])
+            clauses.append(f"({' OR '.join(by_rules) or '0'})")
+        if unmatched:
+            clauses.append("x.match_source = ''")
+        elif match_source is not None:
+            clauses.append("x.match_source = ?")
+            params.append(match_source)
+        if age_bucket is not None:
+            clauses.append("x.age_bucket = ?")
+            params.append(age_bucket)
+        if run_id is not None:
+            clauses.append("x.run_id = ?")
+            params.append(int(run_id))
+        if since is not None:
+            clauses.append("r.started >= ?")
+            params.append(str(since))
+        if until is not None:
+            clauses.append("r.started < ?")
+            params.append(str(until))
+        for column, value in (where or {}).items():
+            clauses.append("json_extract(x.data, ?) = ?")
+            params.extend([f'$."{column}"', value])
+        sql = ("SELECT x.run_id, r.started, r.soa_path, x.data FROM result_rows x JOIN runs r USING (run_id) "
+               f"WHERE {' AND '.join(clauses)} ORDER BY x.run_id DESC, x.row_no")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        connection = _connect(self.path)
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+        found = pd.DataFrame([json.loads(data) for _, _, _, data in rows])
+        found.insert(0, "SOA File", [os.path.basename(path or "") for _, _, path, _ in rows])
+        found.insert(0, "Run Started", [started for _, started, _, _ in rows])
+        found.insert(0, "Run", [run for run, _, _, _ in rows])
+        return found
+
+
+def _where(pairs):
+    where = {}
+    for pair in pairs or []:
+        column, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--where expects COLUMN=VALUE, got {pair!r}")
+        where[column] = value
+    return where
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Oi360 SOA RECO - look up results across runs")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help=f"results database (default: {DEFAULT_DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runs = commands.add_parser("runs", help="list recorded runs")
+    runs.add_argument("--limit", type=int, default=50)
+    query = commands.add_parser("query", help="find result rows across runs")
+    query.add_argument("--key", nargs="+", help="SOA match value, normalized like the runs "
+                                                "(one value per column for a composite key)")
+    query.add_argument("--source", help="exact Match Source text, e.g. 'Ref1, Ref2'")
+    query.add_argument("--unmatched", action="store_true", help="rows matched in no reference")
+    query.add_argument("--bucket", help="Age Bucket, e.g. '91-120'")
+    query.add_argument("--run", type=int, help="run id (see 'runs')")
+    query.add_argument("--since", help="runs started on or after this date (YYYY-MM-DD)")
+    query.add_argument("--until", help="runs started before this date (YYYY-MM-DD)")
+    query.add_argument("--where", action="append", metavar="COLUMN=VALUE", help="result column value (repeatable)")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--output", help="save the rows to .xlsx/.csv/.parquet instead of printing them")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No results database at {args.db}", file=sys.stderr)
+        return 2
+    store = ResultsStore(args.db)
+    if args.command == "runs":
+        print(store.runs(args.limit).to_string(index=False))
+        return 0
+    try:
+        where = _where(args.where)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    key = args.key[0] if args.key and len(args.key) == 1 else args.key
+    found = store.query(key, args.source, args.unmatched, args.bucket, args.run,
+                        args.since, args.until, where, args.limit)
+    if args.output:
+        from reco_utils.export import write_result_workbook
+        write_result_workbook(args.output, found)
+        print(f"Saved {len(found)} row(s) to {args.output}")
+    else:
+        with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+            print(found.to_string(index=False) if len(found) else "No matching rows.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# File: reco_utils/runstate.py
+"""
+Run state for incremental re-reconciliation in Oi360 SOA RECO.
+The result of each run is stored with every row's normalized key, a hash of
+the SOA row and its per-reference match codes, keyed by the SOA file and
+match column. The next run of the same statement reconciles only rows that
+were added or changed, re-matches unchanged rows only against references
+whose content changed, and lists what changed since the previous run.
+Stored runs are evicted least recently used first once they take more than
+max_bytes. Needs pyarrow; without it every run is a full run.
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from reco_utils.cache import _has_pyarrow
+
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".oi360_state")
+DEFAULT_STATE_BYTES = 1024 ** 3  # 1 GB
+STATE_VERSION = 2  # Bump when the stored columns change, so old states are ignored
+CHANGES_SHEET = "What Changed"
+
+# Hidden result columns kept in the stored state (never exported)
+ROW_ID_COLUMN = "__row_id"
+ROW_HASH_COLUMN = "__row_hash"
+MATCH_PREFIX = "__matched_"  # + ref number: how the row matched that reference (engine MATCH_* code)
+MISMATCH_COLUMN = "__mismatches"  # Amount mismatches on the row
+
+
+def soa_identity(soa_path, soa_match):
+    """Returns the key a statement's run state is stored under."""
+    text = f"{os.path.abspath(soa_path)}|{soa_match}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def settings_fingerprint(settings):
+    """Hashes the run settings (a JSON-able dict); any change means a full run."""
+    text = json.dumps({"version": STATE_VERSION, **settings}, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def frame_fingerprint(df):
+    """Hashes the column names and every cell of df (row order included)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\x1f".join(str(col) for col in df.columns).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def row_ids(keys):
+    """
+    Returns a stable id per SOA row: its normalized key plus the occurrence of
+    that key so far, e.g. 'INV1#0', 'INV1#1' (rows without a key count as '').
+    """
+    keys = pd.Series(keys).astype("string").fillna("").reset_index(drop=True)
+    occurrence = keys.groupby(keys, sort=False).cumcount().astype(str)
+    return (keys + "#" + occurrence).astype(object)
+
+
+def row_hashes(df):
+    """Returns a uint64 hash of every row's cells."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def state_columns(columns):
+    """Returns the hidden run-state columns among columns."""
+    return [col for col in columns if str(col).startswith("__")]
+
+
+def describe_changes(previous, result, soa_columns, positions=None):
+    """
+    Lists rows added, changed or removed since the previous run, and unchanged
+    rows whose match result changed (a reference changed). Both frames carry the
+    hidden run-state columns; positions (each result row's row in previous, -1
+    when new) is worked out from the row ids when not given.
+    Returns a frame for the "What Changed" sheet.
+    """
+    outcome = [col for col in ("Match Source", "Amount Difference") if col in result.columns]
+    soa_columns = [col for col in soa_columns if col in result.columns]
+    if positions is None:
+        # Plain object ids: positional lookups on them are far faster than on Arrow strings
+        prev_ids = pd.Index(previous[ROW_ID_COLUMN].to_numpy(dtype=object))
+        positions = prev_ids.get_indexer(result[ROW_ID_COLUMN].to_numpy(dtype=object))
+    found = positions >= 0
+
+    change = np.where(found, "", "Added").astype(object)
+    before = positions[found]
+    changed = result[ROW_HASH_COLUMN].to_numpy()[found] != previous[ROW_HASH_COLUMN].to_numpy()[before]
+    outcome_changed = np.zeros(len(before), dtype=bool)
+    for col in outcome:
+        if col in previous.columns:
+            now = result[col].to_numpy(dtype=object)[found]
+            then = previous[col].to_numpy(dtype=object)[before]
+            outcome_changed |= pd.isna(now) != pd.isna(then)
+            outcome_changed |= pd.notna(now) & pd.notna(then) & (now != then)
+    change[found] = np.where(changed, "Changed", np.where(outcome_changed, "Match changed", ""))
+
+    shown = np.flatnonzero(change != "")
+    rows = pd.DataFrame({"Change": change[shown]})
+    for col in soa_columns:
+        rows[col] = result[col].to_numpy()[shown]
+    shown_before = positions[shown]
+    for col in outcome:
+        values = np.full(len(shown), None, dtype=object)
+        if col in previous.columns:
+            known = shown_before >= 0
+            values[known] = previous[col].to_numpy(dtype=object)[shown_before[known]]
+        rows[f"Previous {col}"] = values
+        rows[col] = result[col].to_numpy()[shown]
+
+    removed = np.ones(len(previous), dtype=bool)
+    removed[before] = False
+    removed = np.flatnonzero(removed)
+    gone = pd.DataFrame({"Change": ["Removed"] * len(removed)})
+    for col in soa_columns:
+        gone[col] = previous[col].to_numpy()[removed] if col in previous.columns else None
+    for col in outcome:
+        gone[f"Previous {col}"] = previous[col].to_numpy()[removed] if col in previous.columns else None
+        gone[col] = None
+    return pd.concat([rows, gone], ignore_index=True)
+
+
+class RunStateStore:
+    """
+    One stored run per statement: <identity>.json (settings and reference
+    fingerprints) next to <identity>.arrow (the full result with its hidden columns).
+    The .json file's mtime marks when the run was last saved or loaded; the
+    least recently used runs are deleted once all of them exceed max_bytes.
+    """
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR, max_bytes=DEFAULT_STATE_BYTES):
+        self.state_dir = state_dir
+        self.max_bytes = max_bytes
+        self.enabled = _has_pyarrow()
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def _paths(self, identity):
+        base = os.path.join(self.state_dir, identity)
+        return f"{base}.json", f"{base}.arrow"
+
+    def load(self, identity):
+        """Returns (meta, result frame) of the previous run, or None."""
+        if not self.enabled:
+            return None
+        meta_path, data_path = self._paths(identity)
+        with self._lock:
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("version") != STATE_VERSION:
+                    return None
+                result = pd.read_feather(data_path)
+            except Exception:
+                return None  # Missing or damaged state only costs a full run
+            try:
+                os.utime(meta_path)  # Recently used, evicted last
+            except OSError:
+                pass
+            return meta, result
+
+    def save(self, identity, settings, references, result):
+        """Stores this run; references maps ref number -> content fingerprint."""
+        if not self.enabled:
+            return
+        meta_path, data_path = self._paths(identity)
+        meta = {
+            "version": STATE_VERSION,
+            "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+            "settings": settings,
+            "references": {str(number): fp for number, fp in references.items()},
+            "rows": len(result),
+        }
+        with self._lock:
+            # Data first, then the manifest, each replaced atomically
+            tmp_path = f"{data_path}.{os.getpid()}.tmp"
+            _for_feather(result).to_feather(tmp_path)
+            os.replace(tmp_path, data_path)
+            tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+            self._evict(keep=identity)
+
+    def _evict(self, keep):
+        """Deletes least recently used runs (never keep) until all of them fit in max_bytes."""
+        if not self.max_bytes:
+            return
+        runs = []
+        for name in os.listdir(self.state_dir):
+            identity, ext = os.path.splitext(name)
+            if ext != ".json":
+                continue
+            paths = self._paths(identity)
+            try:
+                used = os.path.getmtime(paths[0])
+                size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            except OSError:
+                continue  # Deleted by another process meanwhile
+            runs.append((used, identity, size))
+        total = sum(size for _, _, size in runs)
+        for _, identity, size in sorted(runs):
+            if total <= self.max_bytes:
+                break
+            if identity == keep:
+                continue
+            for path in self._paths(identity):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+
+def _for_feather(df):
+    """Text and mixed columns as strings, so Arrow can store any result frame."""
+    df = df.reset_index(drop=True).copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("string")
+    return df
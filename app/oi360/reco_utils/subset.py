@@ -0,0 +1,162 @@
+# File: reco_utils/subset.py
+"""
+Many-to-one amount matching for Oi360 SOA RECO.
+Finds split payments (one SOA line paid by several reference rows) and
+combined payments (several SOA lines settled by one reference row) among
+rows that found no key match. Rows are grouped by customer or key prefix,
+and each group is searched meet-in-the-middle with a cap on the number of
+rows per combination. Every search (one row's combination) has its own time
+budget, so a large group or an ungrouped file never starves later rows; the
+searches that ran out of time are reported by group.
+"""
+import functools
+import itertools
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_COMBINATION = 3  # Most rows in one split/combined payment
+DEFAULT_SEARCH_SECONDS = 0.05  # Search time allowed per row looked for
+WHOLE_FILE_GROUP = "*"  # Group of every row when there is no group column or key prefix
+MAX_HALF_COMBINATIONS = 200000  # Partial sums enumerated per half of a group
+
+
+def to_cents(amounts):
+    """Returns amounts as int64 cents and a mask of usable (non-missing, non-zero) values."""
+    amounts = np.asarray(amounts, dtype=float)
+    usable = ~np.isnan(amounts)
+    cents = np.zeros(len(amounts), dtype=np.int64)
+    cents[usable] = np.round(amounts[usable] * 100).astype(np.int64)
+    return cents, usable & (cents != 0)
+
+
+@functools.lru_cache(maxsize=256)
+def _combinations(count, size, max_size):
+    """Index rows of every size-item combination of count items, padded with -1 to max_size."""
+    picks = np.array(list(itertools.combinations(range(count), size)), dtype=np.int64).reshape(-1, size)
+    padded = np.hstack([picks, np.full((len(picks), max_size - size), -1)])
+    padded.setflags(write=False)  # Shared between calls
+    return padded
+
+
+def _half_sums(cents, max_size, deadline):
+    """
+    Sums of every combination of up to max_size items (the empty one included).
+    Returns (sizes, sums, combos) with combos padded by -1, smallest combinations first.
+    """
+    sizes, sums, combos = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)], [np.full((1, max_size), -1)]
+    count = 1
+    for size in range(1, min(max_size, len(cents)) + 1):
+        count += math.comb(len(cents), size)
+        if count > MAX_HALF_COMBINATIONS or time.monotonic() > deadline:
+            break
+        picks = _combinations(len(cents), size, max_size)
+        sizes.append(np.full(len(picks), size, dtype=np.int64))
+        sums.append(cents[picks[:, :size]].sum(axis=1))
+        combos.append(picks)
+    return np.concatenate(sizes), np.concatenate(sums), np.vstack(combos)
+
+
+def find_combination(cents, target, tolerance, max_size=DEFAULT_MAX_COMBINATION, deadline=None):
+    """
+    Returns the positions of the fewest (2..max_size) items whose sum is within
+    tolerance of target (all in cents), or None. Stops early once the deadline passes.
+    """
+    deadline = deadline if deadline is not None else time.monotonic() + DEFAULT_SEARCH_SECONDS
+    candidates = np.arange(len(cents))
+    if (cents > 0).all() and target > 0:
+        candidates = candidates[cents <= target + tolerance]  # Larger items can never fit
+    elif (cents < 0).all() and target < 0:
+        candidates = candidates[cents >= target - tolerance]
+    if len(candidates) < 2:
+        return None
+
+    # Split in two halves; a combination is a partial sum from each half
+    half = len(candidates) // 2
+    left, right = candidates[:half], candidates[half:]
+    left_sizes, left_sums, left_combos = _half_sums(cents[left], max_size, deadline)
+    right_sizes, right_sums, right_combos = _half_sums(cents[right], max_size, deadline)
+    order = np.argsort(right_sums, kind="stable")
+    right_sizes, right_sums, right_combos = right_sizes[order], right_sums[order], right_combos[order]
+
+    low = np.searchsorted(right_sums, target - left_sums - tolerance, side="left")
+    high = np.searchsorted(right_sums, target - left_sums + tolerance, side="right")
+    # Left sums come smallest combination first, so the scan can stop once no smaller fit is possible
+    best = None
+    for i in np.flatnonzero(high > low):
+        if time.monotonic() > deadline or (best is not None and left_sizes[i] >= best[0]):
+            break
+        total = left_sizes[i] + right_sizes[low[i]:high[i]]
+        fits = np.flatnonzero((total >= 2) & (total <= max_size))
+        if len(fits):
+            k = fits[np.argmin(total[fits])]
+            if best is None or total[k] < best[0]:
+                best = (total[k], i, low[i] + k)
+                if best[0] == 2:
+                    break
+    if best is None:
+        return None
+    _, i, j = best
+    picked = [left[p] for p in left_combos[i] if p >= 0] + [right[p] for p in right_combos[j] if p >= 0]
+    return sorted(int(p) for p in picked)
+
+
+class SubsetMatcher:
+    """
+    Settings and search for many-to-one amount matches.
+    Rows are grouped by the values of group_columns (an SOA column and a
+    reference return column, e.g. the customer), else by the first key_prefix
+    characters of the match key, else the whole reference is one group.
+    search_seconds is the time allowed to look for each row's combination.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_COMBINATION, key_prefix=0, group_columns=None,
+                 search_seconds=DEFAULT_SEARCH_SECONDS):
+        self.max_size = max_size
+        self.key_prefix = key_prefix
+        self.group_columns = group_columns
+        self.search_seconds = search_seconds
+
+    def group_labels(self, keys, group_values=None):
+        """Returns the group of every row (missing when the row cannot be grouped)."""
+        keys = pd.Series(keys).astype("string")
+        if group_values is not None:
+            return pd.Series(group_values).astype("string").str.strip().replace("", pd.NA)
+        if self.key_prefix:
+            return keys.str[:self.key_prefix]
+        return pd.Series(WHOLE_FILE_GROUP, index=keys.index, dtype="string")
+
+    def match(self, target_groups, target_cents, item_groups, item_cents, tolerance_cents):
+        """
+        Pairs each target with a combination of items from the same group.
+        target_cents/item_cents are (cents, usable) pairs from to_cents().
+        Returns ({target position: [item positions]}, {group: searches that ran out
+        of time}); each item is used at most once.
+        """
+        cents, usable = target_cents
+        item_values, item_usable = item_cents
+        targets = pd.DataFrame({"group": pd.Series(target_groups).to_numpy(), "row": np.arange(len(cents))})
+        targets = targets[usable & targets["group"].notna().to_numpy()]
+        items = pd.DataFrame({"group": pd.Series(item_groups).to_numpy(), "row": np.arange(len(item_values))})
+        items = items[item_usable & items["group"].notna().to_numpy()]
+        item_rows = {group: rows.to_numpy() for group, rows in items.groupby("group", sort=False)["row"]}
+
+        matches, timed_out = {}, {}
+        for group, rows in targets.groupby("group", sort=False)["row"]:
+            available = item_rows.get(group)
+            if available is None or len(available) < 2:
+                continue
+            for row in rows.to_numpy():
+                deadline = time.monotonic() + self.search_seconds
+                picked = find_combination(item_values[available], cents[row], tolerance_cents,
+                                          self.max_size, deadline)
+                if picked is not None:
+                    matches[int(row)] = [int(available[p]) for p in picked]
+                    available = np.delete(available, picked)
+                    if len(available) < 2:
+                        break
+                elif time.monotonic() > deadline:
+                    timed_out[group] = timed_out.get(group, 0) + 1
+        return matches, timed_out
@@ -0,0 +1,117 @@
+# File: reco_utils/summary.py
+"""
+Summary sheets for Oi360 SOA RECO.
+Result rows are aggregated as each chunk is finished (so streaming runs are
+covered too): rows and SOA amount by Age Bucket x Match Source, and amount
+mismatches per reference amount column. The tables go into the output as
+extra sheets in the same export pass, ready to read without a pivot refresh.
+"""
+import numpy as np
+import pandas as pd
+
+from reco_utils.amounts import DEFAULT_AMOUNT_TOLERANCE, amount_differences, find_ref_amount_columns
+from reco_utils.dates import bucket_order
+
+AGING_SHEET = "Aging Summary"
+MISMATCH_SHEET = "Mismatches by Ref"
+UNMATCHED_LABEL = "Unmatched"
+TOTAL_LABEL = "Total"
+NO_BUCKET = "All ages"  # Age Bucket of every row when no SOA date column was chosen
+MAX_PARTS = 64  # Per-chunk groups kept before they are folded together
+
+
+class RunSummary:
+    """
+    Running totals over the result chunks of one run.
+    add() takes each finished chunk; aging_table() / mismatch_table() build the sheets.
+    """
+
+    def __init__(self, soa_amount_col=None, tolerance=DEFAULT_AMOUNT_TOLERANCE):
+        self.soa_amount_col = soa_amount_col
+        self.tolerance = tolerance
+        self.rows = 0
+        self._parts = []  # Small frames: (bucket, source) -> rows, amount
+        self._mismatches = {}  # ref amount column -> [compared, mismatched, abs difference, net difference]
+        self._has_amounts = False
+
+    def add(self, df, differences=None):
+        """
+        Adds result rows. differences is amount_differences() of the rows when the
+        caller already has it (saves parsing the amounts again).
+        """
+        if not len(df):
+            return
+        has_amounts = bool(self.soa_amount_col) and self.soa_amount_col in df.columns
+        if has_amounts and differences is None:
+            differences = amount_differences(df, self.soa_amount_col, find_ref_amount_columns(df.columns))
+        self._has_amounts |= has_amounts
+        buckets = df["Age Bucket"].astype(object) if "Age Bucket" in df.columns else NO_BUCKET
+        sources = df["Match Source"].astype(object).fillna("") if "Match Source" in df.columns else ""
+        groups = pd.DataFrame({
+            "bucket": buckets,
+            "source": sources,
+            "amount": differences[0] if has_amounts else 0.0,
+        }, index=df.index)
+        grouped = groups.groupby(["bucket", "source"], sort=False).agg(rows=("amount", "size"), amount=("amount", "sum"))
+        self._parts.append(grouped)
+        if len(self._parts) > MAX_PARTS:
+            self._parts = [self._combined()]
+        self.rows += len(df)
+
+        for ref_col, diff in (differences[1].items() if has_amounts else ()):
+            comparable = ~np.isnan(diff)
+            mismatch = comparable & (np.abs(diff) > self.tolerance)
+            totals = self._mismatches.setdefault(ref_col, [0, 0, 0.0, 0.0])
+            totals[0] += int(comparable.sum())
+            totals[1] += int(mismatch.sum())
+            totals[2] += float(np.abs(diff[mismatch]).sum())
+            totals[3] += float(diff[mismatch].sum())
+
+    def _combined(self):
+        return pd.concat(self._parts).groupby(level=[0, 1], sort=False).sum()
+
+    def aging_table(self):
+        """
+        Rows (and SOA amount) per Age Bucket, one column pair per Match Source
+        (most rows first, Unmatched last), with totals.
+        """
+        if not self._parts:
+            return pd.DataFrame(columns=["Age Bucket"])
+        combined = self._combined()
+        rows = combined["rows"].unstack(fill_value=0)
+        amounts = combined["amount"].unstack(fill_value=0.0)
+        buckets = sorted(rows.index, key=bucket_order)
+        sources = sorted(rows.columns, key=lambda source: (source == "", -rows[source].sum(), source))
+        table = pd.DataFrame({"Age Bucket": buckets + [TOTAL_LABEL]})
+        for source in sources + [None]:
+            label = TOTAL_LABEL if source is None else (source or UNMATCHED_LABEL)
+            counts = rows.sum(axis=1) if source is None else rows[source]
+            table[f"{label} - Rows"] = np.append(counts.reindex(buckets).to_numpy(), counts.sum()).astype(np.int64)
+            if self._has_amounts:
+                sums = amounts.sum(axis=1) if source is None else amounts[source]
+                table[f"{label} - Amount"] = np.round(np.append(sums.reindex(buckets).to_numpy(), sums.sum()), 2)
+        return table
+
+    def mismatch_table(self):
+        """One row per reference amount column: rows compared, mismatched and the differences."""
+        records = []
+        for ref_col, (compared, mismatched, absolute, net) in self._mismatches.items():
+            reference, _, column = ref_col.partition("_")
+            records.append({
+                "Reference": reference,
+                "Column": column,
+                "Rows Compared": compared,
+                "Mismatched Rows": mismatched,
+                "Mismatch %": round(100.0 * mismatched / compared, 2) if compared else 0.0,
+                "Total Difference": round(absolute, 2),  # Sum of the absolute SOA - reference differences
+                "Net Difference": round(net, 2),
+            })
+        return pd.DataFrame(records, columns=["Reference", "Column", "Rows Compared", "Mismatched Rows",
+                                              "Mismatch %", "Total Difference", "Net Difference"])
+
+    def sheets(self):
+        """Returns [(sheet name, table)] to add to the output."""
+        sheets = [(AGING_SHEET, self.aging_table())]
+        if self._mismatches:
+            sheets.append((MISMATCH_SHEET, self.mismatch_table()))
+        return sheets
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from reco_utils import cache as cache_module
+from reco_utils.cache import FrameCache
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Records every file the cache hashes."""
+    calls = []
+    real_hash = cache_module.file_content_hash
+
+    def counting_hash(file_path, *args, **kwargs):
+        calls.append(file_path)
+        return real_hash(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(cache_module, "file_content_hash", counting_hash)
+    return calls
+
+
+def write_csv(path, rows):
+    pd.DataFrame({"Invoice": rows, "Amount": ["1"] * len(rows)}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_probed_hash_survives_put_of_another_file(tmp_path, hashed):
+    a = write_csv(tmp_path / "a.csv", ["INV1", "INV2"])
+    b = write_csv(tmp_path / "b.csv", ["INV3"])
+    cache = FrameCache(str(tmp_path / "cache"))
+    cache.content_hash(a)
+    cache.content_hash(b)
+    cache.put(a, ["Invoice"], pd.DataFrame({"Invoice": ["INV1", "INV2"]}))
+    assert not cache.has(b, ["Invoice"])
+    assert hashed == [a, b]
+
+
+def test_get_returns_put_frame_from_a_new_instance(tmp_path, hashed):
+    a = write_csv(tmp_path / "a.csv", ["INV1", "INV2"])
+    FrameCache(str(tmp_path / "cache")).put(a, ["Invoice"], pd.DataFrame({"Invoice": ["INV1", "INV2"]}))
+    df = FrameCache(str(tmp_path / "cache")).get(a, ["Invoice"])
+    assert df["Invoice"].tolist() == ["INV1", "INV2"]
+    assert hashed == [a]  # The second instance knows the file from the manifest
+
+
+def test_changed_file_is_rehashed_and_its_old_hash_pruned(tmp_path, hashed):
+    a = write_csv(tmp_path / "a.csv", ["INV1"])
+    cache = FrameCache(str(tmp_path / "cache"))
+    cache.put(a, ["Invoice"], pd.DataFrame({"Invoice": ["INV1"]}))
+    write_csv(tmp_path / "a.csv", ["INV1", "INV9"])
+    assert cache.get(a, ["Invoice"]) is None
+    cache.put(a, ["Invoice"], pd.DataFrame({"Invoice": ["INV1", "INV9"]}))
+    assert hashed == [a, a]
+    assert len(cache._read_manifest()["files"]) == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    a = write_csv(tmp_path / "a.csv", ["INV1"])
+    b = write_csv(tmp_path / "b.csv", ["INV2"])
+    cache = FrameCache(str(tmp_path / "cache"))
+    cache.put(a, ["Invoice"], pd.DataFrame({"Invoice": ["INV1"] * 100}))
+    cache.max_bytes = cache._manifest["entries"][next(iter(cache._manifest["entries"]))]["bytes"]
+    cache.put(b, ["Invoice"], pd.DataFrame({"Invoice": ["INV2"] * 100}))
+    assert not cache.has(a, ["Invoice"])
+    assert cache.get(b, ["Invoice"]) is not None
+    assert not FrameCache(str(tmp_path / "cache")).has(a, ["Invoice"])
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from reco_utils.export import ResultWriter
+
+
+def chunk(keys):
+    return pd.DataFrame({"Invoice": keys, "Amount": ["1.00"] * len(keys)})
+
+
+@pytest.mark.parametrize("ext", ["xlsx", "csv"])
+def test_discard_leaves_an_existing_file_untouched(tmp_path, ext):
+    path = tmp_path / f"result.{ext}"
+    path.write_bytes(b"previous result")
+    ResultWriter(str(path)).discard()
+    assert path.read_bytes() == b"previous result"
+
+
+def test_discard_creates_no_file(tmp_path):
+    path = tmp_path / "result.xlsx"
+    ResultWriter(str(path)).discard()
+    assert not path.exists()
+
+
+def test_discard_after_rows_were_written_is_refused(tmp_path):
+    writer = ResultWriter(str(tmp_path / "result.csv"))
+    writer.write(chunk(["INV1"]))
+    with pytest.raises(ValueError):
+        writer.discard()
+    writer.close()
+
+
+def test_chunks_are_appended_under_one_header(tmp_path):
+    path = tmp_path / "result.csv"
+    writer = ResultWriter(str(path))
+    writer.write(chunk(["INV1", "INV2"]))
+    writer.write(chunk(["INV3"]))
+    writer.close()
+    assert pd.read_csv(path, dtype=str)["Invoice"].tolist() == ["INV1", "INV2", "INV3"]
+    assert writer.rows == 3
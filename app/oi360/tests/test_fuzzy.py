@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from reco_utils.fuzzy import FuzzyIndex
+
+REFERENCE = ["INV1002", "INV2040", "INV30500", "ABC"]
+
+
+@pytest.mark.parametrize("key, position, score", [
+    ("INV1O02", 0, 85.7),  # One substituted character is one edit
+    ("INV102", 0, 85.7),  # Missing character
+    ("INV10002", 0, 87.5),  # Extra character
+    ("INV1020", 0, 85.7),  # Swapped neighbours
+    ("INV3050", 2, 87.5),
+])
+def test_one_edit_scores_against_the_longer_key(key, position, score):
+    positions, scores = FuzzyIndex(REFERENCE).match([key], min_score=80)
+    assert positions.tolist() == [position]
+    assert scores[0] == pytest.approx(score)
+
+
+def test_nothing_close_enough_is_no_match():
+    positions, scores = FuzzyIndex(REFERENCE).match(["XYZ9999", "INV9999", None], min_score=80)
+    assert positions.tolist() == [-1, -1, -1]
+    assert np.isnan(scores).all()
+
+
+def test_min_score_is_respected():
+    positions, _ = FuzzyIndex(REFERENCE).match(["INV1O02"], min_score=90)
+    assert positions.tolist() == [-1]
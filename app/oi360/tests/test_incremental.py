@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from reco_utils.engine import RecoEngine
+from reco_utils.runstate import RunStateStore
+from reco_utils.subset import SubsetMatcher
+
+pytest.importorskip("pyarrow")
+
+AS_OF = "2026-06-30"
+
+
+def statement(rows=20):
+    return pd.DataFrame({
+        "Invoice": [f"INV{i:03d}" for i in range(rows)],
+        "Date": [f"2026-0{1 + i % 6}-15" for i in range(rows)],
+        "Amount": [f"{100 + i}.00" for i in range(rows)],
+    })
+
+
+def reference(prefix, rows=20, skip=3):
+    keys = [f"INV{i:03d}" for i in range(rows) if i % skip]
+    return pd.DataFrame({
+        "Invoice": keys,
+        f"{prefix}Amount": [f"{100 + int(key[3:])}.00" for key in keys],
+        f"{prefix}Status": ["Open"] * len(keys),
+    })
+
+
+def engine(ref1, ref2, subset_matcher=None):
+    return RecoEngine("Invoice", "Date", "Amount", [
+        (ref1, "Invoice", ["Ref1Amount", "Ref1Status"], "Ref1"),
+        (ref2, "Invoice", ["Ref2Amount", "Ref2Status"], "Ref2"),
+    ], as_of_date=AS_OF, subset_matcher=subset_matcher)
+
+
+def full_run(soa, ref1, ref2):
+    return engine(ref1, ref2).run([soa])
+
+
+def assert_same_result(incremental, full):
+    assert list(incremental.columns) == list(full.columns)
+    pd.testing.assert_frame_equal(incremental.astype(object).fillna(""), full.astype(object).fillna(""),
+                                  check_dtype=False)
+
+
+def test_rerun_matches_a_full_run_after_rows_and_a_reference_change(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    soa, ref1, ref2 = statement(), reference("Ref1"), reference("Ref2", skip=4)
+    first, changes = engine(ref1, ref2).run_incremental(soa, store, "statement")
+    assert changes is None
+    assert_same_result(first, full_run(soa, ref1, ref2))
+
+    soa.loc[5, "Amount"] = "999.00"  # Changed row
+    soa = pd.concat([soa, pd.DataFrame({"Invoice": ["INV900"], "Date": ["2026-06-01"], "Amount": ["5.00"]})],
+                    ignore_index=True)  # Added row
+    ref2.loc[0, "Ref2Amount"] = "0.50"  # Changed reference: unchanged rows are re-matched against it
+    messages = []
+    rerun = engine(ref1, ref2)
+    rerun.status = messages.append
+    second, changes = rerun.run_incremental(soa, store, "statement")
+    assert any("19 unchanged row(s) reused, 2 to reconcile, 1 reference(s) changed" in m for m in messages)
+    assert_same_result(second, full_run(soa, ref1, ref2))
+    assert set(changes["Change"]) >= {"Added", "Changed"}
+
+
+def test_rerun_without_changes_reuses_every_row(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    soa, ref1, ref2 = statement(), reference("Ref1"), reference("Ref2", skip=4)
+    engine(ref1, ref2).run_incremental(soa, store, "statement")
+    messages = []
+    rerun = engine(ref1, ref2)
+    rerun.status = messages.append
+    result, changes = rerun.run_incremental(soa, store, "statement")
+    assert_same_result(result, full_run(soa, ref1, ref2))
+    assert len(changes) == 0
+    assert any(f"{len(soa)} unchanged row(s) reused, 0 to reconcile, 0 reference(s) changed" in m for m in messages)
+
+
+def test_plain_rerun_after_a_split_payment_run_matches_a_full_run(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    soa, ref1, ref2 = statement(), reference("Ref1"), reference("Ref2", skip=4)
+    # PAY1 is paid by two Ref1 rows that are not on the statement
+    soa = pd.concat([soa, pd.DataFrame({"Invoice": ["PAY1"], "Date": ["2026-06-01"], "Amount": ["7.00"]})],
+                    ignore_index=True)
+    ref1 = pd.concat([ref1, pd.DataFrame({"Invoice": ["X1", "X2"], "Ref1Amount": ["3.00", "4.00"],
+                                          "Ref1Status": ["Open", "Open"]})], ignore_index=True)
+    with_subset, _ = engine(ref1, ref2, SubsetMatcher()).run_incremental(soa, store, "statement")
+    assert "Ref1 (sum of 2 rows)" in set(with_subset["Match Source"])
+
+    messages = []
+    rerun = engine(ref1, ref2)
+    rerun.status = messages.append
+    plain, _ = rerun.run_incremental(soa, store, "statement")
+    assert any(m.startswith("Full run") for m in messages)
+    assert_same_result(plain, full_run(soa, ref1, ref2))
+    assert rerun.match_counts[2]["fuzzy"] == 0
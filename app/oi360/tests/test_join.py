@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from reco_utils.join import ReferenceIndex
+
+
+def reference():
+    keys = pd.Series(["INV1", "INV2", "INV1", None, "INV3", "INV1"])
+    frame = pd.DataFrame({
+        "Ref1_Amount": ["10", "20", "1,000", "99", "30", "5"],
+        "Ref1_Note": ["a", "b", "c", "d", "e", "a"],
+    })
+    return keys, frame
+
+
+def looked_up(index, keys):
+    return index.take(index.lookup(pd.Series(keys)))
+
+
+@pytest.mark.parametrize("policy, amount, note", [
+    ("first", "10", "a"),
+    ("last", "5", "a"),
+    ("concat", "10 | 1,000 | 5", "a | c"),
+])
+def test_repeated_key_is_collapsed_with_the_policy(policy, amount, note):
+    keys, frame = reference()
+    row = looked_up(ReferenceIndex(keys, frame, policy), ["INV1"]).iloc[0]
+    assert (row["Ref1_Amount"], row["Ref1_Note"]) == (amount, note)
+
+
+def test_sum_adds_numeric_columns_and_keeps_the_first_text():
+    keys, frame = reference()
+    row = looked_up(ReferenceIndex(keys, frame, "sum"), ["INV1"]).iloc[0]
+    assert row["Ref1_Amount"] == 1015
+    assert row["Ref1_Note"] == "a"
+
+
+def test_one_row_per_lookup_key_in_order_and_missing_keys_blank():
+    keys, frame = reference()
+    index = ReferenceIndex(keys, frame, "concat")
+    rows = looked_up(index, ["INV3", "NOPE", "INV2", "INV3"])
+    assert rows["Ref1_Amount"].fillna("").tolist() == ["30", "", "20", "30"]
+
+
+def test_duplicates_are_counted_and_blank_keys_dropped():
+    keys, frame = reference()
+    index = ReferenceIndex(keys, frame)
+    assert (index.duplicate_keys, index.duplicate_rows) == (1, 3)
+    assert len(index.frame) == 3
+    assert "1 key(s) repeat across 3 rows" in index.describe_duplicates("Ref1")
+
+
+def test_unknown_policy_is_rejected():
+    keys, frame = reference()
+    with pytest.raises(ValueError):
+        ReferenceIndex(keys, frame, "average")
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from reco_utils.resultfilters import AMOUNT_MISMATCH, UNMATCHED, ResultFilters
+
+
+def result_frame():
+    return pd.DataFrame({
+        "Invoice": ["INV1", "INV2", "INV3", "INV4"],
+        "Amount": ["100.00", "1,250.00", "75", "10"],
+        "Ref1_Amount": ["100.00", "1,200.00", None, "10.005"],
+        "Match Source": ["Ref1", "Ref1", "", "Ref1"],
+        "Amount Difference": ["Ref1: 0.00", "Ref1: +50.00", "", "Ref1: 0.00"],
+        "Age Bucket": ["0-30", "31-60", "0-30", "0-30"],
+    })
+
+
+def test_mismatch_comes_from_the_amounts_not_the_difference_text():
+    df = result_frame()
+    df["Amount Difference"] = "reworded"  # Display text plays no part
+    filters = ResultFilters(df, "Amount", 0.01)
+    assert filters.mismatch.tolist() == [False, True, False, False]
+    assert filters.rows(AMOUNT_MISMATCH).tolist() == [1]
+
+
+def test_mismatch_uses_the_run_tolerance():
+    filters = ResultFilters(result_frame(), "Amount", 100)
+    assert filters.counts()[AMOUNT_MISMATCH] == 0
+
+
+def test_no_mismatch_filter_without_the_amount_column():
+    filters = ResultFilters(result_frame())
+    assert filters.mismatch is None
+    assert AMOUNT_MISMATCH not in filters.counts()
+
+
+def test_filters_combine_kind_and_age_bucket():
+    filters = ResultFilters(result_frame(), "Amount")
+    assert filters.rows(UNMATCHED).tolist() == [2]
+    assert filters.rows("Matched in Ref1", "0-30").tolist() == [0, 3]
+    assert filters.counts()["31-60"] == 1
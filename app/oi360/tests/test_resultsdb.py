@@ -0,0 +1,70 @@
+import sqlite3
+import subprocess
+import sys
+
+import pandas as pd
+
+from reco_utils.resultsdb import ResultsStore
+
+
+def record(store, keys, status="complete"):
+    recorder = store.start_run(soa_path="soa.xlsx", soa_match="Invoice")
+    recorder.write(pd.DataFrame({"Invoice": keys, "Match Source": ["Ref1"] * len(keys)}), keys)
+    recorder.close(status)
+    return recorder.run_id
+
+
+def test_query_finds_rows_by_normalized_key(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    record(store, ["INV-001", "INV-002"])
+    found = store.query(key=" INV-001 ")
+    assert found["Invoice"].tolist() == ["INV-001"]
+
+
+def test_only_the_newest_runs_are_kept(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"), max_runs=2)
+    first = record(store, ["INV1"])
+    record(store, ["INV2"])
+    record(store, ["INV3"])
+    runs = store.runs()
+    assert len(runs) == 2 and first not in runs["run_id"].tolist()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_run_left_running_by_a_crash_is_failed_and_pruned(tmp_path):
+    path = str(tmp_path / "results.db")
+    store = ResultsStore(path, max_runs=1)
+    crashed = store.start_run(soa_path="soa.xlsx", soa_match="Invoice")
+    crashed._connection.close()  # As if the process died mid-run
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE runs SET pid = ?", (dead_pid(),))
+    record(store, ["INV1"])
+    runs = store.runs()
+    assert runs["status"].tolist() == ["complete"]
+    assert crashed.run_id not in runs["run_id"].tolist()
+
+
+def test_runs_still_recording_elsewhere_are_left_running(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    other = store.start_run(soa_path="soa.xlsx", soa_match="Invoice")  # This (live) process
+    record(store, ["INV1"])
+    assert store.runs().set_index("run_id").loc[other.run_id, "status"] == "running"
+    other.close()
+
+
+def test_two_runs_record_at_the_same_time(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    first = store.start_run(soa_path="a.xlsx", soa_match="Invoice")
+    second = store.start_run(soa_path="b.xlsx", soa_match="Invoice")
+    for recorder, keys in ((first, ["INV1"]), (second, ["INV2"]), (first, ["INV3"])):
+        recorder.write(pd.DataFrame({"Invoice": keys, "Match Source": ["Ref1"]}), keys)
+    second.close()
+    first.close()
+    runs = store.runs().set_index("run_id")
+    assert runs.loc[first.run_id, "rows"] == 2 and runs.loc[second.run_id, "rows"] == 1
+    assert sorted(store.query()["Invoice"]) == ["INV1", "INV2", "INV3"]
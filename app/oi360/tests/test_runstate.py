@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+import pytest
+
+from reco_utils.runstate import RunStateStore
+
+pytest.importorskip("pyarrow")
+
+
+def result_frame(rows):
+    return pd.DataFrame({"Invoice": [f"INV{i}" for i in range(rows)], "__row_id": [f"INV{i}#0" for i in range(rows)]})
+
+
+def stored_runs(state_dir):
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(state_dir) if name.endswith(".json"))
+
+
+def test_saved_run_loads_back(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    store.save("a", {"match": "Invoice"}, {1: "fp"}, result_frame(3))
+    meta, result = store.load("a")
+    assert meta["references"] == {"1": "fp"}
+    assert result["Invoice"].tolist() == ["INV0", "INV1", "INV2"]
+
+
+def test_least_recently_used_runs_are_evicted_over_max_bytes(tmp_path):
+    store = RunStateStore(str(tmp_path), max_bytes=0)
+    store.save("a", {}, {}, result_frame(50))
+    one_run = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    store.max_bytes = 2 * one_run
+    store.save("b", {}, {}, result_frame(50))
+    os.utime(tmp_path / "a.json", (0, 0))
+    os.utime(tmp_path / "b.json", (1, 1))
+    assert store.load("a") is not None  # Using "a" makes "b" the oldest
+    store.save("c", {}, {}, result_frame(50))
+    assert stored_runs(tmp_path) == ["a", "c"]
+    assert not os.path.exists(tmp_path / "b.arrow")
+
+
+def test_run_just_saved_is_kept_even_when_over_max_bytes(tmp_path):
+    store = RunStateStore(str(tmp_path), max_bytes=1)
+    store.save("a", {}, {}, result_frame(5))
+    store.save("b", {}, {}, result_frame(5))
+    assert stored_runs(tmp_path) == ["b"]
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from reco_utils.engine import RecoEngine
+from reco_utils.subset import SubsetMatcher, find_combination, to_cents
+
+
+def test_to_cents_rounds_and_marks_missing_and_zero_unusable():
+    cents, usable = to_cents([19.99, np.nan, 0.0, -4.1])
+    assert cents.tolist() == [1999, 0, 0, -410]
+    assert usable.tolist() == [True, False, False, True]
+
+
+def test_find_combination_prefers_the_fewest_items():
+    cents = np.array([300, 100, 700, 200, 500])
+    assert find_combination(cents, 1000, 0, max_size=3) == [0, 2]
+    assert find_combination(cents, 600, 0, max_size=3) == [1, 4]
+
+
+def test_find_combination_respects_tolerance_and_max_size():
+    cents = np.array([101, 202, 303, 404])
+    assert find_combination(cents, 300, 0) is None
+    assert find_combination(cents, 300, 3) == [0, 1]
+    assert find_combination(cents, 1010, 0, max_size=3) is None
+    assert find_combination(cents, 1010, 0, max_size=4) == [0, 1, 2, 3]
+
+
+def test_match_uses_each_item_once_within_its_group():
+    matcher = SubsetMatcher(max_size=2)
+    targets = to_cents([30.0, 30.0, 50.0])
+    items = to_cents([10.0, 20.0, 10.0, 20.0, 25.0, 25.0])
+    matches, timed_out = matcher.match(["A", "A", "B"], targets, ["A", "A", "A", "A", "B", "B"], items, 0)
+    assert sorted(matches) == [0, 1, 2]
+    used = [item for picked in matches.values() for item in picked]
+    assert len(used) == len(set(used))
+    assert sorted(matches[2]) == [4, 5]
+    assert timed_out == {}
+
+
+def test_searches_out_of_time_are_counted_by_group():
+    matcher = SubsetMatcher(max_size=2, search_seconds=-1)  # Every search is already out of time
+    matches, timed_out = matcher.match(["A", "A", "B"], to_cents([1.0, 2.0, 3.0]),
+                                       ["A", "A", "B", "B"], to_cents([5.0, 7.0, 11.0, 13.0]), 0)
+    assert matches == {}
+    assert timed_out == {"A": 2, "B": 1}
+
+
+def test_engine_reports_groups_whose_search_ran_out_of_time():
+    soa = pd.DataFrame({"Invoice": ["PAY1", "PAY2"], "Customer": ["C1", "C2"], "Amount": ["7.00", "9.00"]})
+    ref = pd.DataFrame({"Invoice": ["X1", "X2", "X3", "X4"], "Cust": ["C1", "C1", "C2", "C2"],
+                        "Amount": ["3.00", "4.00", "4.00", "5.00"]})
+    messages = []
+    engine = RecoEngine("Invoice", None, "Amount", [(ref, "Invoice", ["Cust", "Amount"], "Ref1")],
+                        status=messages.append,
+                        subset_matcher=SubsetMatcher(group_columns=("Customer", "Cust"), search_seconds=-1))
+    engine.run([soa])
+    assert engine.subset_timeouts == {1: {"C1": 1, "C2": 1}}
+    assert any("ran out of time for 2 row(s) in 2 group(s): C1, C2" in m for m in messages)
+
+
+def test_engine_groups_split_payments_by_customer_column():
+    soa = pd.DataFrame({"Invoice": ["PAY1", "PAY2"], "Customer": ["C1", "C2"], "Amount": ["7.00", "9.00"]})
+    ref = pd.DataFrame({"Invoice": ["X1", "X2", "X3", "X4"], "Cust": ["C1", "C1", "C2", "C2"],
+                        "Amount": ["3.00", "4.00", "5.00", "6.00"]})
+    engine = RecoEngine("Invoice", None, "Amount", [(ref, "Invoice", ["Cust", "Amount"], "Ref1")],
+                        subset_matcher=SubsetMatcher(group_columns=("Customer", "Cust")))
+    result = engine.run([soa])
+    # PAY2 (9.00) could only be paid by 4.00 of C1 plus 5.00 of C2
+    assert result["Match Source"].tolist() == ["Ref1 (sum of 2 rows)", ""]